@@ -1,637 +1,1175 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import customtkinter as ctk
-import sv_ttk
-import json
-import os
-import csv
-from datetime import datetime
-from collections import defaultdict
-
-
-class ExpenseTrackerApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Shared Expense Tracker")
-
-        # Data storage
-        self.friends = []
-        self.expenses = []
-        self.total_paid = {}
-        self.total_owed = {}
-        self.filtered_expenses = []
-        self.selected_expense = None
-        self.balances = defaultdict(float)  # To track individual balances
-
-        self.create_widgets()
-        self.load_friends()
-        self.load_expenses()
-        
-        self.update_participants_checkboxes()
-        self.refresh_totals_display()
-        sv_ttk.set_theme("dark")  # Apply dark theme
-
-    def create_widgets(self):
-        # Main container
-        main_frame = ttk.Frame(self.root)
-        main_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-
-        # Add Friend section
-        add_friend_frame = tk.LabelFrame(main_frame, text="Add Friend", font=(16), bd=2)
-        add_friend_frame.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
-
-        self.new_friend_var = tk.StringVar()
-        ctk.CTkEntry(add_friend_frame, textvariable=self.new_friend_var, border_color="#0390fc").pack(side=tk.LEFT, fill=tk.X, expand=True)
-        ctk.CTkButton(add_friend_frame, text="Add Friend", command=self.add_friend,font=("",14,'bold')).pack(side=tk.LEFT, padx=5)
-        ctk.CTkButton(add_friend_frame, text="Delete Selected", command=self.delete_selected_friends, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'),hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
-
-        # Expense Input section
-        expense_frame = tk.LabelFrame(main_frame, text="Add/Edit Expense", font=("",16), bd=2)
-        expense_frame.grid(row=1, column=0, sticky="ew", padx=5, pady=5)
-
-        ttk.Label(expense_frame, text="Date (YYYY-MM-DD):", font=('Century Gothic', 12)).grid(row=0, column=0, sticky="w")
-        self.date_var = tk.StringVar(value=datetime.today().strftime('%Y-%m-%d'))
-        ctk.CTkEntry(expense_frame, textvariable=self.date_var, border_color="#0390fc").grid(row=0, column=1, sticky="ew")
-
-        ttk.Label(expense_frame, text="Description:", font=('Century Gothic', 12)).grid(row=1, column=0, sticky="w")
-        self.desc_var = tk.StringVar()
-        ctk.CTkEntry(expense_frame, textvariable=self.desc_var).grid(row=1, column=1, sticky="ew")
-
-        ttk.Label(expense_frame, text="Amount:", font=('Century Gothic', 12)).grid(row=2, column=0, sticky="w")
-        self.amount_var = tk.StringVar()
-        self.am = ctk.CTkEntry(expense_frame, textvariable=self.amount_var, bg_color="#1c1c1c", border_color="#0390fc")
-        self.am.grid(row=2, column=1, sticky="ew")
-
-        ttk.Label(expense_frame, text="Payer:", font=('Century Gothic', 12)).grid(row=3, column=0, sticky="w")
-        self.payer_var = ctk.StringVar()
-        self.payer_combobox = ctk.CTkComboBox(expense_frame, values=self.friends, variable=self.payer_var, state="readonly")
-        self.payer_combobox.grid(row=3, column=1, sticky="ew")
-
-        ttk.Label(expense_frame, text="Participants:", font=('Century Gothic', 12)).grid(row=4, column=0, sticky="nw")
-        self.participants_frame = ttk.Frame(expense_frame)
-        self.participants_frame.grid(row=4, column=1, sticky="ew")
-
-        self.edit_btn = ctk.CTkButton(expense_frame, text="Add Expense", command=self.add_update_expense,font=("",14,'bold'))
-        self.edit_btn.grid(row=5, column=1, sticky="e", pady=5)
-
-        # Filter section
-        filter_frame = ttk.Frame(main_frame)
-        filter_frame.grid(row=2, column=0, sticky="ew", padx=5, pady=(0,5))
-
-        ttk.Label(filter_frame, text="Filter by:").pack(side=tk.LEFT)
-        self.filter_var = tk.StringVar()
-        self.filter_criteria = ttk.Combobox(filter_frame, textvariable=self.filter_var, 
-                                         values=["All", "Date", "Description", "Payer", "Participant"], 
-                                         state="readonly", width=12)
-        self.filter_criteria.pack(side=tk.LEFT, padx=5)
-        self.filter_criteria.set("All")
-
-        self.filter_value_var = tk.StringVar()
-        self.filter_value = ctk.CTkEntry(filter_frame, textvariable=self.filter_value_var, width=150)
-        self.filter_value.pack(side=tk.LEFT, padx=5)
-
-        ctk.CTkButton(filter_frame, text="Apply Filter", command=self.apply_filter,font=("",14,'bold')).pack(side=tk.LEFT, padx=5)
-        ctk.CTkButton(filter_frame, text="Clear Filters", command=self.clear_filters, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'), hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
-
-        # Expense List with Scrollbar
-        list_frame = tk.LabelFrame(main_frame, text="Expenses", font=(16), bd=2)
-        list_frame.grid(row=3, column=0, sticky="nsew", padx=5, pady=5)
-
-        tree_frame = ttk.Frame(list_frame)
-        tree_frame.pack(fill=tk.BOTH, expand=True)
-
-        columns = ('date', 'description', 'amount', 'payer', 'participants')
-        self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings', selectmode='browse')
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
- 
-        self.tree.heading('date', text='Date')
-        self.tree.heading('description', text='Description')
-        self.tree.heading('amount', text='Amount')
-        self.tree.heading('payer', text='Payer')
-        self.tree.heading('participants', text='Participants')
-
-        self.tree.column('date', width=100, anchor="center")
-        self.tree.column('description', width=150, anchor="center")
-        self.tree.column('amount', width=80, anchor="center")
-        self.tree.column('payer', width=100, anchor="center")
-        self.tree.column('participants', width=200, anchor="center")
-
-        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        vsb.pack(side=tk.RIGHT, fill=tk.Y)
-
-        self.tree.bind('<<TreeviewSelect>>', self.on_expense_select)
-
-        # Controls
-        control_frame = ttk.Frame(main_frame)
-        control_frame.grid(row=4, column=0, sticky="ew", padx=5, pady=5)
-
-        
-        ctk.CTkButton(control_frame, text="Clear Expenses", command=self.clear_selected_expenses, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'), hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
-        ctk.CTkButton(control_frame, text="Clear All", command=self.clear_all_expenses, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'), hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
-        ctk.CTkButton(control_frame, text="Save as CSV", command=self.save_as_csv,font=("",14,'bold')).pack(side=tk.RIGHT, padx=5)
-
-        # Totals Display with Scrollbar
-        totals_frame = tk.LabelFrame(main_frame, text="Totals", font=(16), bd=2)
-        totals_frame.grid(row=0, column=1, rowspan=2, sticky="nsew", padx=5, pady=5)
-
-        totals_tree_frame = ttk.Frame(totals_frame)
-        totals_tree_frame.pack(fill=tk.BOTH, expand=True)
-
-        self.totals_tree = ttk.Treeview(
-            totals_tree_frame, columns=('friend', 'paid', 'owed', 'balance'), show='headings'
-        )
-        vsb_totals = ttk.Scrollbar(totals_tree_frame, orient="vertical", command=self.totals_tree.yview)
-        self.totals_tree.configure(yscrollcommand=vsb_totals.set)
-
-        self.totals_tree.heading('friend', text='Friend', anchor="center")
-        self.totals_tree.column('friend', anchor="center")
-        self.totals_tree.heading('paid', text='Total Paid', anchor="center")
-        self.totals_tree.column('paid', anchor="center")
-        self.totals_tree.heading('owed', text='Total Owed', anchor="center")
-        self.totals_tree.column('owed', anchor="center")
-        self.totals_tree.heading('balance', text='Balance', anchor="center")
-        self.totals_tree.column('balance', anchor="center")
-
-        self.totals_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        vsb_totals.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # Payment Instructions Display
-        payments_frame = tk.LabelFrame(main_frame, text="Payment Instructions", font=(16), bd=2)
-        payments_frame.grid(row=2, column=1, rowspan=3, sticky="nsew", padx=5, pady=5)
-
-        self.payments_text = tk.Text(payments_frame, wrap=tk.WORD, height=10)
-        payments_scroll = ttk.Scrollbar(payments_frame, command=self.payments_text.yview)
-        self.payments_text.configure(yscrollcommand=payments_scroll.set, font=("Century Gothic",14))
-
-        payments_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        self.payments_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        main_frame.columnconfigure(0, weight=3)
-        main_frame.columnconfigure(1, weight=1)
-        main_frame.rowconfigure(3, weight=1)
-
-        style = ttk.Style()
-        self.root.configure(bg=style.lookup("TLabelFrame", "background"))
-
-    def calculate_payments(self):
-        """Calculate who needs to pay whom and display the instructions"""
-        # Clear previous instructions
-        self.payments_text.delete(1.0, tk.END)
-        
-        # Calculate net balances for each friend
-        balances = defaultdict(float)
-        for friend in self.friends:
-            balances[friend] = self.total_paid.get(friend, 0) - self.total_owed.get(friend, 0)
-        
-        # Separate creditors and debtors
-        creditors = {k: v for k, v in balances.items() if v > 0}
-        debtors = {k: v for k, v in balances.items() if v < 0}
-        
-        # Sort by amount (highest first for creditors, lowest first for debtors)
-        creditors = dict(sorted(creditors.items(), key=lambda item: -item[1]))
-        debtors = dict(sorted(debtors.items(), key=lambda item: item[1]))
-        
-        # Generate payment instructions
-        for debtor, debt_amount in debtors.items():
-            debt_amount = abs(debt_amount)
-            remaining_debt = debt_amount
-            
-            for creditor, credit_amount in creditors.items():
-                if credit_amount == 0:
-                    continue
-                
-                if credit_amount >= remaining_debt:
-                    payment = remaining_debt
-                    creditors[creditor] -= payment
-                    self.payments_text.insert(tk.END, f"{debtor} should pay ₹{payment:.2f} to {creditor}\n")
-                    break
-                else:
-                    payment = credit_amount
-                    remaining_debt -= payment
-                    creditors[creditor] = 0
-                    self.payments_text.insert(tk.END, f"{debtor} should pay ₹{payment:.2f} to {creditor}\n")
-        
-        # If no payments needed
-        if not self.payments_text.get(1.0, tk.END).strip():
-            self.payments_text.insert(tk.END, "No payments needed - all balances are settled\n")
-
-    def add_friend(self):
-        try:
-            new_friend = self.new_friend_var.get().strip()
-            if new_friend and new_friend not in self.friends:
-                self.friends.append(new_friend)
-                self.total_paid[new_friend] = 0.0
-                self.total_owed[new_friend] = 0.0
-                self.new_friend_var.set('')
-                self.update_participants_checkboxes()
-                self.payer_combobox.configure(values=self.friends)
-                self.save_friends()
-                self.refresh_totals_display()
-                self.calculate_payments()
-            
-            if not new_friend:
-                messagebox.showerror("Error", "Please Enter Friend Name.")
-                return
-        except ValueError as ve:
-            messagebox.showerror("Error", f"Invalid input: {ve}")
-
-    def delete_selected_friends(self):
-        selected_friends = [friend for friend, var in self.participant_vars.items() if var.get()]
-        
-        if not selected_friends:
-            messagebox.showwarning("No Selection", "Please select friends to delete by checking their checkboxes")
-            return
-            
-        if messagebox.askyesno("Confirm", f"Delete selected friends?\nThis will also remove all related expenses."):
-            # Remove expenses involving these friends
-            self.expenses = [exp for exp in self.expenses 
-                           if exp['payer'] not in selected_friends 
-                           and not any(p in selected_friends for p in exp['participants'])]
-            
-            # Remove the friends
-            for friend in selected_friends:
-                if friend in self.friends:
-                    self.friends.remove(friend)
-                    if friend in self.total_paid:
-                        del self.total_paid[friend]
-                    if friend in self.total_owed:
-                        del self.total_owed[friend]
-            
-            # Reset totals
-            for friend in self.friends:
-                self.total_paid[friend] = 0.0
-                self.total_owed[friend] = 0.0
-            
-            # Recalculate totals from remaining expenses
-            for expense in self.expenses:
-                payer = expense['payer']
-                amount = float(expense['amount'])
-                participants = expense['participants']
-                
-                self.total_paid[payer] += amount
-                share = amount / len(participants)
-                for participant in participants:
-                    self.total_owed[participant] += share
-            
-            self.update_participants_checkboxes()
-            self.payer_combobox['values'] = self.friends
-            self.refresh_expense_list()
-            self.refresh_totals_display()
-            self.save_friends()
-            self.save_expenses()
-            self.calculate_payments()
-
-    def add_update_expense(self):
-        if self.selected_expense is not None:
-            self.update_expense()
-        else:
-            self.add_expense()
-
-    def add_expense(self):
-        try:
-            date_str = self.date_var.get()
-            date = datetime.strptime(date_str, "%Y-%m-%d")
-            description = self.desc_var.get().strip()
-            amount = float(self.amount_var.get())
-            payer = self.payer_var.get()
-            participants = [friend for friend, var in self.participant_vars.items() if var.get()]
-            
-            if not description:
-                raise ValueError("Description is required")
-            if amount <= 0:
-                raise ValueError("Amount must be positive")
-            if not payer:
-                raise ValueError("Please select a payer")
-            if not participants:
-                raise ValueError("Please select at least one participant")
-            
-            # Add expense
-            expense = {
-                'date': date_str,
-                'description': description,
-                'amount': amount,
-                'payer': payer,
-                'participants': participants
-            }
-            self.expenses.append(expense)
-            self.filtered_expenses = self.expenses.copy()
-            
-            # Update totals
-            num_participants = len(participants)
-            share = amount / num_participants
-            self.total_paid[payer] += amount
-            for participant in participants:
-                self.total_owed[participant] += share
-            
-            # Clear inputs
-            self.desc_var.set('')
-            self.amount_var.set('')
-            self.payer_var.set('')
-            for var in self.participant_vars.values():
-                var.set(False)
-
-            self.refresh_expense_list()
-            self.refresh_totals_display()
-            self.save_expenses()
-            self.calculate_payments()
-            
-        except ValueError as e:
-            messagebox.showerror("Input Error", str(e))
-
-    def update_expense(self):
-        try:
-            # Remove old expense impact
-            old_expense = self.expenses[self.selected_expense]
-            old_amount = old_expense['amount']
-            old_payer = old_expense['payer']
-            old_participants = old_expense['participants']
-            old_share = old_amount / len(old_participants)
-            
-            self.total_paid[old_payer] -= old_amount
-            for participant in old_participants:
-                self.total_owed[participant] -= old_share
-
-            # Add new expense values
-            date_str = self.date_var.get()
-            date = datetime.strptime(date_str, "%Y-%m-%d")
-            description = self.desc_var.get().strip()
-            amount = float(self.amount_var.get())
-            payer = self.payer_var.get()
-            participants = [friend for friend, var in self.participant_vars.items() if var.get()]
-            
-            if not description:
-                raise ValueError("Description is required")
-            if amount <= 0:
-                raise ValueError("Amount must be positive")
-            if not payer:
-                raise ValueError("Please select a payer")
-            if not participants:
-                raise ValueError("Please select at least one participant")
-            
-            # Update expense
-            new_expense = {
-                'date': date_str,
-                'description': description,
-                'amount': amount,
-                'payer': payer,
-                'participants': participants
-            }
-            self.expenses[self.selected_expense] = new_expense
-            self.filtered_expenses = self.expenses.copy()
-            
-            # Update totals with new values
-            share = amount / len(participants)
-            self.total_paid[payer] += amount
-            for participant in participants:
-                self.total_owed[participant] += share
-            
-            # Clear selection and inputs
-            self.selected_expense = None
-            self.edit_btn.configure(text="Add Expense")
-            self.tree.selection_remove(self.tree.selection())
-            self.desc_var.set('')
-            self.amount_var.set('')
-            self.payer_var.set('')
-            for var in self.participant_vars.values():
-                var.set(False)
-            
-            self.refresh_expense_list()
-            self.refresh_totals_display()
-            self.calculate_payments()
-            
-        except ValueError as e:
-            messagebox.showerror("Input Error", str(e))
-
-    def on_expense_select(self, event):
-        selected = self.tree.selection()
-        if selected:
-            self.selected_expense = self.tree.index(selected[0])
-            expense = self.expenses[self.selected_expense]
-            
-            self.date_var.set(expense['date'])
-            self.desc_var.set(expense['description'])
-            self.amount_var.set(str(expense['amount']))
-            self.payer_var.set(expense['payer'])
-            
-            for friend, var in self.participant_vars.items():
-                var.set(friend in expense['participants'])
-            
-            self.edit_btn.configure(text="Update Expense")
-
-    def update_participants_checkboxes(self):
-        for widget in self.participants_frame.winfo_children():
-            widget.destroy()
-
-        self.participant_vars = {}
-        for friend in self.friends:
-            var = tk.BooleanVar()
-            cb = ttk.Checkbutton(self.participants_frame, text=friend, variable=var)
-            cb.pack(anchor="w", side="left", padx=5)
-            self.participant_vars[friend] = var
-
-    def refresh_expense_list(self):
-        self.tree.delete(*self.tree.get_children())
-        for expense in self.filtered_expenses:
-            participants = ", ".join(expense['participants'])
-            self.tree.insert(
-                '',
-                'end',
-                values=(
-                    expense['date'],
-                    expense['description'],
-                    f"₹{expense['amount']:.2f}",
-                    expense['payer'],
-                    participants,
-                ),
-            )
-
-    def refresh_totals_display(self):
-        self.totals_tree.delete(*self.totals_tree.get_children())
-        for friend in self.friends:
-            paid = self.total_paid.get(friend, 0)
-            owed = self.total_owed.get(friend, 0)
-            balance = paid - owed
-            self.totals_tree.insert(
-                '',
-                'end',
-                values=(
-                    friend,
-                    f"₹{paid:.2f}",
-                    f"₹{owed:.2f}",
-                    f"₹{balance:.2f}",
-                ),
-            )
-
-    def apply_filter(self):
-        filter_type = self.filter_var.get()
-        filter_value = self.filter_value_var.get().lower()
-        
-        if filter_type == "All":
-            self.filtered_expenses = self.expenses.copy()
-        else:
-            self.filtered_expenses = []
-            for expense in self.expenses:
-                if filter_type == "Date" and filter_value in expense['date'].lower():
-                    self.filtered_expenses.append(expense)
-                elif filter_type == "Description" and filter_value in expense['description'].lower():
-                    self.filtered_expenses.append(expense)
-                elif filter_type == "Payer" and filter_value in expense['payer'].lower():
-                    self.filtered_expenses.append(expense)
-                elif filter_type == "Participant":
-                    participants = [p.lower() for p in expense['participants']]
-                    if any(filter_value in p for p in participants):
-                        self.filtered_expenses.append(expense)
-        
-        self.refresh_expense_list()
-
-    def clear_filters(self):
-        self.filter_var.set("All")
-        self.filter_value_var.set("")
-        self.filtered_expenses = self.expenses.copy()
-        self.refresh_expense_list()
-
-    def clear_selected_expenses(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
-            messagebox.showwarning("No Selection", "Please select expenses to delete")
-            return
-            
-        if messagebox.askyesno("Confirm", "Delete selected expenses?"):
-            # Get indices of selected items (sorted in reverse to avoid index shifting)
-            indices = sorted([self.tree.index(item) for item in selected_items], reverse=True)
-            
-            for idx in indices:
-                if idx < len(self.expenses):
-                    # Remove expense impact on totals
-                    expense = self.expenses[idx]
-                    amount = expense['amount']
-                    payer = expense['payer']
-                    participants = expense['participants']
-                    share = amount / len(participants)
-                    
-                    self.total_paid[payer] -= amount
-                    for participant in participants:
-                        self.total_owed[participant] -= share
-                    
-                    # Remove the expense
-                    del self.expenses[idx]
-            
-            self.filtered_expenses = self.expenses.copy()
-            self.selected_expense = None
-            self.edit_btn.configure(text="Add Expense")
-            self.desc_var.set('')
-            self.amount_var.set('')
-            self.payer_var.set('')
-            for var in self.participant_vars.values():
-                var.set(False)
-            
-            self.refresh_expense_list()
-            self.refresh_totals_display()
-            self.save_expenses()
-            self.calculate_payments()
-
-    def clear_all_expenses(self):
-        if messagebox.askyesno("Confirm", "Clear all expenses?"):
-            self.expenses.clear()
-            self.filtered_expenses.clear()
-            for friend in self.friends:
-                self.total_paid[friend] = 0.0
-                self.total_owed[friend] = 0.0
-            self.refresh_expense_list()
-            self.refresh_totals_display()
-            self.save_expenses()
-            self.payments_text.delete(1.0, tk.END)
-
-    def save_as_csv(self):
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            title="Save expenses as CSV"
-        )
-        
-        if not file_path:
-            return
-            
-        try:
-            with open(file_path, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                # Write header
-                writer.writerow(['Date', 'Description', 'Amount', 'Payer', 'Participants'])
-                
-                # Write data
-                for expense in self.expenses:
-                    participants = ', '.join(expense['participants'])
-                    writer.writerow([
-                        expense['date'],
-                        expense['description'],
-                        expense['amount'],
-                        expense['payer'],
-                        participants
-                    ])
-                    
-            messagebox.showinfo("Success", f"Expenses saved successfully to {file_path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save CSV: {str(e)}")
-
-    def save_expenses(self):
-        try:
-            with open("expenses.json", "w") as f:
-                json.dump(self.expenses, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save expenses: {e}")
-
-    def load_expenses(self):
-        if os.path.exists("expenses.json"):
-            try:
-                with open("expenses.json", "r") as f:
-                    self.expenses = json.load(f)
-            
-                self.total_paid = {friend: 0.0 for friend in self.friends}
-                self.total_owed = {friend: 0.0 for friend in self.friends}
-            
-                for expense in self.expenses:
-                    payer = expense['payer']
-                    amount = float(expense['amount'])
-                    participants = expense['participants']
-                
-                    self.total_paid[payer] += amount
-                
-                    share = amount / len(participants)
-                    for participant in participants:
-                        self.total_owed[participant] += share
-            
-                self.filtered_expenses = self.expenses.copy()
-                self.refresh_expense_list()
-                self.refresh_totals_display()
-                self.calculate_payments()
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load expenses: {e}")
-
-    def save_friends(self):
-        try:
-            with open("friends.json", "w") as f:
-                json.dump(self.friends, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save friends: {e}")
-
-    def load_friends(self):
-        if os.path.exists("friends.json"):
-            try:
-                with open("friends.json", "r") as f:
-                    self.friends = json.load(f)
-            
-                for friend in self.friends:
-                    self.total_paid[friend] = self.total_paid.get(friend, 0.0)
-                    self.total_owed[friend] = self.total_owed.get(friend, 0.0)
-            
-                self.payer_combobox.configure(values=self.friends)
-                self.update_participants_checkboxes()
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load friends: {e}")
-
-
-if __name__ == "__main__":
-    root = ctk.CTk()
-    app = ExpenseTrackerApp(root)
+import argparse
+import json
+import os
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk, messagebox
+import customtkinter as ctk
+import sv_ttk
+from datetime import datetime
+
+from currency import DEFAULT_CURRENCY, RATES_FILE, SYMBOLS, FxRates, format_amount
+from friend_picker import FriendPicker
+from groups import DEFAULT_GROUP, GroupManager
+from journal import ConflictError, JournalStore, atomic_write_json
+from ledger import Ledger, FILTER_CRITERIA
+from recurring import FREQUENCIES, next_occurrence
+from persistence import PersistenceWorker
+from scheduler import RefreshScheduler
+from settlement import settle, STRATEGIES
+from virtual_tree import VirtualTreeview
+
+
+# Handlers timed when profiling is on
+PROFILED_HANDLERS = ['add_expense', 'apply_filter', 'refresh_expense_list', 'refresh_totals_display',
+                     'calculate_payments', 'save_expenses', 'load_expenses', 'read_ledger']
+
+# Set to turn profiling on without the --profile flag
+PROFILE = "EXPENSES_PROFILE"
+
+# Set to print startup timings as JSON lines and exit once interactive, see startup_benchmark.py
+STARTUP_PROBE = "EXPENSES_STARTUP_PROBE"
+
+# Milliseconds between checks for changes other programs saved to the active group
+WATCH_INTERVAL = 1000
+
+
+class ExpenseTrackerApp:
+    def __init__(self, root, backend="json", profile=False):
+        self.root = root
+        self.root.title("Shared Expense Tracker")
+        # Themed before any widget exists, so nothing is styled twice
+        sv_ttk.set_theme("dark")
+        self.startup_probe = bool(os.environ.get(STARTUP_PROBE))
+
+        # Data storage, one ledger per group with the recent ones kept loaded
+        self.backend = backend
+        self.groups = GroupManager(
+            self.close_group,
+            peek_group=None if backend == "sqlite" else lambda directory: JournalStore(directory).peek(),
+        )
+        self.group = DEFAULT_GROUP
+        self.ledger, self.store = self.open_group(self.group)
+        # One rate table for every group, re-read when the file changes
+        self.rates = FxRates(os.path.join(self.groups.base_directory, RATES_FILE))
+        self.display_currency = DEFAULT_CURRENCY
+        self.filtered_expenses = []  # Ids of the expenses shown
+        self.shown_expenses = set()
+        self.expense_changes = None  # Expense id -> 'put' or 'delete' since the last redraw, None to query again
+        self.active_filters = {}  # criteria -> value, combined with AND
+        self.selected_expense = None  # Id of the expense being edited
+
+        # Wrapped before create_widgets, which binds the handlers to buttons
+        self.profiler = None
+        if profile:
+            from profiling import Profiler, ProfilerOverlay
+            self.profiler = Profiler()
+            self.profiler.instrument(self, PROFILED_HANDLERS, rows=lambda: len(self.ledger))
+
+        self.create_widgets()
+        if self.profiler is not None:
+            self.profiler_overlay = ProfilerOverlay(self.root, self.profiler)
+
+        # All disk writes happen on this thread, results come back through root.after
+        self.worker = PersistenceWorker(self.root)
+        # Exports and imports get a thread of their own, a long one must not hold up saving
+        self.export_worker = PersistenceWorker(self.root)
+        self.export = None  # Progress and cancel event of the running export
+
+        # Ledger changes only mark panels dirty, each is redrawn once per idle pass
+        self.scheduler = RefreshScheduler(self.root, save=self.save_expenses)
+        self.scheduler.register('friends', self.refresh_friends)
+        self.scheduler.register('expenses', self.refresh_expense_list)
+        self.scheduler.register('totals', self.refresh_totals_display)
+        self.scheduler.register('payments', self.calculate_payments)
+        self.scheduler.register('reports', self.refresh_reports)
+        self.scheduler.register('history', self.refresh_history)
+        self.scheduler.register('rules', self.refresh_rules)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after_idle(self.report_startup, 'first_paint')
+        self.root.after(WATCH_INTERVAL, self.watch_files)
+        # The window comes up empty and the ledger is loaded behind it
+        self.load_expenses()
+
+    def create_widgets(self):
+        # Group switcher
+        group_bar = ttk.Frame(self.root)
+        group_bar.pack(padx=15, pady=(10, 0), fill=tk.X)
+
+        ttk.Label(group_bar, text="Group:").pack(side=tk.LEFT)
+        self.group_var = tk.StringVar(value=self.group)
+        self.group_combobox = ttk.Combobox(group_bar, textvariable=self.group_var, values=self.groups.names(),
+                                           state="readonly", width=20)
+        self.group_combobox.pack(side=tk.LEFT, padx=5)
+        self.group_combobox.bind('<<ComboboxSelected>>', lambda event: self.switch_group(self.group_var.get()))
+        ctk.CTkButton(group_bar, text="New Group", command=self.new_group, font=("",14,'bold')).pack(side=tk.LEFT, padx=5)
+        self.group_summary_label = ttk.Label(group_bar, text="")
+        self.group_summary_label.pack(side=tk.LEFT, padx=5)
+
+        # Main container
+        main_frame = ttk.Frame(self.root)
+        main_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        # Add Friend section
+        add_friend_frame = tk.LabelFrame(main_frame, text="Add Friend", font=(16), bd=2)
+        add_friend_frame.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
+
+        self.new_friend_var = tk.StringVar()
+        ctk.CTkEntry(add_friend_frame, textvariable=self.new_friend_var, border_color="#0390fc").pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ctk.CTkButton(add_friend_frame, text="Add Friend", command=self.add_friend,font=("",14,'bold')).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(add_friend_frame, text="Rename", command=self.rename_friend,font=("",14,'bold')).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(add_friend_frame, text="Delete Selected", command=self.delete_selected_friends, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'),hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
+
+        # Expense Input section
+        expense_frame = tk.LabelFrame(main_frame, text="Add/Edit Expense", font=("",16), bd=2)
+        expense_frame.grid(row=1, column=0, sticky="ew", padx=5, pady=5)
+
+        ttk.Label(expense_frame, text="Date (YYYY-MM-DD):", font=('Century Gothic', 12)).grid(row=0, column=0, sticky="w")
+        self.date_var = tk.StringVar(value=datetime.today().strftime('%Y-%m-%d'))
+        ctk.CTkEntry(expense_frame, textvariable=self.date_var, border_color="#0390fc").grid(row=0, column=1, sticky="ew")
+
+        ttk.Label(expense_frame, text="Description:", font=('Century Gothic', 12)).grid(row=1, column=0, sticky="w")
+        self.desc_var = tk.StringVar()
+        ctk.CTkEntry(expense_frame, textvariable=self.desc_var).grid(row=1, column=1, sticky="ew")
+
+        ttk.Label(expense_frame, text="Amount:", font=('Century Gothic', 12)).grid(row=2, column=0, sticky="w")
+        self.amount_var = tk.StringVar()
+        self.am = ctk.CTkEntry(expense_frame, textvariable=self.amount_var, bg_color="#1c1c1c", border_color="#0390fc")
+        self.am.grid(row=2, column=1, sticky="ew")
+        self.currency_var = tk.StringVar(value=DEFAULT_CURRENCY)
+        self.currency_combobox = ttk.Combobox(expense_frame, textvariable=self.currency_var, width=6,
+                                              values=self.currency_choices())
+        self.currency_combobox.grid(row=2, column=2, sticky="w", padx=5)
+
+        ttk.Label(expense_frame, text="Payer:", font=('Century Gothic', 12)).grid(row=3, column=0, sticky="w")
+        self.payer_var = ctk.StringVar()
+        self.payer_combobox = ctk.CTkComboBox(expense_frame, values=self.ledger.friends, variable=self.payer_var, state="readonly")
+        self.payer_combobox.grid(row=3, column=1, sticky="ew")
+
+        ttk.Label(expense_frame, text="Participants:", font=('Century Gothic', 12)).grid(row=4, column=0, sticky="nw")
+        self.friend_picker = FriendPicker(expense_frame, on_presets_change=self.save_presets)
+        self.friend_picker.grid(row=4, column=1, columnspan=2, sticky="ew")
+
+        # A repeating expense is saved as a rule, its occurrences are never stored
+        ttk.Label(expense_frame, text="Repeats:", font=('Century Gothic', 12)).grid(row=5, column=0, sticky="w")
+        repeat_frame = ttk.Frame(expense_frame)
+        repeat_frame.grid(row=5, column=1, sticky="ew")
+        self.frequency_var = tk.StringVar(value="never")
+        ttk.Combobox(repeat_frame, textvariable=self.frequency_var, values=["never"] + FREQUENCIES,
+                     state="readonly", width=8).pack(side=tk.LEFT)
+        ttk.Label(repeat_frame, text="every").pack(side=tk.LEFT, padx=5)
+        self.interval_var = tk.StringVar(value="1")
+        ctk.CTkEntry(repeat_frame, textvariable=self.interval_var, width=40).pack(side=tk.LEFT)
+        ttk.Label(repeat_frame, text="until").pack(side=tk.LEFT, padx=5)
+        self.until_var = tk.StringVar()
+        ctk.CTkEntry(repeat_frame, textvariable=self.until_var, width=100, placeholder_text="YYYY-MM-DD").pack(side=tk.LEFT)
+
+        self.edit_btn = ctk.CTkButton(expense_frame, text="Add Expense", command=self.add_update_expense,font=("",14,'bold'))
+        self.edit_btn.grid(row=6, column=1, sticky="e", pady=5)
+
+        # Filter section
+        filter_frame = ttk.Frame(main_frame)
+        filter_frame.grid(row=2, column=0, sticky="ew", padx=5, pady=(0,5))
+
+        ttk.Label(filter_frame, text="Filter by:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        self.filter_criteria = ttk.Combobox(filter_frame, textvariable=self.filter_var, 
+                                         values=FILTER_CRITERIA, 
+                                         state="readonly", width=12)
+        self.filter_criteria.pack(side=tk.LEFT, padx=5)
+        self.filter_criteria.set("All")
+
+        self.filter_value_var = tk.StringVar()
+        self.filter_value = ctk.CTkEntry(filter_frame, textvariable=self.filter_value_var, width=150)
+        self.filter_value.pack(side=tk.LEFT, padx=5)
+
+        ctk.CTkButton(filter_frame, text="Apply Filter", command=self.apply_filter,font=("",14,'bold')).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(filter_frame, text="Clear Filters", command=self.clear_filters, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'), hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
+
+        self.active_filters_label = ttk.Label(filter_frame, text="")
+        self.active_filters_label.pack(side=tk.LEFT, padx=5)
+
+        # Expense List with Scrollbar
+        self.list_frame = tk.LabelFrame(main_frame, text="Expenses", font=(16), bd=2)
+        self.list_frame.grid(row=3, column=0, sticky="nsew", padx=5, pady=5)
+
+        # Shown while the ledger loads
+        self.loading_bar = ttk.Progressbar(self.list_frame, mode='indeterminate')
+
+        tree_frame = ttk.Frame(self.list_frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ('date', 'description', 'amount', 'payer', 'participants')
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings', selectmode='extended')
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical")
+ 
+        self.tree.heading('date', text='Date')
+        self.tree.heading('description', text='Description')
+        self.tree.heading('amount', text='Amount')
+        self.tree.heading('payer', text='Payer')
+        self.tree.heading('participants', text='Participants')
+
+        self.tree.column('date', width=100, anchor="center")
+        self.tree.column('description', width=150, anchor="center")
+        self.tree.column('amount', width=80, anchor="center")
+        self.tree.column('payer', width=100, anchor="center")
+        self.tree.column('participants', width=200, anchor="center")
+
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Only the rows in view are kept in the tree, filled in as it scrolls
+        self.expense_view = VirtualTreeview(
+            self.tree, vsb, self.format_expense_row, lambda expense_id: expense_id,
+            on_select=self.on_expense_select,
+        )
+
+        # Controls
+        control_frame = ttk.Frame(main_frame)
+        control_frame.grid(row=4, column=0, sticky="ew", padx=5, pady=5)
+
+        
+        ctk.CTkButton(control_frame, text="Clear Expenses", command=self.clear_selected_expenses, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'), hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(control_frame, text="Clear All", command=self.clear_all_expenses, fg_color="#FF6B6B", text_color="#050505",font=("",14,'bold'), hover_color="#FF4D4D").pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(control_frame, text="Export", command=self.export_expenses,font=("",14,'bold')).pack(side=tk.RIGHT, padx=5)
+        ctk.CTkButton(control_frame, text="Import CSV", command=self.import_csv,font=("",14,'bold')).pack(side=tk.RIGHT, padx=5)
+        self.redo_btn = ctk.CTkButton(control_frame, text="Redo", command=self.redo, font=("",14,'bold'))
+        self.redo_btn.pack(side=tk.RIGHT, padx=5)
+        self.undo_btn = ctk.CTkButton(control_frame, text="Undo", command=self.undo, font=("",14,'bold'))
+        self.undo_btn.pack(side=tk.RIGHT, padx=5)
+        self.root.bind('<Control-z>', self.undo)
+        self.root.bind('<Control-y>', self.redo)
+        self.root.bind('<Control-Z>', self.redo)  # Ctrl+Shift+Z
+        # Shown while an export runs
+        self.export_bar = ttk.Progressbar(control_frame, mode='determinate', length=150)
+        self.export_cancel_btn = ctk.CTkButton(control_frame, text="Cancel Export", command=self.cancel_export,
+                                               fg_color="#FF6B6B", text_color="#050505", font=("",14,'bold'),
+                                               hover_color="#FF4D4D")
+
+        # Recurring expenses
+        rules_frame = tk.LabelFrame(main_frame, text="Recurring", font=(16), bd=2)
+        rules_frame.grid(row=5, column=0, sticky="nsew", padx=5, pady=5)
+
+        self.rules_tree = ttk.Treeview(rules_frame, columns=('description', 'amount', 'repeats', 'next', 'payer'),
+                                       show='headings', height=4, selectmode='browse')
+        for column, heading, width in (('description', 'Description', 150), ('amount', 'Amount', 80),
+                                       ('repeats', 'Repeats', 120), ('next', 'Next', 100), ('payer', 'Payer', 100)):
+            self.rules_tree.heading(column, text=heading)
+            self.rules_tree.column(column, width=width, anchor="center")
+        self.rules_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        rule_buttons = ttk.Frame(rules_frame)
+        rule_buttons.pack(side=tk.RIGHT, fill=tk.Y, padx=5)
+        ctk.CTkButton(rule_buttons, text="Edit Occurrence", command=self.edit_occurrence,
+                      font=("",14,'bold')).pack(side=tk.TOP, pady=2)
+        ctk.CTkButton(rule_buttons, text="Delete Rule", command=self.delete_rule, fg_color="#FF6B6B",
+                      text_color="#050505", font=("",14,'bold'), hover_color="#FF4D4D").pack(side=tk.TOP, pady=2)
+
+        # Totals Display with Scrollbar
+        totals_frame = tk.LabelFrame(main_frame, text="Totals", font=(16), bd=2)
+        totals_frame.grid(row=0, column=1, rowspan=2, sticky="nsew", padx=5, pady=5)
+
+        display_frame = ttk.Frame(totals_frame)
+        display_frame.pack(side=tk.TOP, fill=tk.X)
+        ttk.Label(display_frame, text="Show in:").pack(side=tk.LEFT)
+        self.display_var = tk.StringVar(value=self.display_currency)
+        self.display_combobox = ttk.Combobox(display_frame, textvariable=self.display_var, width=6,
+                                             values=self.currency_choices(), state="readonly")
+        self.display_combobox.pack(side=tk.LEFT, padx=5)
+        self.display_combobox.bind('<<ComboboxSelected>>', lambda event: self.set_display_currency(self.display_var.get()))
+
+        totals_tree_frame = ttk.Frame(totals_frame)
+        totals_tree_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.totals_tree = ttk.Treeview(
+            totals_tree_frame, columns=('friend', 'paid', 'owed', 'balance'), show='headings'
+        )
+        vsb_totals = ttk.Scrollbar(totals_tree_frame, orient="vertical", command=self.totals_tree.yview)
+        self.totals_tree.configure(yscrollcommand=vsb_totals.set)
+
+        self.totals_tree.heading('friend', text='Friend', anchor="center")
+        self.totals_tree.column('friend', anchor="center")
+        self.totals_tree.heading('paid', text='Total Paid', anchor="center")
+        self.totals_tree.column('paid', anchor="center")
+        self.totals_tree.heading('owed', text='Total Owed', anchor="center")
+        self.totals_tree.column('owed', anchor="center")
+        self.totals_tree.heading('balance', text='Balance', anchor="center")
+        self.totals_tree.column('balance', anchor="center")
+
+        self.totals_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb_totals.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Payment Instructions Display
+        payments_frame = tk.LabelFrame(main_frame, text="Payment Instructions", font=(16), bd=2)
+        payments_frame.grid(row=2, column=1, rowspan=2, sticky="nsew", padx=5, pady=5)
+
+        strategy_frame = ttk.Frame(payments_frame)
+        strategy_frame.pack(side=tk.TOP, fill=tk.X)
+        ttk.Label(strategy_frame, text="Settle with:").pack(side=tk.LEFT)
+        self.strategy_var = tk.StringVar(value=STRATEGIES[0])
+        strategy_box = ttk.Combobox(strategy_frame, textvariable=self.strategy_var, values=STRATEGIES,
+                                    state="readonly", width=10)
+        strategy_box.pack(side=tk.LEFT, padx=5)
+        strategy_box.bind('<<ComboboxSelected>>', lambda event: self.calculate_payments())
+
+        self.payments_text = tk.Text(payments_frame, wrap=tk.WORD, height=10)
+        payments_scroll = ttk.Scrollbar(payments_frame, command=self.payments_text.yview)
+        self.payments_text.configure(yscrollcommand=payments_scroll.set, font=("Century Gothic",14))
+
+        payments_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.payments_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Reports, answered from the ledger's date rollups
+        reports_frame = tk.LabelFrame(main_frame, text="Reports", font=(16), bd=2)
+        reports_frame.grid(row=4, column=1, sticky="nsew", padx=5, pady=5)
+
+        today = datetime.today()
+        ttk.Label(reports_frame, text="From:").grid(row=0, column=0, sticky="w")
+        self.report_start_var = tk.StringVar(value=today.strftime('%Y-%m-01'))
+        ctk.CTkEntry(reports_frame, textvariable=self.report_start_var, width=100).grid(row=0, column=1, sticky="w")
+        ttk.Label(reports_frame, text="To:").grid(row=0, column=2, sticky="w", padx=(5, 0))
+        self.report_end_var = tk.StringVar(value=today.strftime('%Y-%m-%d'))
+        ctk.CTkEntry(reports_frame, textvariable=self.report_end_var, width=100).grid(row=0, column=3, sticky="w")
+
+        ttk.Label(reports_frame, text="Monthly budget:").grid(row=1, column=0, sticky="w")
+        self.budget_var = tk.StringVar()
+        ctk.CTkEntry(reports_frame, textvariable=self.budget_var, width=100).grid(row=1, column=1, sticky="w")
+        ctk.CTkButton(reports_frame, text="Update", command=self.refresh_reports, width=80,
+                      font=("",14,'bold')).grid(row=1, column=3, sticky="e", pady=5)
+
+        self.reports_label = ttk.Label(reports_frame, text="", justify=tk.LEFT)
+        self.reports_label.grid(row=2, column=0, columnspan=4, sticky="w")
+
+        main_frame.columnconfigure(0, weight=3)
+        main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(3, weight=1)
+
+        style = ttk.Style()
+        self.root.configure(bg=style.lookup("TLabelFrame", "background"))
+
+    def calculate_payments(self):
+        """Calculate who needs to pay whom and display the instructions"""
+        try:
+            transfers = settle(self.ledger.balances(), strategy=self.strategy_var.get())
+        except ValueError as e:
+            transfers = None
+            instructions = f"{e}\n"
+
+        if transfers:
+            instructions = "".join(
+                f"{debtor} should pay {format_amount(amount, self.display_currency)} to {creditor}\n"
+                for debtor, creditor, amount in transfers
+            )
+        elif transfers is not None:
+            instructions = "No payments needed - all balances are settled\n"
+
+        # Replace the previous instructions in one go
+        self.payments_text.delete(1.0, tk.END)
+        self.payments_text.insert(tk.END, instructions)
+
+    def add_friend(self):
+        try:
+            new_friend = self.new_friend_var.get().strip()
+            if new_friend and self.store.history.add_friend(self.ledger, new_friend):
+                self.new_friend_var.set('')
+            
+            if not new_friend:
+                messagebox.showerror("Error", "Please Enter Friend Name.")
+                return
+        except ValueError as ve:
+            messagebox.showerror("Error", f"Invalid input: {ve}")
+
+    def rename_friend(self):
+        """Rename the one checked friend to the name in the entry"""
+        selected_friends = self.friend_picker.selection()
+        if len(selected_friends) != 1:
+            messagebox.showwarning("No Selection", "Please check the one friend to rename")
+            return
+
+        try:
+            if self.store.history.rename_friend(self.ledger, selected_friends[0], self.new_friend_var.get()):
+                self.new_friend_var.set('')
+        except ValueError as ve:
+            messagebox.showerror("Error", f"Invalid input: {ve}")
+
+    def delete_selected_friends(self):
+        selected_friends = self.friend_picker.selection()
+        
+        if not selected_friends:
+            messagebox.showwarning("No Selection", "Please select friends to delete by checking them under Participants")
+            return
+            
+        if messagebox.askyesno("Confirm", f"Delete selected friends?\nThis will also remove all related expenses."):
+            # Remove the friends and only the expenses involving them, undoable as one step
+            with self.scheduler.batch():
+                self.store.history.remove_friends(self.ledger, selected_friends)
+
+    def add_update_expense(self):
+        if self.selected_expense is not None:
+            self.update_expense()
+        else:
+            self.add_expense()
+
+    def add_expense(self):
+        try:
+            participants = self.friend_picker.selection()
+
+            if self.frequency_var.get() != "never":
+                # Starts on the date given and repeats from there
+                self.store.history.add_rule(
+                    self.ledger,
+                    self.date_var.get(),
+                    self.frequency_var.get(),
+                    self.interval_var.get(),
+                    self.until_var.get().strip(),
+                    self.desc_var.get(),
+                    float(self.amount_var.get()),
+                    self.payer_var.get(),
+                    participants,
+                    self.currency_var.get(),
+                )
+                self.frequency_var.set("never")
+                self.interval_var.set("1")
+                self.until_var.set('')
+            else:
+                # Add expense, the ledger updates the totals
+                self.store.history.add_expense(
+                    self.ledger,
+                    self.date_var.get(),
+                    self.desc_var.get(),
+                    float(self.amount_var.get()),
+                    self.payer_var.get(),
+                    participants,
+                    self.currency_var.get(),
+                )
+
+            # Clear inputs
+            self.desc_var.set('')
+            self.amount_var.set('')
+            self.payer_var.set('')
+            self.friend_picker.clear()
+            
+        except ValueError as e:
+            messagebox.showerror("Input Error", str(e))
+
+    def update_expense(self):
+        try:
+            participants = self.friend_picker.selection()
+
+            # Replace the expense, the ledger swaps its old totals for the new ones
+            self.store.history.update_expense(
+                self.ledger,
+                self.selected_expense,
+                self.date_var.get(),
+                self.desc_var.get(),
+                float(self.amount_var.get()),
+                self.payer_var.get(),
+                participants,
+                self.currency_var.get(),
+            )
+
+            # Clear selection and inputs
+            self.selected_expense = None
+            self.edit_btn.configure(text="Add Expense")
+            self.expense_view.clear_selection()
+            self.desc_var.set('')
+            self.amount_var.set('')
+            self.payer_var.set('')
+            self.friend_picker.clear()
+            
+        except ValueError as e:
+            messagebox.showerror("Input Error", str(e))
+
+    def on_expense_select(self, event):
+        selected = self.expense_view.selection()
+        if len(selected) > 1 and self.selected_expense is not None:
+            # Several rows are only selected for deleting
+            self.selected_expense = None
+            self.edit_btn.configure(text="Add Expense")
+        elif len(selected) == 1:
+            self.edit_expense(self.ledger.get(selected[0]))
+
+    def edit_expense(self, expense):
+        """Fill the form with an expense to update it"""
+        self.selected_expense = expense['id']
+
+        self.date_var.set(expense['date'])
+        self.desc_var.set(expense['description'])
+        self.amount_var.set(str(expense['amount']))
+        self.currency_var.set(expense['currency'])
+        self.payer_var.set(expense['payer'])
+
+        self.friend_picker.select(expense['participants'])
+
+        self.frequency_var.set("never")
+        self.edit_btn.configure(text="Update Expense")
+
+    def refresh_rules(self):
+        """List the recurring rules with the next date each falls on"""
+        self.rules_tree.delete(*self.rules_tree.get_children())
+        for rule in self.ledger.rules_list():
+            repeats = rule['frequency'] if rule['interval'] == 1 else f"every {rule['interval']} {rule['frequency']}"
+            if rule['until']:
+                repeats += f" to {rule['until']}"
+            upcoming = next_occurrence(rule)
+            self.rules_tree.insert('', 'end', iid=str(rule['id']), values=(
+                rule['description'],
+                format_amount(rule['amount'], rule['currency']),
+                repeats,
+                upcoming.isoformat() if upcoming else "ended",
+                rule['payer'],
+            ))
+
+    def selected_rule(self):
+        selected = self.rules_tree.selection()
+        if not selected:
+            messagebox.showwarning("No Selection", "Please select a recurring expense")
+            return None
+        return int(selected[0])
+
+    def edit_occurrence(self):
+        """Make the rule's first occurrence on or after the form's date an expense of its own and edit it"""
+        rule_id = self.selected_rule()
+        if rule_id is None:
+            return
+        try:
+            day = next(self.ledger.occurrences(rule_id, self.date_var.get().strip()), None)
+            if day is None:
+                messagebox.showwarning("No Occurrence", "The rule has no occurrence on or after that date")
+                return
+            expense = self.store.history.materialize(self.ledger, rule_id, day.isoformat())
+        except ValueError as e:
+            messagebox.showerror("Input Error", str(e))
+            return
+        self.edit_expense(expense)
+
+    def delete_rule(self):
+        rule_id = self.selected_rule()
+        if rule_id is not None and messagebox.askyesno("Confirm", "Delete the recurring expense?\n"
+                                                                  "Occurrences already edited are kept."):
+            self.store.history.delete_rule(self.ledger, rule_id)
+
+    def format_expense_row(self, expense_id):
+        expense = self.ledger.get(expense_id)
+        return (
+            expense['date'],
+            expense['description'],
+            format_amount(expense['amount'], expense['currency']),
+            expense['payer'],
+            ", ".join(expense['participants']),
+        )
+
+    def refresh_friends(self):
+        # Only the friends added or removed are applied, the picker's widgets are reused
+        self.friend_picker.set_friends(self.ledger.friends)
+        self.payer_combobox.configure(values=self.ledger.friends)
+
+    def presets_path(self):
+        return os.path.join(self.groups.directory(self.group), "presets.json")
+
+    def load_presets(self):
+        try:
+            with open(self.presets_path(), "r", encoding="utf-8") as f:
+                presets = json.load(f)['presets']
+        except FileNotFoundError:
+            presets = {}
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Failed to load participant presets: {e}")
+            presets = {}
+        self.friend_picker.set_presets(presets)
+
+    def save_presets(self, presets):
+        path = self.presets_path()
+        self.worker.submit(
+            lambda presets: atomic_write_json(path, {'version': 1, 'presets': presets}), presets,
+            key=('presets', self.group),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to save participant presets: {e}"),
+        )
+
+    def refresh_expense_list(self):
+        changes, self.expense_changes = self.expense_changes, {}
+        if changes is None:
+            # Rows are formatted lazily as they scroll into view
+            self.filtered_expenses = self.ledger.query_ids(**self.active_filters)
+            self.shown_expenses = set(self.filtered_expenses)
+            self.expense_view.set_rows(self.filtered_expenses)
+        else:
+            self.apply_expense_changes(changes)
+        self.list_frame.configure(text=f"Expenses ({len(self.filtered_expenses)})")
+
+    def apply_expense_changes(self, changes):
+        """Bring the shown list up to date from the ids that changed, without a new query"""
+        added = []
+        removed = set()
+        for expense_id, change in changes.items():
+            visible = change == 'put' and self.ledger.matches(expense_id, **self.active_filters)
+            if visible and expense_id in self.shown_expenses:
+                self.expense_view.refresh_row(expense_id)  # Edited in place
+            elif visible:
+                added.append(expense_id)
+            elif expense_id in self.shown_expenses:
+                removed.add(expense_id)
+
+        if not added and not removed:
+            return
+        rows = self.filtered_expenses
+        if removed:
+            # One pass for any number of deletions
+            rows = [expense_id for expense_id in rows if expense_id not in removed]
+            self.shown_expenses -= removed
+        if added:
+            added.sort()
+            sort_needed = rows and added[0] < rows[-1]
+            rows.extend(added)
+            if sort_needed:
+                rows.sort()
+            self.shown_expenses.update(added)
+        self.filtered_expenses = rows
+        self.expense_view.set_rows(rows)
+
+    def refresh_totals_display(self):
+        # Converted totals are kept until the expenses or the rate file change
+        self.rates.reload()
+        try:
+            totals = self.ledger.totals()
+        except ValueError as e:
+            self.totals_tree.delete(*self.totals_tree.get_children())
+            self.totals_tree.insert('', 'end', values=(str(e), "", "", ""))
+            return
+        self.show_totals(totals, self.display_currency)
+
+    def currency_choices(self):
+        return sorted(set(SYMBOLS) | set(self.rates.currencies()))
+
+    def set_display_currency(self, currency):
+        """Show totals and payments converted into another currency"""
+        self.display_currency = currency
+        self.ledger.display_currency = currency
+        self.scheduler.mark('totals', 'payments')
+
+    def refresh_reports(self):
+        """Spend over the chosen dates, this month's shares and what is left of the budget"""
+        today = datetime.today()
+        try:
+            start = datetime.strptime(self.report_start_var.get().strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+            end = datetime.strptime(self.report_end_var.get().strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            self.reports_label.configure(text="Dates must be YYYY-MM-DD")
+            return
+
+        lines = [f"Spent {start} to {end}: {format_amount(self.ledger.spend_between(start, end))}",
+                 "Shares this month:"]
+        for friend, share in self.ledger.month_shares(today.year, today.month).items():
+            lines.append(f"  {friend}: {format_amount(share)}")
+
+        budget = self.budget_var.get().strip()
+        if budget:
+            try:
+                remaining = self.ledger.budget_remaining(float(budget), today.year, today.month)
+            except ValueError:
+                lines.append("Budget must be a number")
+            else:
+                lines.append(f"Budget remaining this month: {format_amount(remaining)}")
+        if self.ledger.is_mixed() or any(rule['currency'] != DEFAULT_CURRENCY for rule in self.ledger.rules_list()):
+            lines.append(f"Reports count only {DEFAULT_CURRENCY} expenses")
+        self.reports_label.configure(text="\n".join(lines))
+
+    def show_totals(self, totals, currency=DEFAULT_CURRENCY):
+        self.totals_tree.delete(*self.totals_tree.get_children())
+        for friend, (paid, owed) in totals.items():
+            balance = paid - owed
+            self.totals_tree.insert(
+                '',
+                'end',
+                values=(
+                    friend,
+                    format_amount(paid, currency),
+                    format_amount(owed, currency),
+                    format_amount(balance, currency),
+                ),
+            )
+
+    def apply_filter(self):
+        """Add the chosen filter to the active ones, all of which must match"""
+        filter_type = self.filter_var.get()
+        filter_value = self.filter_value_var.get().strip()
+
+        if filter_type == "All":
+            self.active_filters.clear()
+        elif filter_value:
+            self.active_filters[filter_type.lower()] = filter_value
+        else:
+            self.active_filters.pop(filter_type.lower(), None)
+
+        self.active_filters_label.configure(
+            text=" AND ".join(f"{criteria}: {value}" for criteria, value in self.active_filters.items())
+        )
+        self.expense_changes = None
+        self.refresh_expense_list()
+
+    def clear_filters(self):
+        self.filter_var.set("All")
+        self.filter_value_var.set("")
+        self.active_filters.clear()
+        self.active_filters_label.configure(text="")
+        self.expense_changes = None
+        self.refresh_expense_list()
+
+    def clear_selected_expenses(self):
+        selected_ids = self.expense_view.selection()
+        if not selected_ids:
+            messagebox.showwarning("No Selection", "Please select expenses to delete")
+            return
+            
+        if messagebox.askyesno("Confirm", "Delete selected expenses?"):
+            # The ledger removes the selected expenses and their totals
+            # Deleting many rows is one batch: one redraw and one save
+            with self.scheduler.batch():
+                self.store.history.delete_expenses(self.ledger, selected_ids)
+
+            self.selected_expense = None
+            self.edit_btn.configure(text="Add Expense")
+            self.desc_var.set('')
+            self.amount_var.set('')
+            self.payer_var.set('')
+            self.friend_picker.clear()
+
+    def clear_all_expenses(self):
+        if messagebox.askyesno("Confirm", "Clear all expenses?\nThis can be undone with Undo."):
+            self.store.history.clear_expenses(self.ledger)
+
+    def undo(self, event=None):
+        self.step_history(self.store.history.undo)
+
+    def redo(self, event=None):
+        self.step_history(self.store.history.redo)
+
+    def step_history(self, step):
+        # The store only holds the loaded ledger once it is on screen
+        if self.store.ledger is not self.ledger:
+            return
+        with self.scheduler.batch():
+            label = step(self.ledger)
+        if label is None:
+            return
+        # The expense being edited may be gone or changed
+        self.selected_expense = None
+        self.edit_btn.configure(text="Add Expense")
+        self.expense_view.clear_selection()
+
+    def refresh_history(self):
+        history = self.store.history
+        undo_label, redo_label = history.undo_label(), history.redo_label()
+        self.undo_btn.configure(text=f"Undo {undo_label}" if undo_label else "Undo")
+        self.redo_btn.configure(text=f"Redo {redo_label}" if redo_label else "Redo")
+
+    def export_expenses(self):
+        """Write the expenses, or only the filtered ones, as CSV or JSON lines in the background"""
+        from tkinter import filedialog
+        from exports import write_expenses
+
+        if self.export is not None:
+            messagebox.showwarning("Export", "An export is already running")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Compressed CSV", "*.csv.gz"), ("JSON lines", "*.jsonl"),
+                       ("Compressed JSON lines", "*.jsonl.gz"), ("All files", "*.*")],
+            title="Export expenses"
+        )
+        if not file_path:
+            return
+
+        expense_ids = None
+        if self.active_filters:
+            answer = messagebox.askyesnocancel(
+                "Export", f"Export only the {len(self.filtered_expenses)} filtered expenses?\n"
+                          "No exports every expense.")
+            if answer is None:
+                return
+            if answer:
+                expense_ids = list(self.filtered_expenses)
+
+        # Only ids and records are copied here, rows are made and written chunk by chunk on the export thread
+        total, expenses = self.ledger.stream(expense_ids)
+        self.export = {'done': 0, 'total': total, 'cancel': threading.Event()}
+        self.export_bar.configure(maximum=max(total, 1), value=0)
+        self.export_bar.pack(side=tk.RIGHT, padx=5)
+        self.export_cancel_btn.pack(side=tk.RIGHT, padx=5)
+        self.root.after(100, self.show_export_progress)
+
+        export = self.export
+        self.export_worker.submit(
+            lambda source: write_expenses(file_path, source, total, lambda done, _: export.update(done=done),
+                                          export['cancel']),
+            expenses,
+            on_done=lambda path: self.on_export_done(f"Exported {total} expenses to {path}"),
+            on_error=self.on_export_error,
+        )
+
+    def show_export_progress(self):
+        if self.export is None:
+            return
+        self.export_bar.configure(value=self.export['done'])
+        self.root.after(100, self.show_export_progress)
+
+    def cancel_export(self):
+        if self.export is not None:
+            self.export['cancel'].set()
+
+    def on_export_done(self, message):
+        if self.export is None:
+            return
+        self.export = None
+        self.export_bar.pack_forget()
+        self.export_cancel_btn.pack_forget()
+        messagebox.showinfo("Export", message)
+
+    def on_export_error(self, error):
+        from exports import ExportCancelled
+
+        if isinstance(error, ExportCancelled):
+            self.on_export_done("Export cancelled, no file was written")
+            return
+        self.on_export_done(f"Failed to export: {error}")
+
+    def import_csv(self):
+        """Import CSV files in the background, rows without a payer or participants take the form's"""
+        from tkinter import filedialog
+        from imports import LAYOUTS_FILE, import_files, load_layouts
+
+        paths = filedialog.askopenfilenames(
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            title="Import expenses from CSV"
+        )
+        if not paths:
+            return
+        try:
+            layouts = load_layouts(os.path.join(self.groups.base_directory, LAYOUTS_FILE))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to read {LAYOUTS_FILE}: {e}")
+            return
+
+        ledger, payer, friends = self.ledger, self.payer_var.get(), self.ledger.friends
+        participants = self.friend_picker.selection()
+        # Parsed on the export thread with a process pool, so saves do not queue behind a long import;
+        # only adding the result goes through the writer, as one batch
+        self.export_worker.submit(
+            lambda existing: import_files(paths, friends, payer, participants, existing, layouts=layouts),
+            ledger.stream()[1],
+            on_done=lambda result: self.on_import_done(ledger, result),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to import CSV: {e}"),
+        )
+
+    def on_import_done(self, ledger, result):
+        if ledger is not self.ledger:
+            messagebox.showwarning("Import", "The group was switched, nothing was imported")
+            return
+        try:
+            if result['expenses']:
+                # One change: one redraw, one save and one undo step
+                with self.scheduler.batch():
+                    self.store.history.add_expenses(self.ledger, result['expenses'])
+        except ValueError as e:
+            messagebox.showerror("Error", f"Failed to import CSV: {e}")
+            return
+        message = f"Imported {len(result['expenses'])} expenses, skipped {result['duplicates']} duplicates"
+        if result['errors']:
+            message += f" and {len(result['errors'])} bad rows:\n" + "\n".join(result['errors'][:10])
+        messagebox.showinfo("Import", message)
+
+    def save_expenses(self):
+        """Hand the changes made since the last save to the background writer"""
+        store = self.store
+        try:
+            batch = store.take_batch()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save expenses: {e}")
+            return
+
+        if batch is not None:
+            group = self.group
+            # A save of the same store still waiting in the queue absorbs this one
+            self.worker.submit(
+                store.write_batch, batch, key=('ledger', group, id(store)),
+                merge=store.merge_batches, on_error=lambda error: self.on_save_error(group, store, error),
+            )
+
+    def on_save_error(self, group, store, error):
+        store.write_failed()
+        if isinstance(error, ConflictError):
+            # The store kept the batch, syncing replays it on top of the other program's changes
+            if group == self.group and store is self.store:
+                self.sync_group()
+            elif store.ledger is not None:
+                try:
+                    store.sync(store.ledger)
+                except ConflictError as e:
+                    if self.groups.discard(group, store):
+                        self.reload_group(group, e)
+                except OSError:
+                    pass  # Closing the group writes it, or refuses and keeps trying
+            return
+        messagebox.showerror("Error", f"Failed to save expenses: {error}")
+
+    def watch_files(self):
+        """Take in what other windows or programs saved to the active group, checked with two stats"""
+        self.sync_group()
+        self.root.after(WATCH_INTERVAL, self.watch_files)
+
+    def sync_group(self):
+        store = self.store
+        if store.ledger is not self.ledger:
+            return  # Still loading
+        try:
+            # Each change marks what it touches, all of them are redrawn together
+            with self.scheduler.batch():
+                synced = store.sync(self.ledger)
+            if synced is not None and store.pending:
+                # Changes made here, replayed on top of the others' and maybe under new
+                # ids, so the expense being edited is let go
+                self.selected_expense = None
+                self.edit_btn.configure(text="Add Expense")
+                self.expense_view.clear_selection()
+                self.scheduler.request_save()
+        except ConflictError as e:
+            self.groups.discard(self.group, store)
+            self.reload_group(self.group, e)
+        except OSError:
+            pass  # Files being replaced, the next check will see them
+
+    def reload_group(self, group, error):
+        """Load a group again from disk after its files changed in a way that could not be merged"""
+        messagebox.showwarning("Changed Elsewhere",
+                               f"{error}.\nThe ledger is loaded again.")
+        if group != self.group:
+            return  # Loaded from disk when switched to
+        if self.on_ledger_change in self.ledger.listeners:
+            self.ledger.unsubscribe(self.on_ledger_change)
+        self.selected_expense = None
+        self.edit_btn.configure(text="Add Expense")
+        self.expense_view.clear_selection()
+        self.ledger, self.store = self.open_group(group)
+        self.load_expenses()
+
+    def load_expenses(self):
+        """Start loading the active group's ledger; buttons stay disabled until it is in"""
+        group, ledger, store = self.group, self.ledger, self.store
+        self.set_buttons_state("disabled")
+        self.list_frame.configure(text="Expenses (loading...)")
+        self.loading_bar.pack(side=tk.TOP, fill=tk.X, before=self.tree.master)
+        self.loading_bar.start()
+
+        # Nothing of the previous group stays on screen
+        self.filtered_expenses = []
+        self.shown_expenses = set()
+        self.expense_changes = {}
+        self.expense_view.set_rows(self.filtered_expenses)
+        self.scheduler.mark('friends', 'payments', 'reports', 'history', 'rules')
+
+        # The snapshot header already has the totals, show them while the expenses load
+        totals = store.peek()
+        self.show_totals(totals if totals is not None else {})
+
+        if self.backend == "sqlite":
+            # The connection belongs to this thread, so load once the window is up
+            self.root.after_idle(self.load_on_main_thread, group, ledger, store)
+        else:
+            # A fresh ledger is filled on the writer thread and only handed over when complete
+            self.worker.submit(
+                lambda fresh: self.read_ledger(fresh, store), Ledger(),
+                on_done=lambda loaded: self.on_ledger_loaded(group, loaded, store),
+                on_error=lambda error: self.on_load_error(group, ledger, store, error),
+            )
+
+    def read_ledger(self, ledger, store):
+        # Snapshot plus journal replay, totals are built once by the ledger
+        store.load(ledger)
+        return ledger
+
+    def load_on_main_thread(self, group, ledger, store):
+        try:
+            self.read_ledger(ledger, store)
+        except Exception as e:
+            ledger.close()  # The store rolled back what it had read, nothing is committed
+            self.on_load_error(group, ledger, store, e)
+            return
+        self.on_ledger_loaded(group, ledger, store)
+
+    def on_load_error(self, group, ledger, store, error):
+        """Keep a group that failed to load closed: not cached, nothing to edit, and offered again"""
+        if group != self.group:
+            # Switched away meanwhile; it is not cached, so switching back loads it again
+            messagebox.showerror("Error", f"Failed to load expenses for {group}: {error}")
+            return
+        self.loading_bar.stop()
+        self.loading_bar.pack_forget()
+        self.list_frame.configure(text="Expenses (failed to load)")
+        # The buttons stay disabled and the store never took the ledger, so nothing is saved
+        if messagebox.askretrycancel("Error", f"Failed to load expenses: {error}"):
+            if group != self.group:
+                return
+            self.ledger, self.store = self.open_group(group)
+            self.load_expenses()
+
+    def on_ledger_loaded(self, group, ledger, store):
+        self.groups.add(group, ledger, store, keep=(self.group,))
+        if group != self.group:
+            return  # Switched to another group while this one loaded, it stays cached
+
+        self.ledger = ledger
+        self.store = store
+        self.ledger.rates = self.rates
+        self.ledger.display_currency = self.display_currency
+        self.ledger.subscribe(self.on_ledger_change)
+        self.load_presets()
+        self.loading_bar.stop()
+        self.loading_bar.pack_forget()
+        self.set_buttons_state("normal")
+
+        self.expense_changes = None
+        self.scheduler.mark('friends', 'expenses', 'totals', 'payments', 'reports', 'history', 'rules')
+        self.refresh_groups()
+        # Queued behind the redraw, so it fires once the loaded ledger is on screen
+        self.root.after_idle(self.report_startup, 'interactive')
+
+    def open_group(self, name):
+        """A ledger and store for a group, not loaded yet"""
+        directory = self.groups.directory(name)
+        if self.backend == "sqlite":
+            from sqlite_store import SQLiteLedger, SQLiteStore
+            return SQLiteLedger(os.path.join(directory, "expenses.db")), SQLiteStore(directory)
+        return Ledger(), JournalStore(directory)
+
+    def close_group(self, name, ledger, store):
+        # Writes already queued for the group go first, closing writes on this thread
+        self.worker.flush()
+        try:
+            store.close()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save expenses for {name}: {e}")
+
+    def switch_group(self, name):
+        """Make another group active; recently used groups are still in memory"""
+        if name == self.group:
+            return
+        # The changes so far belong to the group being left
+        self.scheduler.flush_save()
+        if self.on_ledger_change in self.ledger.listeners:
+            self.ledger.unsubscribe(self.on_ledger_change)
+
+        self.group = name
+        self.selected_expense = None
+        self.edit_btn.configure(text="Add Expense")
+        self.expense_view.clear_selection()
+
+        group = self.groups.get(name)
+        if group is not None:
+            self.on_ledger_loaded(name, *group)
+            # It may have been changed elsewhere while in the background
+            self.sync_group()
+        else:
+            self.ledger, self.store = self.open_group(name)
+            self.load_expenses()
+        self.refresh_groups()
+
+    def new_group(self):
+        from tkinter import simpledialog
+
+        name = simpledialog.askstring("New Group", "Group name:", parent=self.root)
+        if name is None:
+            return
+        try:
+            name = self.groups.create(name)
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.switch_group(name)
+
+    def refresh_groups(self):
+        """Group switcher values, with a summary of every other group"""
+        self.group_combobox.configure(values=self.groups.names())
+        self.group_var.set(self.group)
+
+        summaries = []
+        for name in self.groups.names():
+            if name == self.group:
+                continue
+            summary = self.groups.summary(name)
+            text = name
+            if summary['totals'] is not None:
+                text += f" {format_amount(sum(paid for paid, owed in summary['totals'].values()))}"
+            if summary['modified'] is not None:
+                text += f" ({datetime.fromtimestamp(summary['modified']):%Y-%m-%d})"
+            summaries.append(text)
+        self.group_summary_label.configure(text=", ".join(summaries))
+
+    def set_buttons_state(self, state):
+        widgets = [self.root]
+        while widgets:
+            widget = widgets.pop()
+            if isinstance(widget, ctk.CTkButton):
+                widget.configure(state=state)
+            widgets.extend(widget.winfo_children())
+
+    def report_startup(self, event):
+        if not self.startup_probe:
+            return
+        print(json.dumps({'event': event, 'time': time.time(), 'expenses': len(self.ledger)}), flush=True)
+        if event == 'interactive':
+            self.on_close()
+
+    def on_ledger_change(self, op, data):
+        """Ledger listener: schedule the redraws and the save a change needs"""
+        if op == 'add_friend':
+            self.scheduler.mark('friends', 'totals', 'payments', 'reports')
+        elif op in ('rename_friend', 'remove_friends', 'reload'):
+            self.expense_changes = None
+            self.scheduler.mark('friends', 'expenses', 'totals', 'payments', 'reports', 'rules')
+        elif op in ('add_rule', 'update_rule', 'delete_rule'):
+            self.scheduler.mark('rules', 'totals', 'payments', 'reports')
+        else:
+            if op in ('clear_expenses', 'add_expenses'):
+                self.expense_changes = None
+            elif self.expense_changes is not None:
+                # Only the changed rows are looked at on the next redraw
+                expense_id = data['id'] if op == 'delete_expense' else data['expense']['id']
+                self.expense_changes[expense_id] = 'delete' if op == 'delete_expense' else 'put'
+            self.scheduler.mark('expenses', 'totals', 'payments', 'reports')
+        self.scheduler.mark('history')
+        self.scheduler.request_save()
+
+    def on_close(self):
+        # Write out anything still waiting for the debounced save or the writer thread
+        self.scheduler.flush_save()
+        self.cancel_export()
+        self.export = None  # Nothing to report once the window is going
+        self.export_worker.close()
+        self.worker.close()
+        self.groups.close()
+        self.root.destroy()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared Expense Tracker")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json",
+                        help="store the ledger as JSON files or in expenses.db (default: json)")
+    parser.add_argument("--profile", action="store_true",
+                        help="time the main handlers and show them in a performance window "
+                             "(also enabled by setting EXPENSES_PROFILE)")
+    parser.add_argument("--serve", action="store_true",
+                        help="serve the ledger as a JSON API on localhost instead of opening the window")
+    parser.add_argument("--port", type=int, default=None, help="port for --serve (default: 8765)")
+    args = parser.parse_args()
+
+    if args.serve:
+        from server import DEFAULT_PORT, serve
+        serve(".", port=args.port or DEFAULT_PORT, backend=args.backend)
+        raise SystemExit
+
+    root = ctk.CTk()
+    app = ExpenseTrackerApp(root, backend=args.backend,
+                            profile=args.profile or bool(os.environ.get(PROFILE)))
     root.mainloop()
\ No newline at end of file
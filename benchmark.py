@@ -0,0 +1,245 @@
+"""Headless benchmarks for the ledger, storage, settlement and export.
+
+Builds synthetic ledgers of each size and times every operation the app
+runs on them, CSV import included, reporting the best wall time of a few runs and the peak
+memory traced while it ran::
+
+    python benchmark.py                                  # 10k and 100k expenses
+    python benchmark.py --sizes 1000000 --runs 1
+    python benchmark.py --friends 40 --participants 2 5 --days 90
+    python benchmark.py --save-baseline baseline.json    # record a baseline
+    python benchmark.py --baseline baseline.json         # compare, exit 1 on regressions
+
+No display is needed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date as Date
+
+from columnar import ColumnarStore, np
+from exports import write_expenses_csv
+from imports import import_files
+from journal import JournalStore, file_stat
+from ledger import FILTER_CRITERIA, Ledger, serialize_record
+from settlement import STRATEGIES, settle
+
+
+SIZES = [10_000, 100_000]
+WORDS = ["dinner", "groceries", "taxi", "rent", "coffee", "movie", "fuel", "snacks", "hotel", "tickets"]
+
+
+def synthetic_records(count, friend_count=8, participants=(1, None), start="2024-01-01", days=3 * 365, seed=0):
+    """Random stored expenses (payer id, participant bitmask) over friends ``0..friend_count-1``.
+
+    Each expense has between ``participants[0]`` and ``participants[1]``
+    participants (None for everyone) and a date in the ``days`` days from
+    ``start``.
+    """
+    rng = random.Random(seed)
+    low, high = participants
+    high = min(high or friend_count, friend_count)
+    first_day = Date.fromisoformat(start).toordinal()
+    for expense_id in range(1, count + 1):
+        shared = rng.sample(range(friend_count), rng.randint(min(low, high), high))
+        yield {
+            'id': expense_id,
+            'date': Date.fromordinal(first_day + rng.randrange(days)).isoformat(),
+            'description': f"{rng.choice(WORDS)} {rng.choice(WORDS)} {expense_id}",
+            'amount': rng.randint(100, 500_000) / 100,
+            'payer': rng.randrange(friend_count),
+            'participants': sum(1 << participant for participant in shared),
+        }
+
+
+def synthetic_ledger(count, friend_count=8, **options):
+    """A ledger of ``count`` random expenses; ``options`` go to ``synthetic_records``"""
+    ledger = Ledger()
+    friends = [{'id': friend_id, 'name': f"Friend {friend_id + 1}"} for friend_id in range(friend_count)]
+    ledger.load(friends, synthetic_records(count, friend_count, **options), friend_count)
+    return ledger
+
+
+def measure(run, runs):
+    """Best wall time over ``runs`` calls, then the traced peak of one more call"""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_kib': peak / 1024}
+
+
+def cases(ledger, directory, operations=1000):
+    """Name -> callable for every benchmarked operation on ``ledger``.
+
+    The ledger is saved to a journal store in ``directory`` that records
+    its changes, as in the app, so the add, update and delete timings
+    include journaling them.
+    """
+    friends = ledger.friends
+    rng = random.Random(1)
+    store = JournalStore(directory, compact_every=10 ** 9)
+    store.ledger = ledger
+    ledger.subscribe(store.record)
+    store.compact()  # The snapshot the load case reads
+    updates = [{'op': 'update_expense', 'expense': serialize_record(record)}
+               for record in ledger.records()[:operations]]
+
+    def load():
+        JournalStore(directory).load(Ledger())
+
+    def load_and_filter():
+        # The snapshot is read lazily, the first filter builds the indexes
+        loaded = Ledger()
+        JournalStore(directory).load(loaded)
+        loaded.query_ids(description="taxi")
+
+    def save_snapshot():
+        store.write_batch(store.take_batch(snapshot=True))
+
+    def save_journal():
+        store.pending = list(updates)
+        store.write_batch(store.take_batch())
+        # Empty the journal again so the runs append to the same size
+        open(store.journal_path, "w").close()
+        store.journal_records = 0
+        store.version = (file_stat(store.snapshot_path), 0)
+
+    added = []
+
+    def add():
+        added.clear()
+        for _ in range(operations):
+            participants = rng.sample(friends, rng.randint(1, len(friends)))
+            added.append(ledger.add_expense("2026-06-15", "benchmark", 12.5, rng.choice(friends), participants)['id'])
+        store.pending.clear()
+
+    def update():
+        for expense_id in added:
+            ledger.update_expense(expense_id, "2026-06-16", "benchmark edit", 20, friends[0], friends)
+        store.pending.clear()
+
+    def delete():
+        ledger.delete_expenses(added)
+        store.pending.clear()
+        add()  # Put them back for the next run
+
+    def totals():
+        # What a reload recomputes: every friend's paid and owed from scratch
+        Ledger().load(ledger.registry.to_json(), ledger.records(), ledger.registry.next_id)
+
+    balances = ledger.balances()
+    columnar = {}
+    if np is not None:
+        # The same totals and filters over NumPy columns, for comparison
+        columns = ColumnarStore.from_ledger(ledger)
+        columnar = {
+            'columnar build': lambda: ColumnarStore.from_ledger(ledger),
+            'columnar totals': columns.totals,
+            'columnar filter combined': lambda: columns.select(
+                columns.mask(date="2025", description="taxi", participant=friends[1])),
+        }
+    return {
+        'load': load,
+        'load and first filter': load_and_filter,
+        'save snapshot': save_snapshot,
+        f'save journal ({len(updates)})': save_journal,
+        f'add ({operations})': add,
+        f'update ({operations})': update,
+        f'delete ({operations})': delete,
+        # The filters the app's filter bar offers, views included
+        **{f'filter {criteria.lower()}': (lambda criteria=criteria, value=value: ledger.filter(criteria, value))
+           for criteria, value in zip(FILTER_CRITERIA, ("", "2025-03", "groceries", friends[2], friends[4]))},
+        'filter date range': lambda: ledger.query_ids(date="2025-01-01..2025-06-30"),
+        'filter combined': lambda: ledger.query_ids(date="2025", description="taxi", participant=friends[1]),
+        'totals': ledger.totals,
+        'totals recomputed': totals,
+        **columnar,
+        **{f'settle {strategy}': (lambda strategy=strategy: settle(balances, strategy=strategy))
+           for strategy in STRATEGIES},
+        'csv export': lambda: write_expenses_csv(os.path.join(directory, "export.csv"), ledger),
+        # Reads back the export above, every row a duplicate
+        'csv import': lambda: import_files([os.path.join(directory, "export.csv")], friends, existing=ledger),
+    }
+
+
+def run_benchmarks(sizes, runs, **options):
+    results = {}
+    for size in sizes:
+        ledger = synthetic_ledger(size, **options)
+        with tempfile.TemporaryDirectory() as directory:
+            for name, run in cases(ledger, directory).items():
+                results[f"{name} @ {size}"] = measure(run, runs)
+                print(f"{name + ' @ ' + str(size):<36} {results[f'{name} @ {size}']['seconds'] * 1000:>10.2f} ms",
+                      file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold, min_ms=1.0):
+    """Print a table against the baseline, returns the names that got slower than ``threshold``.
+
+    Slowdowns under ``min_ms`` are timer noise and never count.
+    """
+    regressions = []
+    print(f"{'benchmark':<36} {'baseline':>10} {'current':>10} {'change':>8} {'peak KiB':>10}")
+    for name, result in results.items():
+        current = result['seconds'] * 1000
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<36} {'-':>10} {current:>9.2f}ms {'new':>8} {result['peak_kib']:>10.0f}")
+            continue
+        before = base['seconds'] * 1000
+        change = (current - before) / before if before else 0.0
+        flag = ""
+        if change > threshold and current - before >= min_ms:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<36} {before:>9.2f}ms {current:>9.2f}ms {change:>+8.0%} {result['peak_kib']:>10.0f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="ledger sizes to benchmark")
+    parser.add_argument("--friends", type=int, default=8, help="friends in each ledger")
+    parser.add_argument("--participants", type=int, nargs=2, default=(1, 0), metavar=("MIN", "MAX"),
+                        help="participants per expense (MAX 0 for everyone)")
+    parser.add_argument("--days", type=int, default=3 * 365, help="date span of the expenses in days")
+    parser.add_argument("--runs", type=int, default=3, help="runs per benchmark, the best is reported")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown that counts as a regression (default: 0.10, i.e. 10%%)")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.runs, friend_count=args.friends,
+                             participants=(args.participants[0], args.participants[1] or None), days=args.days)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold, args.min_ms)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
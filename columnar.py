@@ -0,0 +1,207 @@
+from datetime import date as Date
+
+from currency import DEFAULT_CURRENCY, RATES_FILE
+from indexes import date_bounds
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only this store needs it
+    np = None
+
+
+# Ordinal of 1970-01-01, where numpy's datetime64 counts from
+EPOCH_ORDINAL = Date(1970, 1, 1).toordinal()
+
+
+class ColumnarStore:
+    """Expenses held as NumPy columns, for vectorised totals and filters.
+
+    Amounts are int64 paise in the expense's currency, dates int32 day
+    ordinals, currencies indexes into ``currency_codes`` and payers int32
+    indexes into ``names``: the friends first, then anyone else the
+    expenses name, such as former friends, whose expenses count towards
+    the friends' totals as in the ledger. Participants are stored
+    CSR-style: the participants of expense ``i`` are
+    ``participant_ids[participant_ptr[i]:participant_ptr[i + 1]]``.
+    Per-friend totals, monthly sums and filter masks are each a handful
+    of array operations, so recomputing them over a million expenses takes
+    milliseconds. Totals are converted to one currency with ``rates``, as
+    the ledger's are. Requires NumPy.
+    """
+
+    def __init__(self, friends, names, ids, amounts, dates, currencies, currency_codes, payers, participant_ptr,
+                 participant_ids, descriptions, rates=None):
+        self.friends = list(friends)
+        self.names = list(names)
+        self.ids = ids
+        self.amounts = amounts
+        self.dates = dates
+        self.currencies = currencies
+        self.currency_codes = list(currency_codes)
+        self.payers = payers
+        self.participant_ptr = participant_ptr
+        self.participant_ids = participant_ids
+        self.descriptions = descriptions
+        self.rates = rates
+        self._date_strings = None
+        self._lower_descriptions = None
+
+    @classmethod
+    def from_records(cls, friends, expenses, rates=None):
+        """Build the columns from friend names and expense dicts, e.g. ``list(ledger)``.
+
+        Every expense is kept: payers and participants who are not in
+        ``friends`` are added to ``names`` after them.
+        """
+        if np is None:
+            raise ImportError("The columnar store needs NumPy: pip install numpy")
+
+        friends = list(friends)
+        expenses = list(expenses)
+        friend_index = {name: index for index, name in enumerate(friends)}
+        for expense in expenses:
+            for name in (expense['payer'], *expense['participants']):
+                if name not in friend_index:
+                    friend_index[name] = len(friend_index)
+        currency_index = {}
+
+        count = len(expenses)
+        ids = np.fromiter((expense['id'] for expense in expenses), dtype=np.int64, count=count)
+        amounts = np.fromiter((round(float(expense['amount']) * 100) for expense in expenses),
+                              dtype=np.int64, count=count)
+        dates = np.array([expense['date'] for expense in expenses], dtype='datetime64[D]')
+        dates = (dates.astype(np.int64) + EPOCH_ORDINAL).astype(np.int32)
+        currencies = np.fromiter(
+            (currency_index.setdefault(expense.get('currency') or DEFAULT_CURRENCY, len(currency_index))
+             for expense in expenses),
+            dtype=np.int32, count=count,
+        )
+        payers = np.fromiter((friend_index[expense['payer']] for expense in expenses),
+                             dtype=np.int32, count=count)
+
+        counts = np.fromiter((len(expense['participants']) for expense in expenses), dtype=np.int64, count=count)
+        participant_ptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(counts, out=participant_ptr[1:])
+        participant_ids = np.fromiter(
+            (friend_index[name] for expense in expenses for name in expense['participants']),
+            dtype=np.int32, count=int(participant_ptr[-1]),
+        )
+        descriptions = np.array([expense['description'] for expense in expenses], dtype=str)
+
+        return cls(friends, friend_index, ids, amounts, dates, currencies, currency_index, payers, participant_ptr,
+                   participant_ids, descriptions, rates)
+
+    @classmethod
+    def from_ledger(cls, ledger):
+        return cls.from_records(ledger.friends, ledger, ledger.rates)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Totals
+
+    def totals(self, mask=None, currency=DEFAULT_CURRENCY):
+        """Map each friend to ``(paid, owed)`` in ``currency``, optionally over the rows in ``mask`` only.
+
+        Raises ValueError when a currency has to be converted without a rate.
+        """
+        paid, owed = self._paid_owed_paise(mask, currency)
+        return {name: (paid[index] / 100, owed[index] / 100) for index, name in enumerate(self.friends)}
+
+    def balances(self, mask=None, currency=DEFAULT_CURRENCY):
+        paid, owed = self._paid_owed_paise(mask, currency)
+        balance = (paid - owed) / 100
+        return dict(zip(self.friends, balance.tolist()))
+
+    def monthly_totals(self, mask=None, currency=DEFAULT_CURRENCY):
+        """Map ``YYYY-MM`` to the total spent that month, in ``currency``"""
+        months = self._day_numbers().astype('datetime64[D]').astype('datetime64[M]')
+        amounts = self._amounts_in(currency)
+        if mask is not None:
+            months, amounts = months[mask], amounts[mask]
+        unique_months, inverse = np.unique(months, return_inverse=True)
+        sums = np.bincount(inverse, weights=amounts, minlength=len(unique_months))
+        return {str(month): total / 100 for month, total in zip(unique_months, sums.tolist())}
+
+    # Filters
+
+    def mask(self, date=None, description=None, payer=None, participant=None):
+        """Boolean row mask for the same filters as ``Ledger.query``, combined with AND"""
+        mask = np.ones(len(self), dtype=bool)
+        if date:
+            bounds = date_bounds(date)
+            date_strings = self.date_strings()
+            if bounds is not None:
+                low, high = bounds
+                if low:
+                    mask &= date_strings >= low
+                if high is not None:
+                    mask &= date_strings < high
+            else:
+                mask &= np.char.find(date_strings, date.lower()) >= 0
+        if description:
+            mask &= np.char.find(self.lower_descriptions(), description.lower()) >= 0
+        if payer:
+            mask &= np.isin(self.payers, self._matching_friends(payer))
+        if participant:
+            member = np.isin(self.participant_ids, self._matching_friends(participant))
+            # Rows with at least one matching participant
+            hits = np.add.reduceat(member, self.participant_ptr[:-1]) if len(self) else np.zeros(0, dtype=int)
+            counts = np.diff(self.participant_ptr)
+            mask &= (hits > 0) & (counts > 0)
+        return mask
+
+    def select(self, mask):
+        """Expense ids of the rows in ``mask``"""
+        return self.ids[mask].tolist()
+
+    def date_strings(self):
+        if self._date_strings is None:
+            self._date_strings = self._day_numbers().astype('datetime64[D]').astype(str)
+        return self._date_strings
+
+    def lower_descriptions(self):
+        if self._lower_descriptions is None:
+            self._lower_descriptions = np.char.lower(self.descriptions)
+        return self._lower_descriptions
+
+    # Internals
+
+    def _day_numbers(self):
+        return self.dates.astype(np.int64) - EPOCH_ORDINAL
+
+    def _matching_friends(self, value):
+        value = value.lower()
+        return np.array([index for index, name in enumerate(self.names) if value in name.lower()],
+                        dtype=np.int32)
+
+    def _amounts_in(self, currency):
+        """The amounts as float paise in ``currency``, converted at each expense's day's rate"""
+        amounts = self.amounts.astype(np.float64)
+        for index, code in enumerate(self.currency_codes):
+            if code == currency:
+                continue
+            if self.rates is None:
+                raise ValueError(f"No exchange rates to convert {code}, add them to {RATES_FILE}")
+            rows = self.currencies == index
+            # One rate lookup per day the currency was spent on, not per expense
+            days, inverse = np.unique(self.dates[rows], return_inverse=True)
+            factors = np.asarray(self.rates.factors(code, currency, days.tolist()), dtype=np.float64)
+            amounts[rows] *= factors[inverse]
+        return amounts
+
+    def _paid_owed_paise(self, mask=None, currency=DEFAULT_CURRENCY):
+        name_count = len(self.names)
+        amounts = self._amounts_in(currency)
+        counts = np.diff(self.participant_ptr)
+        shares = np.divide(amounts, counts, out=np.zeros_like(amounts), where=counts > 0)
+        payers = self.payers
+        if mask is not None:
+            amounts = np.where(mask, amounts, 0.0)
+            shares = np.where(mask, shares, 0.0)
+
+        paid = np.bincount(payers, weights=amounts, minlength=name_count)
+        owed = np.bincount(self.participant_ids, weights=np.repeat(shares, counts), minlength=name_count)
+        # Only friends have totals, the other names just keep their expenses' shares apart
+        friend_count = len(self.friends)
+        return paid[:friend_count], owed[:friend_count]
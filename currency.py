@@ -0,0 +1,163 @@
+import csv
+import os
+from bisect import bisect_right
+from datetime import date as Date
+
+from friends import mask_ids
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, rates are then looked up one day at a time
+    np = None
+
+
+DEFAULT_CURRENCY = "INR"
+SYMBOLS = {"INR": "₹", "USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥"}
+
+# Exchange rates shared by every group, in the working directory
+RATES_FILE = "fx_rates.csv"
+
+
+def format_amount(amount, currency=DEFAULT_CURRENCY):
+    symbol = SYMBOLS.get(currency)
+    return f"{symbol}{amount:.2f}" if symbol else f"{amount:.2f} {currency}"
+
+
+def normalize_currency(currency):
+    """A currency code as stored: upper case, the default when empty"""
+    currency = (currency or DEFAULT_CURRENCY).strip().upper()
+    if len(currency) != 3 or not currency.isalpha():
+        raise ValueError("Currency must be a three-letter code such as USD")
+    return currency
+
+
+class FxRates:
+    """Exchange rates by date, read from a CSV file of ``date,currency,rate`` rows.
+
+    A rate is how much of ``DEFAULT_CURRENCY`` one unit of the currency is
+    worth on that date. A day without its own rate uses the latest earlier
+    one, or the earliest one for days before the table starts. ``reload``
+    re-reads the file only when its size or modification time changed and
+    bumps ``version``, which callers use to drop converted totals.
+    """
+
+    def __init__(self, path=RATES_FILE):
+        self.path = path
+        self.version = 0
+        self.rates = {}  # currency -> (sorted day ordinals, rates)
+        self._stat = None
+        self.reload()
+
+    def currencies(self):
+        return sorted(set(self.rates) | {DEFAULT_CURRENCY})
+
+    def reload(self):
+        """Read the file again if it changed, returns whether it did"""
+        try:
+            stat = os.stat(self.path)
+            stat = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stat = None
+        if stat == self._stat:
+            return False
+        self._stat = stat
+
+        rows = {}
+        if stat is not None:
+            with open(self.path, "r", newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        ordinal = Date.fromisoformat(row['date'].strip()).toordinal()
+                        rows.setdefault(normalize_currency(row['currency']), {})[ordinal] = float(row['rate'])
+                    except (KeyError, AttributeError, ValueError):
+                        continue  # A malformed row is skipped rather than failing every conversion
+        self.rates = {}
+        for currency, by_day in rows.items():
+            ordinals = sorted(by_day)
+            self.rates[currency] = (ordinals, [by_day[ordinal] for ordinal in ordinals])
+        if np is not None:
+            self.rates = {currency: (np.array(ordinals, dtype=np.int64), np.array(rates))
+                          for currency, (ordinals, rates) in self.rates.items()}
+        self.version += 1
+        return True
+
+    def factors(self, currency, target, ordinals):
+        """Multipliers from ``currency`` to ``target`` for each day ordinal, in order"""
+        if currency == target:
+            return [1.0] * len(ordinals)
+        source_rates = self._series(currency, ordinals)
+        target_rates = self._series(target, ordinals)
+        if np is not None:
+            return (source_rates / target_rates).tolist()
+        return [source / target for source, target in zip(source_rates, target_rates)]
+
+    def _series(self, currency, ordinals):
+        if currency == DEFAULT_CURRENCY:
+            return np.ones(len(ordinals)) if np is not None else [1.0] * len(ordinals)
+        table = self.rates.get(currency)
+        if table is None:
+            raise ValueError(f"No exchange rate for {currency} in {self.path}")
+        days, rates = table
+        if np is not None:
+            # One binary search per day, all in C
+            positions = np.searchsorted(days, np.asarray(ordinals, dtype=np.int64), side='right') - 1
+            return rates[np.maximum(positions, 0)]
+        return [rates[max(bisect_right(days, ordinal) - 1, 0)] for ordinal in ordinals]
+
+
+class CurrencySums:
+    """Paid and owed per currency, day and friend, to convert totals at each day's rate.
+
+    Converting costs one rate lookup per currency and day plus one multiply
+    per friend with expenses on that day, however many expenses there
+    are. ``apply`` keeps the sums up to date as expenses change.
+    """
+
+    def __init__(self, records=()):
+        self.days = {}  # currency -> {day ordinal: {friend id: [paid, owed]}}
+        for record in records:
+            self.apply(record, 1)
+
+    def apply(self, record, sign):
+        by_day = self.days.setdefault(record['currency'], {})
+        ordinal = Date.fromisoformat(record['date']).toordinal()
+        day = by_day.get(ordinal)
+        if day is None:
+            day = by_day[ordinal] = {}
+        amount = sign * record['amount']
+        participants = mask_ids(record['participants'])
+        share = amount / len(participants)
+
+        sums = day.get(record['payer'])
+        if sums is None:
+            sums = day[record['payer']] = [0.0, 0.0]
+        sums[0] += amount
+        for participant in participants:
+            sums = day.get(participant)
+            if sums is None:
+                sums = day[participant] = [0.0, 0.0]
+            sums[1] += share
+
+    def add(self, currency, ordinal, friend_id, paid=0.0, owed=0.0):
+        """Add sums already grouped by currency, day and friend, e.g. from SQL"""
+        day = self.days.setdefault(currency, {}).setdefault(ordinal, {})
+        sums = day.get(friend_id)
+        if sums is None:
+            sums = day[friend_id] = [0.0, 0.0]
+        sums[0] += paid
+        sums[1] += owed
+
+    def convert(self, target, rates):
+        """``(paid, owed)`` dicts by friend id, converted into ``target``"""
+        paid = {}
+        owed = {}
+        for currency, by_day in self.days.items():
+            if rates is None and currency != target:
+                raise ValueError(f"No exchange rates to convert {currency}, add them to {RATES_FILE}")
+            ordinals = list(by_day)
+            factors = rates.factors(currency, target, ordinals) if currency != target else [1.0] * len(ordinals)
+            for ordinal, factor in zip(ordinals, factors):
+                for friend_id, (day_paid, day_owed) in by_day[ordinal].items():
+                    paid[friend_id] = paid.get(friend_id, 0.0) + day_paid * factor
+                    owed[friend_id] = owed.get(friend_id, 0.0) + day_owed * factor
+        return paid, owed
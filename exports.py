@@ -0,0 +1,97 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from itertools import islice
+
+from currency import DEFAULT_CURRENCY
+
+
+HEADER = ['Date', 'Description', 'Amount', 'Payer', 'Participants', 'Currency']
+CHUNK_SIZE = 10_000
+
+
+class ExportCancelled(Exception):
+    """Raised by ``write_expenses`` when it is cancelled, the target file is left as it was"""
+
+
+def export_format(file_path):
+    """``(format, gzipped)`` for a path: ``csv`` or ``jsonl``, compressed when it ends in ``.gz``"""
+    name = file_path.lower()
+    gzipped = name.endswith(".gz")
+    if gzipped:
+        name = name[:-3]
+    return ('jsonl' if name.endswith((".jsonl", ".ndjson")) else 'csv'), gzipped
+
+
+def write_expenses(file_path, expenses, total=None, progress=None, cancel=None, chunk_size=CHUNK_SIZE):
+    """Stream expenses to CSV or JSON lines, in the format ``export_format`` reads off the path.
+
+    ``expenses`` can be any iterable and is consumed ``chunk_size`` at a
+    time, so a lazy source keeps memory flat however many rows there are.
+    After each chunk ``progress(done, total)`` is called and the
+    ``cancel`` event checked. The rows go to a temporary file that only
+    replaces ``file_path`` once complete. Returns ``file_path``.
+    """
+    kind, gzipped = export_format(file_path)
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(file_path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as raw:
+            binary = gzip.GzipFile(fileobj=raw, mode="wb") if gzipped else raw
+            with io.TextIOWrapper(binary, encoding="utf-8", newline="") as file:
+                if kind == 'csv':
+                    writer = csv.writer(file)
+                    writer.writerow(HEADER)
+                    write_chunk = lambda chunk: writer.writerows(_csv_row(expense) for expense in chunk)
+                else:
+                    write_chunk = lambda chunk: file.writelines(_json_line(expense) for expense in chunk)
+
+                done = 0
+                expenses = iter(expenses)
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        raise ExportCancelled(file_path)
+                    chunk = list(islice(expenses, chunk_size))
+                    if not chunk:
+                        break
+                    write_chunk(chunk)
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, total)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return file_path
+
+
+def write_expenses_csv(file_path, expenses):
+    return write_expenses(file_path, expenses)
+
+
+def _csv_row(expense):
+    return [
+        expense['date'],
+        expense['description'],
+        expense['amount'],
+        expense['payer'],
+        ', '.join(expense['participants']),
+        expense.get('currency', DEFAULT_CURRENCY),
+    ]
+
+
+def _json_line(expense):
+    return json.dumps({
+        'date': expense['date'],
+        'description': expense['description'],
+        'amount': expense['amount'],
+        'payer': expense['payer'],
+        'participants': expense['participants'],
+        'currency': expense.get('currency', DEFAULT_CURRENCY),
+    }, ensure_ascii=False, separators=(",", ":")) + "\n"
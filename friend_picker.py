@@ -0,0 +1,202 @@
+import tkinter as tk
+from tkinter import simpledialog, ttk
+
+
+class FriendPicker(ttk.Frame):
+    """Searchable multi-select list of friends that only renders the matches in view.
+
+    A fixed pool of ``rows`` x ``columns`` checkbuttons is made once and
+    relabelled as the list scrolls or the search changes, so showing five
+    hundred friends costs the same as showing five. ``set_friends`` keeps
+    the selection of everyone still there and only touches the pool.
+
+    Presets are named lists of friends; ``on_presets_change(presets)`` is
+    called whenever one is saved or deleted, to store them.
+    """
+
+    def __init__(self, master, rows=3, columns=4, on_presets_change=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.rows = rows
+        self.columns = columns
+        self.on_presets_change = on_presets_change
+        self.friends = []
+        self.selected = set()
+        self.matches = []  # Friends matching the search, in friend order
+        self.first = 0  # First row of matches in view
+        self.presets = {}
+
+        bar = ttk.Frame(self)
+        bar.grid(row=0, column=0, columnspan=2, sticky="ew")
+        ttk.Label(bar, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self._filter())
+        ttk.Entry(bar, textvariable=self.search_var, width=14).pack(side=tk.LEFT, padx=5)
+        ttk.Button(bar, text="All", width=4, command=self.select_all).pack(side=tk.LEFT)
+        ttk.Button(bar, text="None", width=5, command=self.clear).pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(bar, text="Preset:").pack(side=tk.LEFT)
+        self.preset_var = tk.StringVar()
+        self.preset_box = ttk.Combobox(bar, textvariable=self.preset_var, state="readonly", width=12)
+        self.preset_box.pack(side=tk.LEFT, padx=5)
+        self.preset_box.bind('<<ComboboxSelected>>', lambda event: self.apply_preset(self.preset_var.get()))
+        ttk.Button(bar, text="Save", width=5, command=self.save_preset).pack(side=tk.LEFT)
+        ttk.Button(bar, text="Delete", width=6, command=self.delete_preset).pack(side=tk.LEFT, padx=2)
+
+        pool = ttk.Frame(self)
+        pool.grid(row=1, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+        self.slots = []  # (checkbutton, variable), reused for whichever friends are in view
+        for index in range(rows * columns):
+            var = tk.BooleanVar()
+            button = ttk.Checkbutton(pool, variable=var, command=lambda index=index: self._toggle(index))
+            button.grid(row=index // columns, column=index % columns, sticky="w", padx=5)
+            self.slots.append((button, var))
+        for widget in [pool] + [button for button, var in self.slots]:
+            widget.bind('<MouseWheel>', lambda event: self._scroll(-1 if event.delta > 0 else 1))
+            widget.bind('<Button-4>', lambda event: self._scroll(-1))
+            widget.bind('<Button-5>', lambda event: self._scroll(1))
+
+        self.status_label = ttk.Label(self, text="")
+        self.status_label.grid(row=2, column=0, sticky="w")
+        self.columnconfigure(0, weight=1)
+
+    # Friends and selection
+
+    def set_friends(self, names):
+        """Show a new friend list; friends added at the end or removed are applied as such"""
+        names = list(names)
+        old = self.friends
+        if names[:len(old)] == old:
+            self.add(names[len(old):])
+            return
+        removed = set(old) - set(names)
+        if len(names) == len(old) - len(removed) and all(friend not in removed for friend in names):
+            self.remove(removed)
+            return
+        # Renamed or reordered
+        self.friends = names
+        self.selected &= set(names)
+        self._filter()
+
+    def add(self, names):
+        if not names:
+            return
+        self.friends = self.friends + list(names)
+        text = self.search_var.get().strip().lower()
+        self.matches.extend(friend for friend in names if text in friend.lower())
+        self._render()
+
+    def remove(self, names):
+        names = set(names)
+        if not names:
+            return
+        self.friends = [friend for friend in self.friends if friend not in names]
+        self.matches = [friend for friend in self.matches if friend not in names]
+        self.selected -= names
+        self._scroll_to(self.first)
+
+    def selection(self):
+        """The selected friends, in friend order"""
+        return [friend for friend in self.friends if friend in self.selected]
+
+    def select(self, names):
+        self.selected = set(names) & set(self.friends)
+        self._render()
+
+    def clear(self):
+        self.select(())
+
+    def select_all(self):
+        """Select every friend matching the search, keeping the others as they are"""
+        self.selected.update(self.matches)
+        self._render()
+
+    # Presets
+
+    def set_presets(self, presets):
+        self.presets = dict(presets)
+        self.preset_box.configure(values=sorted(self.presets))
+        self.preset_var.set("")
+
+    def apply_preset(self, name):
+        self.select(self.presets.get(name, ()))
+
+    def save_preset(self):
+        selected = self.selection()
+        if not selected:
+            return
+        name = simpledialog.askstring("Save Preset", "Preset name:", parent=self,
+                                      initialvalue=self.preset_var.get())
+        if not name or not name.strip():
+            return
+        self.presets[name.strip()] = selected
+        self._presets_changed(name.strip())
+
+    def delete_preset(self):
+        name = self.preset_var.get()
+        if self.presets.pop(name, None) is not None:
+            self._presets_changed("")
+
+    # Scrolling
+
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            self._scroll_to(round(float(args[1]) * self._total_rows()))
+        elif args[0] == 'scroll':
+            self._scroll(int(args[1]) * (self.rows if args[2] == 'pages' else 1))
+
+    # Internals
+
+    def _presets_changed(self, current):
+        self.preset_box.configure(values=sorted(self.presets))
+        self.preset_var.set(current)
+        if self.on_presets_change is not None:
+            self.on_presets_change(dict(self.presets))
+
+    def _filter(self):
+        text = self.search_var.get().strip().lower()
+        self.matches = [friend for friend in self.friends if text in friend.lower()] if text else list(self.friends)
+        self._scroll_to(self.first)
+
+    def _total_rows(self):
+        return -(-len(self.matches) // self.columns)
+
+    def _scroll(self, rows):
+        self._scroll_to(self.first + rows)
+
+    def _scroll_to(self, first):
+        self.first = max(0, min(first, self._total_rows() - self.rows))
+        self._render()
+
+    def _render(self):
+        start = self.first * self.columns
+        for index, (button, var) in enumerate(self.slots):
+            position = start + index
+            if position < len(self.matches):
+                friend = self.matches[position]
+                button.configure(text=friend)
+                var.set(friend in self.selected)
+                button.grid()
+            else:
+                button.grid_remove()
+
+        total = self._total_rows()
+        if total > self.rows:
+            self.scrollbar.set(self.first / total, (self.first + self.rows) / total)
+        else:
+            self.scrollbar.set(0, 1)
+        self._show_status()
+
+    def _show_status(self):
+        text = f"{len(self.selected)} of {len(self.friends)} selected"
+        if len(self.matches) != len(self.friends):
+            text += f", {len(self.matches)} shown"
+        self.status_label.configure(text=text)
+
+    def _toggle(self, index):
+        friend = self.matches[self.first * self.columns + index]
+        if self.slots[index][1].get():
+            self.selected.add(friend)
+        else:
+            self.selected.discard(friend)
+        self._show_status()
@@ -0,0 +1,95 @@
+def mask_ids(mask):
+    """Friend ids set in a participant bitmask, lowest first"""
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+    return ids
+
+
+class FriendRegistry:
+    """Interns friend names to stable integer ids.
+
+    Expenses refer to friends by id, so renaming a friend is one update
+    here instead of a rewrite of every expense, and the participants of an
+    expense fit in a bitmask of ids. ``names`` holds the current friends
+    in display order. Files from before friends were interned could name
+    people who were never added as friends; those keep an id in
+    ``former`` so their expenses still display, but they are not friends.
+    """
+
+    def __init__(self):
+        self.ids = {}  # name -> id
+        self.names = {}  # id -> name, in display order
+        self.former = {}  # id -> name of people who are not friends
+        self.former_ids = {}
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names.values())
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def add(self, name, friend_id=None):
+        friend_id = self._allocate(friend_id)
+        self.ids[name] = friend_id
+        self.names[friend_id] = name
+        return friend_id
+
+    def add_former(self, name, friend_id=None):
+        if friend_id is None and name in self.former_ids:
+            return self.former_ids[name]
+        friend_id = self._allocate(friend_id)
+        self.former_ids[name] = friend_id
+        self.former[friend_id] = name
+        return friend_id
+
+    def remove(self, friend_id):
+        del self.ids[self.names.pop(friend_id)]
+
+    def rename(self, friend_id, new_name):
+        del self.ids[self.names[friend_id]]
+        self.ids[new_name] = friend_id
+        self.names[friend_id] = new_name  # Existing key, so the order is kept
+
+    def name(self, friend_id):
+        name = self.names.get(friend_id)
+        return name if name is not None else self.former.get(friend_id)
+
+    def mask(self, names):
+        mask = 0
+        for name in names:
+            mask |= 1 << self.ids[name]
+        return mask
+
+    def names_in(self, mask):
+        return [self.name(friend_id) for friend_id in mask_ids(mask)]
+
+    def load(self, friends, next_id=0):
+        """Load saved friends, either plain names or ``{'id', 'name'}`` dicts"""
+        self.__init__()
+        for friend in friends:
+            if not isinstance(friend, dict):
+                if friend not in self.ids:
+                    self.add(friend)
+            elif friend.get('former'):
+                self.add_former(friend['name'], friend['id'])
+            else:
+                self.add(friend['name'], friend['id'])
+        self.next_id = max(self.next_id, next_id)
+
+    def to_json(self):
+        friends = [{'id': friend_id, 'name': name} for friend_id, name in self.names.items()]
+        friends += [{'id': friend_id, 'name': name, 'former': True} for friend_id, name in self.former.items()]
+        return friends
+
+    def _allocate(self, friend_id):
+        if friend_id is None:
+            friend_id = self.next_id
+        self.next_id = max(self.next_id, friend_id + 1)
+        return friend_id
@@ -0,0 +1,131 @@
+import os
+from collections import OrderedDict
+
+from currency import DEFAULT_CURRENCY
+
+
+DEFAULT_GROUP = "Default"
+
+# Files a group's ledger may be kept in, for its last-modified time
+LEDGER_FILES = ("expenses.snap", "expenses.journal", "friends.json", "expenses.json",
+                "expenses.db", "expenses.db-wal")
+
+
+def last_modified(directory):
+    """Newest modification time of a group's ledger files, or None if it has none"""
+    times = []
+    for name in LEDGER_FILES:
+        try:
+            times.append(os.path.getmtime(os.path.join(directory, name)))
+        except OSError:
+            pass
+    return max(times) if times else None
+
+
+def ledger_totals(ledger):
+    """A group's totals in the default currency, or None if they need a rate that is missing"""
+    try:
+        return ledger.totals(DEFAULT_CURRENCY)
+    except ValueError:
+        return None
+
+
+class GroupManager:
+    """Separate ledgers for separate groups, with the recently used ones kept in memory.
+
+    The default group lives in ``base_directory`` itself, so an existing
+    ledger there becomes the default group, and every other group in
+    ``groups/<name>/`` below it. Up to ``cache_size`` loaded groups are
+    kept as ``(ledger, store)`` pairs, least recently used first out; an
+    evicted group is handed to ``close_group(name, ledger, store)`` and
+    only its summary is kept. ``peek_group(directory)`` may return a
+    group's totals without loading it, e.g. ``JournalStore.peek``.
+    """
+
+    def __init__(self, close_group, base_directory=".", cache_size=3, peek_group=None):
+        self.close_group = close_group
+        self.base_directory = base_directory
+        self.groups_directory = os.path.join(base_directory, "groups")
+        self.cache_size = cache_size
+        self.peek_group = peek_group
+        self.loaded = OrderedDict()  # name -> (ledger, store), least recently used first
+        self.summaries = {}  # name -> {'totals', 'modified'} for groups not in memory
+
+    def names(self):
+        names = []
+        if os.path.isdir(self.groups_directory):
+            names = sorted(entry.name for entry in os.scandir(self.groups_directory)
+                           if entry.is_dir() and entry.name != DEFAULT_GROUP)
+        return [DEFAULT_GROUP] + names
+
+    def directory(self, name):
+        if name == DEFAULT_GROUP:
+            return self.base_directory
+        return os.path.join(self.groups_directory, name)
+
+    def create(self, name):
+        name = name.strip()
+        if not name:
+            raise ValueError("Please enter a group name")
+        if name in (".", "..") or os.sep in name or (os.altsep and os.altsep in name):
+            raise ValueError(f"Invalid group name: {name}")
+        if name in self.names():
+            raise ValueError(f"Group {name} already exists")
+        os.makedirs(self.directory(name))
+        return name
+
+    def get(self, name):
+        """The loaded ``(ledger, store)`` of a group, or None if it is not in memory"""
+        group = self.loaded.get(name)
+        if group is not None:
+            self.loaded.move_to_end(name)
+        return group
+
+    def add(self, name, ledger, store, keep=()):
+        """Keep a freshly loaded group, evicting the least recently used beyond the cache size.
+
+        Groups named in ``keep``, such as the active one, are never evicted.
+        """
+        self.loaded[name] = (ledger, store)
+        self.loaded.move_to_end(name)
+        self.summaries.pop(name, None)
+
+        for old_name in list(self.loaded):
+            if len(self.loaded) <= self.cache_size:
+                break
+            if old_name == name or old_name in keep:
+                continue
+            old_ledger, old_store = self.loaded.pop(old_name)
+            self.summaries[old_name] = {'totals': ledger_totals(old_ledger), 'modified': None}
+            self.close_group(old_name, old_ledger, old_store)
+            # Closing writes out the last changes, so read the time afterwards
+            self.summaries[old_name]['modified'] = last_modified(self.directory(old_name))
+
+    def discard(self, name, store):
+        """Forget a loaded group without closing it, if ``store`` is still its store; returns whether it was.
+
+        For a group whose files changed under it, closing would write over them.
+        """
+        group = self.loaded.get(name)
+        if group is None or group[1] is not store:
+            return False
+        del self.loaded[name]
+        return True
+
+    def summary(self, name):
+        """``{'totals', 'modified'}`` for a group, totals in the default currency or None if unknown"""
+        group = self.loaded.get(name)
+        if group is not None:
+            return {'totals': ledger_totals(group[0]), 'modified': last_modified(self.directory(name))}
+        summary = self.summaries.get(name)
+        if summary is None:
+            directory = self.directory(name)
+            totals = self.peek_group(directory) if self.peek_group is not None else None
+            summary = self.summaries[name] = {'totals': totals, 'modified': last_modified(directory)}
+        return summary
+
+    def close(self):
+        """Close every group still in memory"""
+        while self.loaded:
+            name, (ledger, store) = self.loaded.popitem(last=False)
+            self.close_group(name, ledger, store)
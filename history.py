@@ -0,0 +1,284 @@
+import json
+import os
+import tempfile
+from collections import deque
+
+from currency import DEFAULT_CURRENCY
+
+
+class History:
+    """Bounded undo and redo for the changes made to a ledger.
+
+    Each command is a list of invertible deltas: ``['expense', before,
+    after]`` with the expense as it was and as it became (None when it did
+    not exist), ``['rule', before, after]`` likewise for recurring rules,
+    and ``['friend', old_name, new_name]`` for friends added, renamed or
+    removed. Undo and redo apply them through ``put_expense``
+    and ``delete_expense``, which add or take back only that expense's
+    paid and owed shares and index entries, so nothing is recomputed from
+    the whole ledger.
+
+    At most ``limit`` commands holding ``max_expenses`` expense deltas in
+    total are kept, oldest first out; the newest command is always kept,
+    so even clearing a large ledger can be undone. Every change to the
+    history is also queued in ``log`` as a line for ``HistoryLog``.
+    """
+
+    def __init__(self, limit=100, max_expenses=100_000):
+        self.limit = limit
+        self.max_expenses = max_expenses
+        self.done = deque()  # Oldest first
+        self.undone = []  # Next to redo last
+        self.size = 0  # Expense deltas held in both stacks
+        self.log = []
+
+    def can_undo(self):
+        return bool(self.done)
+
+    def can_redo(self):
+        return bool(self.undone)
+
+    def undo_label(self):
+        return self.done[-1]['label'] if self.done else None
+
+    def redo_label(self):
+        return self.undone[-1]['label'] if self.undone else None
+
+    # Commands, each runs one ledger operation and remembers how to revert it
+
+    def add_friend(self, ledger, name):
+        added = ledger.add_friend(name)
+        if added:
+            self.push("Add friend", [['friend', None, name.strip()]])
+        return added
+
+    def rename_friend(self, ledger, old_name, new_name):
+        renamed = ledger.rename_friend(old_name, new_name)
+        if renamed:
+            self.push("Rename friend", [['friend', old_name, new_name.strip()]])
+        return renamed
+
+    def remove_friends(self, ledger, names):
+        names = [name for name in names if name in ledger.friends]
+        rules = [rule for rule in ledger.rules_list()
+                 if rule['payer'] in names or any(participant in names for participant in rule['participants'])]
+        removed = ledger.remove_friends(names)
+        # The expenses go before the friends, so undo brings the friends back first
+        changes = [['expense', expense, None] for expense in removed]
+        changes += [['rule', rule, None] for rule in rules]
+        changes += [['friend', name, None] for name in names]
+        self.push("Delete friends", changes)
+        return removed
+
+    def add_expense(self, ledger, date, description, amount, payer, participants, currency=DEFAULT_CURRENCY):
+        expense = ledger.add_expense(date, description, amount, payer, participants, currency)
+        self.push("Add expense", [['expense', None, expense]])
+        return expense
+
+    def add_expenses(self, ledger, expenses):
+        added = ledger.add_expenses(expenses)
+        self.push("Import expenses", [['expense', None, expense] for expense in added])
+        return added
+
+    def update_expense(self, ledger, expense_id, date, description, amount, payer, participants,
+                       currency=DEFAULT_CURRENCY):
+        before = ledger.get(expense_id)
+        expense = ledger.update_expense(expense_id, date, description, amount, payer, participants, currency)
+        self.push("Edit expense", [['expense', before, expense]])
+        return expense
+
+    def delete_expenses(self, ledger, expense_ids):
+        removed = ledger.delete_expenses(expense_ids)
+        self.push("Delete expenses", [['expense', expense, None] for expense in removed])
+        return removed
+
+    def clear_expenses(self, ledger):
+        removed = list(ledger)
+        ledger.clear_expenses()
+        self.push("Clear all expenses", [['expense', expense, None] for expense in removed])
+        return removed
+
+    def add_rule(self, ledger, start, frequency, interval, until, description, amount, payer, participants,
+                 currency=DEFAULT_CURRENCY):
+        rule = ledger.add_rule(start, frequency, interval, until, description, amount, payer, participants, currency)
+        self.push("Add recurring expense", [['rule', None, rule]])
+        return rule
+
+    def delete_rule(self, ledger, rule_id):
+        rule = ledger.delete_rule(rule_id)
+        self.push("Delete recurring expense", [['rule', rule, None]])
+        return rule
+
+    def materialize(self, ledger, rule_id, date):
+        before = ledger.get_rule(rule_id)
+        expense = ledger.materialize(rule_id, date)
+        self.push("Edit occurrence", [['rule', before, ledger.get_rule(rule_id)], ['expense', None, expense]])
+        return expense
+
+    # Undo and redo
+
+    def undo(self, ledger):
+        """Revert the last command, returns its label or None if there is none"""
+        if not self.done:
+            return None
+        command = self.done.pop()
+        self.undone.append(command)
+        self.log.append({'undo': None})
+        self._apply(ledger, reversed(command['changes']), undo=True)
+        return command['label']
+
+    def redo(self, ledger):
+        """Apply the last undone command again, returns its label or None if there is none"""
+        if not self.undone:
+            return None
+        command = self.undone.pop()
+        self.done.append(command)
+        self.log.append({'redo': None})
+        self._apply(ledger, command['changes'], undo=False)
+        return command['label']
+
+    def push(self, label, changes):
+        if not changes:
+            return
+        command = {'label': label, 'changes': changes}
+        self.log.append({'do': command})
+        self._push(command)
+
+    def replay(self, line):
+        """Apply one saved line to the stacks only, the ledger already has its effect"""
+        if 'do' in line:
+            self._push(line['do'])
+        elif 'undo' in line and self.done:
+            self.undone.append(self.done.pop())
+        elif 'redo' in line and self.undone:
+            self.done.append(self.undone.pop())
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+        self.size = 0
+
+    def lines(self):
+        """The whole history as saved lines: every command done, then the undone ones undone"""
+        lines = [{'do': command} for command in self.done]
+        lines += [{'do': command} for command in reversed(self.undone)]
+        lines += [{'undo': None}] * len(self.undone)
+        return lines
+
+    def _push(self, command):
+        # A new command ends the redo branch
+        self.size -= sum(self._expenses(undone) for undone in self.undone)
+        self.undone.clear()
+        self.done.append(command)
+        self.size += self._expenses(command)
+        while len(self.done) > 1 and (len(self.done) > self.limit or self.size > self.max_expenses):
+            self.size -= self._expenses(self.done.popleft())
+
+    @staticmethod
+    def _expenses(command):
+        return sum(1 for change in command['changes'] if change[0] == 'expense')
+
+    @staticmethod
+    def _apply(ledger, changes, undo):
+        for kind, before, after in changes:
+            if undo:
+                before, after = after, before
+            if kind == 'friend':
+                if before is None:
+                    ledger.add_friend(after)
+                elif after is None:
+                    ledger.remove_friends([before])
+                elif before in ledger.friends:
+                    ledger.rename_friend(before, after)
+            elif kind == 'rule':
+                if after is not None:
+                    ledger.put_rule(after)
+                elif before['id'] in ledger.rules:
+                    ledger.delete_rule(before['id'])
+            elif after is not None:
+                ledger.put_expense(after)
+            elif before['id'] in ledger:
+                ledger.delete_expense(before['id'])
+
+
+class HistoryLog:
+    """Keeps a ``History`` in a file next to the ledger, so undo survives a restart.
+
+    The file holds one JSON line per change to the history, appended like
+    the journal; once it has ``rewrite_every`` lines it is rewritten with
+    just the commands still held.
+    """
+
+    def __init__(self, path, rewrite_every=500):
+        self.path = path
+        self.rewrite_every = rewrite_every
+        self.lines_written = 0
+        self.needs_rewrite = False
+
+    def load(self, history):
+        history.clear()
+        self.lines_written = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    history.replay(json.loads(line))
+                except ValueError:
+                    break  # A line cut short by a crash, and nothing after it
+                self.lines_written += 1
+        history.log = []
+
+    def take_batch(self, history):
+        """The lines to write since the last batch, or None if the history has not changed"""
+        if not history.log and not self.needs_rewrite:
+            return None
+        lines, history.log = history.log, []
+        self.lines_written += len(lines)
+        if self.needs_rewrite or self.lines_written >= self.rewrite_every:
+            self.needs_rewrite = False
+            lines = history.lines()
+            self.lines_written = len(lines)
+            return {'rewrite': True, 'lines': lines}
+        return {'rewrite': False, 'lines': lines}
+
+    def write_batch(self, batch):
+        text = "".join(json.dumps(line, separators=(",", ":")) + "\n" for line in batch['lines'])
+        if batch['rewrite']:
+            self._replace(text)
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_failed(self):
+        """Lines were lost, so the next batch rewrites the whole file"""
+        self.needs_rewrite = True
+
+    @staticmethod
+    def merge_batches(older, newer):
+        if older is None or newer is None:
+            return newer or older
+        if newer['rewrite']:
+            return newer
+        return {'rewrite': older['rewrite'], 'lines': older['lines'] + newer['lines']}
+
+    def _replace(self, text):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
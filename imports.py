@@ -0,0 +1,240 @@
+"""Bulk import of expenses from CSV files.
+
+Reads the CSV layout the app exports and bank statement layouts, built
+in or configured in ``import_layouts.json``::
+
+    {"My bank": {"skip_lines": 12, "date": "Txn Date", "date_format": "%d/%m/%y",
+                 "description": "Narration", "debit": "Withdrawal Amt."}}
+
+A layout maps the fields of an expense to column headings: ``date``
+(parsed with ``date_format``), ``description``, and either ``amount`` or
+``debit``, where rows without a debit are credits and skipped. ``payer``,
+``participants`` (comma separated names) and ``currency`` are optional,
+in the layout and in the file: a file matches a layout when the heading
+row has its date, description and amount or debit columns, and a row
+without a payer, participants or currency, or a file without those
+columns, gets the payer and participants given to the import and the
+layout's ``default_currency``. ``skip_lines`` drops a preamble before the
+heading row and ``delimiter`` defaults to a comma.
+
+Rows are parsed and checked in chunks on a process pool. A row is a
+duplicate when its file holds no more copies of it (same date, amount,
+payer, description and participants) than the ledger and the files
+before it already do, so overlapping statements import each expense
+once while two identical coffees on one statement stay two::
+
+    python imports.py statements/*.csv --payer Asha --participants Asha Ben
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from currency import DEFAULT_CURRENCY
+from ledger import validate_expense
+
+
+LAYOUTS_FILE = "import_layouts.json"
+CHUNK_SIZE = 5000
+# Fewer rows than this are checked in this process, starting a pool would take longer
+POOL_ROWS = 20_000
+
+LAYOUTS = {
+    # What the app exports
+    'app': {'date': 'Date', 'description': 'Description', 'amount': 'Amount', 'payer': 'Payer',
+            'participants': 'Participants', 'currency': 'Currency'},
+    'bank': {'date': 'Date', 'date_format': '%d/%m/%Y', 'description': 'Description', 'debit': 'Debit'},
+}
+
+
+def load_layouts(path=LAYOUTS_FILE):
+    """The built-in layouts plus those configured in ``path``, which win on a name clash"""
+    layouts = dict(LAYOUTS)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            layouts.update(json.load(f))
+    return layouts
+
+
+def detect_layout(path, layouts):
+    """Name of the first layout whose required columns are in the heading row of ``path``, or None.
+
+    The required columns are the date, the description and the amount or
+    debit; payer, participants and currency may be missing, as in exports
+    from before expenses had a currency.
+    """
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        lines = [f.readline() for _ in range(max(layout.get('skip_lines', 0) for layout in layouts.values()) + 1)]
+    for name, layout in layouts.items():
+        line = lines[layout.get('skip_lines', 0)]
+        header = {column.strip() for column in next(csv.reader([line], delimiter=layout.get('delimiter', ",")), [])}
+        columns = [layout.get(field) for field in ('date', 'description', 'amount', 'debit')]
+        if all(column in header for column in columns if column):
+            return name
+    return None
+
+
+def expense_hash(expense):
+    """Content hash of an expense for spotting duplicates, ignoring case and spacing in the description"""
+    key = "\x1f".join([
+        expense['date'],
+        f"{float(expense['amount']):.2f}",
+        expense['payer'],
+        " ".join(expense['description'].split()).casefold(),
+        "\x1e".join(sorted(expense['participants'])),
+    ])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def parse_rows(job):
+    """Check one chunk of rows, returns ``([(hash, expense)], [error])``.
+
+    ``job`` is ``(path, first_line, header, rows, layout, friends, payer,
+    participants)``; runs in a pool process, so it only takes plain data.
+    """
+    path, first_line, header, rows, layout, friends, payer, participants = job
+    friends = set(friends)
+    columns = {field: header.index(layout[field]) for field in
+               ('date', 'description', 'amount', 'debit', 'payer', 'participants', 'currency')
+               if layout.get(field) in header}
+    date_format = layout.get('date_format', "%Y-%m-%d")
+    default_currency = layout.get('default_currency', DEFAULT_CURRENCY)
+
+    parsed = []
+    errors = []
+    for line, row in enumerate(rows, first_line):
+        if not any(cell.strip() for cell in row):
+            continue
+        cells = {field: row[column].strip() if column < len(row) else "" for field, column in columns.items()}
+        amount = cells.get('amount', cells.get('debit', "")).replace(",", "")
+        if not amount and 'debit' in cells:
+            continue  # A credit on a bank statement
+        # Blank cells fall back to the import's payer and participants, as missing columns do
+        row_participants = [name.strip() for name in cells.get('participants', "").split(",") if name.strip()]
+        try:
+            date = cells['date']
+            if date_format != "%Y-%m-%d":
+                date = datetime.strptime(date, date_format).strftime("%Y-%m-%d")
+            expense = validate_expense(
+                date,
+                cells['description'],
+                amount,
+                cells.get('payer') or payer,
+                row_participants or participants,
+                friends,
+                cells.get('currency') or default_currency,
+            )
+        except ValueError as e:
+            errors.append(f"{os.path.basename(path)}:{line}: {e}")
+            continue
+        parsed.append((expense_hash(expense), expense))
+    return parsed, errors
+
+
+def read_chunks(path, layouts, layout_name=None, chunk_size=CHUNK_SIZE):
+    """Yield ``(first_line, header, rows, layout)`` chunks of a file, detecting its layout if not given"""
+    name = layout_name or detect_layout(path, layouts)
+    if name is None:
+        raise ValueError(f"{os.path.basename(path)}: no import layout matches its columns")
+    layout = layouts[name]
+    skip = layout.get('skip_lines', 0)
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        for _ in range(skip):
+            f.readline()
+        reader = csv.reader(f, delimiter=layout.get('delimiter', ","))
+        header = [column.strip() for column in next(reader, [])]
+
+        rows = []
+        first_line = skip + 2
+        for row in reader:
+            rows.append(row)
+            if len(rows) == chunk_size:
+                yield first_line, header, rows, layout
+                first_line = skip + 2 + reader.line_num - 1
+                rows = []
+        if rows:
+            yield first_line, header, rows, layout
+
+
+def import_files(paths, friends, payer=None, participants=(), existing=(), layout=None, layouts=None,
+                 processes=None):
+    """Parse, check and deduplicate CSV files, without touching a ledger.
+
+    ``existing`` are the expenses already in the ledger, as views with
+    friend names. Returns ``{'expenses', 'duplicates', 'errors'}``, the
+    expenses ready for ``Ledger.add_expenses`` in file order.
+    """
+    layouts = layouts if layouts is not None else load_layouts()
+    friends = list(friends)
+    participants = list(participants)
+    errors = []
+    jobs = []
+    for path in paths:
+        try:
+            for first_line, header, rows, file_layout in read_chunks(path, layouts, layout):
+                jobs.append((path, first_line, header, rows, file_layout, friends, payer, participants))
+        except (OSError, ValueError, csv.Error) as e:
+            errors.append(str(e))
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or sum(len(job[3]) for job in jobs) < POOL_ROWS:
+        results = map(parse_rows, jobs)
+        chunks = list(zip(jobs, results))
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            chunks = list(zip(jobs, pool.map(parse_rows, jobs)))
+
+    seen = Counter(expense_hash(expense) for expense in existing)
+    expenses = []
+    duplicates = 0
+    path = None
+    in_file = Counter()
+    for job, (parsed, chunk_errors) in chunks:
+        if job[0] != path:
+            # Copies within one file are real, across files they are the same expense
+            for key, copies in in_file.items():
+                seen[key] = max(seen[key], copies)
+            path, in_file = job[0], Counter()
+        errors.extend(chunk_errors)
+        for key, expense in parsed:
+            in_file[key] += 1
+            if in_file[key] > seen[key]:
+                expenses.append(expense)
+            else:
+                duplicates += 1
+    return {'expenses': expenses, 'duplicates': duplicates, 'errors': errors}
+
+
+def main():
+    from journal import JournalStore
+    from ledger import Ledger
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="CSV files to import")
+    parser.add_argument("--directory", default=".", help="ledger to import into (default: the working directory)")
+    parser.add_argument("--layout", help="layout of every file, detected from the headings by default")
+    parser.add_argument("--payer", help="payer of rows without one")
+    parser.add_argument("--participants", nargs="+", default=[], help="participants of rows without them")
+    args = parser.parse_args()
+
+    ledger = Ledger()
+    store = JournalStore(args.directory)
+    store.load(ledger)
+    result = import_files(args.files, ledger.friends, args.payer, args.participants, ledger,
+                          layout=args.layout, layouts=load_layouts(os.path.join(args.directory, LAYOUTS_FILE)))
+    for error in result['errors']:
+        print(error, file=sys.stderr)
+    if result['expenses']:
+        store.history.add_expenses(ledger, result['expenses'])
+    store.close()
+    print(f"Imported {len(result['expenses'])} expenses, skipped {result['duplicates']} duplicates "
+          f"and {len(result['errors'])} bad rows")
+
+
+if __name__ == "__main__":
+    main()
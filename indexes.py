@@ -0,0 +1,200 @@
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from friends import mask_ids
+
+
+# Dates are stored as YYYY-MM-DD, so a year-first prefix names a contiguous range
+DATE_PREFIX = re.compile(r"^\d{4}(-\d{0,2}){0,2}$")
+
+
+def prefix_end(prefix):
+    """Smallest string greater than every string starting with ``prefix``"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def date_bounds(value):
+    """Half-open ``(low, high)`` bounds for a date filter, or None if it is not a range.
+
+    Accepts prefixes such as ``2026`` or ``2026-03`` and ranges such as
+    ``2026-01-01..2026-03-31`` or ``2026-01..2026-03``, where either end
+    may be left out.
+    """
+    value = value.strip()
+    if ".." in value:
+        low, high = (part.strip() for part in value.split("..", 1))
+        if (low and not DATE_PREFIX.match(low)) or (high and not DATE_PREFIX.match(high)):
+            return None
+        return low, prefix_end(high) if high else None
+    if DATE_PREFIX.match(value):
+        return value, prefix_end(value)
+    return None
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ExpenseIndex:
+    """Inverted indexes over a ledger's expenses, maintained on every change.
+
+    Keeps description trigrams, payer and participant posting lists and the
+    distinct dates in sorted order, so filters only look at the expenses
+    that can match instead of scanning the whole ledger. Friends are
+    posted by id; ``name_of`` looks up the name to match filters against.
+    """
+
+    def __init__(self, name_of):
+        self.name_of = name_of
+        self.descriptions = {}  # expense id -> lowercased description
+        self.by_trigram = defaultdict(set)
+        self.by_payer = defaultdict(set)
+        self.by_participant = defaultdict(set)
+        self.by_date = defaultdict(set)
+        self.dates = []  # Distinct dates, sorted
+
+    def add(self, expense):
+        self.add_row(expense['id'], expense['description'], expense['payer'], mask_ids(expense['participants']),
+                     expense['date'])
+
+    def add_row(self, expense_id, description, payer, participants, date):
+        """Index an expense given field by field, participants as ids"""
+        description = description.lower()
+        self.descriptions[expense_id] = description
+        for trigram in trigrams(description):
+            self.by_trigram[trigram].add(expense_id)
+
+        self.by_payer[payer].add(expense_id)
+        for participant in participants:
+            self.by_participant[participant].add(expense_id)
+
+        if date not in self.by_date:
+            insort(self.dates, date)
+        self.by_date[date].add(expense_id)
+
+    def remove(self, expense):
+        expense_id = expense['id']
+        description = self.descriptions.pop(expense_id, expense['description'].lower())
+        for trigram in trigrams(description):
+            self._discard(self.by_trigram, trigram, expense_id)
+
+        self._discard(self.by_payer, expense['payer'], expense_id)
+        for participant in mask_ids(expense['participants']):
+            self._discard(self.by_participant, participant, expense_id)
+
+        date = expense['date']
+        if self._discard(self.by_date, date, expense_id):
+            del self.dates[bisect_left(self.dates, date)]
+
+    def clear(self):
+        self.__init__(self.name_of)
+
+    def involving(self, friend):
+        """Ids of expenses a friend paid for or shares"""
+        return self.by_payer.get(friend, set()) | self.by_participant.get(friend, set())
+
+    def match(self, date=None, description=None, payer=None, participant=None):
+        """Ids of expenses matching every given filter, or None if no filter was given.
+
+        Filters are case-insensitive substrings, except that dates also
+        accept the prefixes and ranges understood by ``date_bounds``.
+        """
+        candidates = []
+        if date:
+            candidates.append(self._match_date(date))
+        if payer:
+            candidates.append(self._match_friend(self.by_payer, payer))
+        if participant:
+            candidates.append(self._match_friend(self.by_participant, participant))
+        if description:
+            candidates.append(self._match_trigrams(description.lower()))
+
+        candidates = [ids for ids in candidates if ids is not None]
+        if not candidates:
+            if description:
+                candidates = [self.descriptions.keys()]
+            else:
+                return None
+
+        # Intersect starting from the smallest posting list
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for ids in candidates[1:]:
+            result &= ids
+            if not result:
+                break
+
+        if description:
+            # Trigrams narrow the candidates down, the substring test confirms them
+            value = description.lower()
+            result = {expense_id for expense_id in result if value in self.descriptions[expense_id]}
+        return result
+
+    def matches(self, expense, date=None, description=None, payer=None, participant=None):
+        """Whether one indexed expense passes every given filter, by the rules of ``match``"""
+        if date:
+            bounds = date_bounds(date)
+            if bounds is not None:
+                low, high = bounds
+                if expense['date'] < low or (high is not None and expense['date'] >= high):
+                    return False
+            elif date.lower() not in expense['date'].lower():
+                return False
+        if description and description.lower() not in self.descriptions[expense['id']]:
+            return False
+        if payer and payer.lower() not in self.name_of(expense['payer']).lower():
+            return False
+        if participant:
+            value = participant.lower()
+            if not any(value in self.name_of(friend).lower() for friend in mask_ids(expense['participants'])):
+                return False
+        return True
+
+    def _match_date(self, value):
+        bounds = date_bounds(value)
+        if bounds is not None:
+            low, high = bounds
+            start = bisect_left(self.dates, low)
+            end = bisect_left(self.dates, high) if high is not None else len(self.dates)
+            dates = self.dates[start:end]
+        else:
+            # Any other substring, e.g. "-15", is tested against distinct dates only
+            value = value.lower()
+            dates = [date for date in self.dates if value in date.lower()]
+        ids = set()
+        for date in dates:
+            ids |= self.by_date[date]
+        return ids
+
+    def _match_friend(self, postings, value):
+        # There are few friends, so their names are matched directly
+        value = value.lower()
+        ids = set()
+        for friend, friend_ids in postings.items():
+            if value in self.name_of(friend).lower():
+                ids |= friend_ids
+        return ids
+
+    def _match_trigrams(self, value):
+        grams = trigrams(value)
+        if not grams:
+            return None  # Too short to use the index
+        postings = sorted((self.by_trigram.get(gram, set()) for gram in grams), key=len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            ids &= posting
+            if not ids:
+                break
+        return ids
+
+    def _discard(self, postings, key, expense_id):
+        """Remove an id from a posting list, returns True if the list became empty"""
+        ids = postings.get(key)
+        if ids is None:
+            return False
+        ids.discard(expense_id)
+        if not ids:
+            del postings[key]
+            return True
+        return False
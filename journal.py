@@ -0,0 +1,631 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where the lock only orders this process's own threads
+    fcntl = None
+
+from history import History, HistoryLog
+from ledger import Ledger, serialize_record
+from snapshot import SnapshotExpenses, SnapshotReader, write_snapshot
+
+
+# JSON layout: version 1 files are plain lists of names and name-based expenses
+JSON_VERSION = 2
+
+
+class ConflictError(Exception):
+    """The ledger files were changed by another program in a way this store cannot take in"""
+
+
+class FileLock:
+    """Exclusive advisory lock shared by the threads of this process and every other process.
+
+    Held while the ledger files are read or written, so no one reads them
+    half written and checking a file's version and appending to it are
+    one step. Other processes only wait if they take the lock as well.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """Take the lock, returns False if ``blocking`` is off and it is held elsewhere"""
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is not None:
+            try:
+                file = open(self.path, "a")
+            except OSError:
+                self._thread_lock.release()
+                raise
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                file.close()
+                self._thread_lock.release()
+                if blocking:
+                    raise
+                return False
+            self._file = file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def file_stat(path):
+    """``(mtime, size, inode)`` of a file, None if there is none"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def atomic_write_json(path, data):
+    """Write JSON to ``path`` so that readers see either the old or the new file.
+
+    The data goes to a temporary file in the same directory, which is synced
+    and then renamed over the target.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def apply_record(ledger, record):
+    """Replay one journal record onto a ledger"""
+    op = record['op']
+    if op == 'add_friend':
+        if record['name'] not in ledger.registry and record.get('id') not in ledger.registry.names:
+            ledger.add_friend(record['name'], record.get('id'))
+    elif op == 'rename_friend':
+        name = ledger.registry.names.get(record['id'])
+        if name is not None and name != record['name']:
+            ledger.rename_friend(name, record['name'])
+    elif op == 'remove_friends':
+        if 'ids' in record:
+            ledger.remove_friends_by_id(record['ids'])
+        else:
+            ledger.remove_friends(record['names'])
+    elif op in ('add_expense', 'update_expense'):
+        ledger.put_expense(record['expense'])
+    elif op == 'add_expenses':
+        for expense in record['expenses']:
+            ledger.put_expense(expense)
+    elif op == 'delete_expense':
+        if record['id'] in ledger:
+            ledger.delete_expense(record['id'])
+    elif op == 'clear_expenses':
+        ledger.clear_expenses()
+    elif op in ('add_rule', 'update_rule'):
+        ledger.put_rule(record['rule'])
+    elif op == 'delete_rule':
+        if record['id'] in ledger.rules:
+            ledger.delete_rule(record['id'])
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+
+
+def rebase_records(ledger, records):
+    """Replay records made against an older version of the files onto ``ledger``, returns them as replayed.
+
+    New friends, expenses and rules whose ids were taken in the meantime
+    get the next free ids, and the later records follow them; a friend
+    added on both sides under one name becomes that friend. Edits win
+    over changes made elsewhere. Raises ConflictError for a record that
+    cannot be replayed, such as an expense of a friend removed elsewhere.
+    """
+    registry = ledger.registry
+    friend_ids, expense_ids, rule_ids = {}, {}, {}
+
+    def friend(friend_id):
+        friend_id = friend_ids.get(friend_id, friend_id)
+        if friend_id not in registry.names and friend_id not in registry.former:
+            raise ConflictError("A friend was removed by another program while expenses here still use them")
+        return friend_id
+
+    def expense(data, new):
+        expense_id = expense_ids.get(data['id'], data['id'])
+        if new and expense_id in ledger.expenses:
+            expense_id = expense_ids[data['id']] = max(ledger.expenses) + 1
+        return dict(data, id=expense_id, payer=friend(data['payer']),
+                    participants=[friend(participant) for participant in data['participants']])
+
+    def rule(data, new):
+        rule_id = rule_ids.get(data['id'], data['id'])
+        if new and rule_id in ledger.rules:
+            rule_id = rule_ids[data['id']] = max(ledger.rules) + 1
+        return dict(data, id=rule_id, payer=friend(data['payer']),
+                    participants=[friend(participant) for participant in data['participants']])
+
+    rebased = []
+    for record in records:
+        op = record['op']
+        if op == 'add_friend':
+            friend_id = registry.ids.get(record['name'])
+            if friend_id is None and (record['id'] in registry.names or record['id'] in registry.former):
+                friend_id = registry.next_id
+            if friend_id is not None:
+                friend_ids[record['id']] = friend_id
+            record = dict(record, id=friend_ids.get(record['id'], record['id']))
+        elif op == 'rename_friend':
+            record = dict(record, id=friend_ids.get(record['id'], record['id']))
+            if record['name'] in registry and registry.ids[record['name']] != record['id']:
+                raise ConflictError(f"{record['name']} was added by another program under another id")
+        elif op == 'remove_friends' and 'ids' in record:
+            record = dict(record, ids=[friend_ids.get(friend_id, friend_id) for friend_id in record['ids']])
+        elif op in ('add_expense', 'update_expense'):
+            record = dict(record, expense=expense(record['expense'], op == 'add_expense'))
+        elif op == 'add_expenses':
+            record = dict(record, expenses=[expense(data, True) for data in record['expenses']])
+        elif op == 'delete_expense':
+            record = dict(record, id=expense_ids.get(record['id'], record['id']))
+        elif op in ('add_rule', 'update_rule'):
+            record = dict(record, rule=rule(record['rule'], op == 'add_rule'))
+        elif op == 'delete_rule':
+            record = dict(record, id=rule_ids.get(record['id'], record['id']))
+        apply_record(ledger, record)
+        rebased.append(record)
+    return rebased
+
+
+def sync_ledger(ledger, fresh):
+    """Turn ``ledger`` into a copy of ``fresh`` through ordinary changes, returns how many were made.
+
+    Only the friends, expenses and rules that differ are touched, so
+    listeners see the difference and not a reload. Raises ValueError when
+    friends swapped names, which renaming one at a time cannot do.
+    """
+    changes = 0
+    registry, fresh_registry = ledger.registry, fresh.registry
+    gone = [friend_id for friend_id in registry.names if friend_id not in fresh_registry.names]
+    if gone:
+        ledger.remove_friends_by_id(gone)
+        changes += 1
+    for friend_id, name in fresh_registry.names.items():
+        old_name = registry.names.get(friend_id)
+        if old_name is None:
+            ledger.add_friend(name, friend_id)
+        elif old_name != name:
+            ledger.rename_friend(old_name, name)
+        else:
+            continue
+        changes += 1
+    for friend_id, name in fresh_registry.former.items():
+        if friend_id not in registry.former:
+            registry.add_former(name, friend_id)
+    registry.next_id = max(registry.next_id, fresh_registry.next_id)
+
+    for expense_id in [expense_id for expense_id in ledger.expenses if expense_id not in fresh.expenses]:
+        ledger.delete_expense(expense_id)
+        changes += 1
+    for expense_id, record in fresh.expenses.items():
+        if ledger.expenses.get(expense_id) != record:
+            ledger.put_expense(record)
+            changes += 1
+
+    for rule_id in [rule_id for rule_id in ledger.rules if rule_id not in fresh.rules]:
+        ledger.delete_rule(rule_id)
+        changes += 1
+    for rule_id, rule in fresh.rules.items():
+        if ledger.rules.get(rule_id) != rule:
+            ledger.put_rule(rule)
+            changes += 1
+    return changes
+
+
+class JournalStore:
+    """Persists a ledger as a binary snapshot plus an append-only journal.
+
+    ``expenses.snap`` holds the last snapshot (see ``snapshot.py``) and
+    ``expenses.journal`` holds one JSON line per change made since. Changes
+    are buffered by the ledger listener and written by ``flush``, and once
+    the journal grows past ``compact_every`` records it is folded into a new
+    snapshot. Replaying is idempotent, so a crash between writing the
+    snapshot and truncating the journal loses nothing.
+
+    The undo history is kept in ``expenses.history`` and written with the
+    same batches. Recurring rules are few, so each snapshot writes all of
+    them to ``expenses.rules`` as JSON, just before the snapshot itself.
+
+    Without a snapshot, ``friends.json`` and ``expenses.json`` are read
+    instead, in either JSON layout, and a snapshot is written from them.
+
+    Another window, the server or a sync tool may change the same files.
+    Reads and writes hold ``expenses.lock``, and the store remembers the
+    snapshot's stat and how much of the journal it has read or written as
+    its version. ``changed`` compares that against the files with two
+    stats, ``sync`` takes in what others wrote, and ``write_batch`` raises
+    ``ConflictError`` rather than write over changes it has not seen,
+    keeping the refused batch for the next ``sync`` to replay on top.
+    ``export_json`` and ``import_json`` convert between the two.
+    """
+
+    def __init__(self, directory=".", compact_every=1000):
+        self.snapshot_path = os.path.join(directory, "expenses.snap")
+        self.friends_path = os.path.join(directory, "friends.json")
+        self.expenses_path = os.path.join(directory, "expenses.json")
+        self.journal_path = os.path.join(directory, "expenses.journal")
+        self.rules_path = os.path.join(directory, "expenses.rules")
+        self.lock = FileLock(os.path.join(directory, "expenses.lock"))
+        self.history = History()
+        self.history_log = HistoryLog(os.path.join(directory, "expenses.history"))
+        self.compact_every = compact_every
+        self.ledger = None
+        self.pending = []
+        self.journal_records = 0
+        self.needs_snapshot = False
+        self.version = None  # (snapshot stat, journal length) as last read or written, None to not check
+        self.taken = 0  # Sequence number of the last batch taken
+        self.written = 0  # and of the last one written or refused
+        self.refused = []  # Batches write_batch refused over changes made elsewhere, for sync to replay
+
+    def load(self, ledger):
+        """Load the snapshot, replay the journal tail and start recording changes"""
+        with self.lock:
+            needs_compaction = self._read(ledger)
+
+        self.history_log.load(self.history)
+        self.ledger = ledger
+        ledger.subscribe(self.record)
+        if needs_compaction or self.journal_records >= self.compact_every:
+            self.compact()
+
+    def changed(self):
+        """Whether the files differ from the version this store last read or wrote, two stats and no reading"""
+        version = self.version
+        return version is not None and (file_stat(self.snapshot_path), file_size(self.journal_path)) != version
+
+    def sync(self, ledger):
+        """Take in changes another program made to the files; runs on the thread that owns the ledger.
+
+        Records appended to the journal are read from where this store
+        left off and replayed. A snapshot written by someone else is
+        loaded aside and only what differs is applied, see
+        ``sync_ledger``. The listeners see ordinary changes either way,
+        and nothing taken in is written back. The undo history is cleared,
+        so undo cannot put back what someone else changed.
+
+        Changes made here and not yet written, refused batches included,
+        are replayed on top of the files with ``rebase_records`` and
+        written with the next batch.
+
+        Returns the number of changes, or None if there were none, the
+        files are locked or a batch is still being written, to be tried
+        again later. Raises ConflictError if the files cannot be taken in
+        change by change; the ledger should then be loaded again. Changes
+        made here are first saved as a ledger in ``conflicts/``, named in
+        the error.
+        """
+        if not self.changed() or not self.lock.acquire(blocking=False):
+            return None
+        try:
+            current = (file_stat(self.snapshot_path), file_size(self.journal_path))
+            if current == self.version:
+                return None  # Our own write had not updated the version yet
+            if self.written < self.taken:
+                return None  # Written or refused soon, refused batches are replayed below
+
+            ledger.unsubscribe(self.record)
+            try:
+                if self.pending or self.refused:
+                    changes = self._rebase(ledger)
+                elif current[0] == self.version[0] and current[1] > self.version[1]:
+                    records, end = self._read_journal(self.version[1])
+                    for record in records:
+                        apply_record(ledger, record)
+                    self.journal_records += len(records)
+                    self.version = (current[0], end)
+                    changes = len(records)
+                else:
+                    # Compacted or replaced: compare against what is there now
+                    fresh = Ledger()
+                    self._read(fresh)
+                    try:
+                        changes = sync_ledger(ledger, fresh)
+                    except ValueError as e:
+                        raise ConflictError(f"The ledger was changed by another program: {e}")
+            finally:
+                ledger.subscribe(self.record)
+        finally:
+            self.lock.release()
+
+        if changes:
+            self.history.clear()
+            self.history_log.write_failed()
+        return changes
+
+    def _rebase(self, ledger):
+        """Load the files aside, replay the changes not written on top and make ``ledger`` the result"""
+        fresh = Ledger()
+        self._read(fresh)
+        refused, self.refused = self.refused, []
+        records = [record for batch in refused for record in batch['records']] + self.pending
+        try:
+            if any(batch['snapshot'] is not None for batch in refused):
+                # A whole snapshot says what the ledger is, not what changed
+                raise ConflictError("Changes saved here as a snapshot cannot be merged with another program's")
+            self.pending = rebase_records(fresh, records)
+            return sync_ledger(ledger, fresh)
+        except (ConflictError, ValueError) as e:
+            path = self._save_conflict(ledger)
+            raise ConflictError(f"The ledger was changed by another program ({e}); "
+                                f"the changes made here were saved to {path}")
+
+    def _save_conflict(self, ledger):
+        """Save a ledger that cannot be merged as JSON in a directory of its own, returns the directory.
+
+        The directory is a ledger of its own, ``JournalStore`` loads it.
+        """
+        directory = os.path.join(os.path.dirname(self.snapshot_path), "conflicts",
+                                 time.strftime("%Y-%m-%d %H-%M-%S"))
+        os.makedirs(directory, exist_ok=True)
+        self._write_json(ledger, os.path.join(directory, "friends.json"), os.path.join(directory, "expenses.json"))
+        return directory
+
+    def peek(self):
+        """Per-friend ``(paid, owed)`` totals from the snapshot header, without loading.
+
+        Returns None when there is no snapshot, the journal holds changes
+        made since, which the header totals would not include, some
+        expenses are in other currencies or there are recurring rules.
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path):
+            return None
+        try:
+            if self._read_rules():
+                return None  # Their occurrences up to today are not in the header
+        except (OSError, ValueError):
+            return None
+        try:
+            with SnapshotReader(self.snapshot_path) as reader:
+                # Other currencies need converting, which the header totals leave out
+                return None if reader.mixed else reader.totals
+        except (OSError, ValueError):
+            return None
+
+    def record(self, op, data):
+        self.pending.append({'op': op, **data})
+
+    def flush(self):
+        """Append buffered changes to the journal, compacting when it gets long"""
+        batch = self.take_batch()
+        if batch is not None:
+            try:
+                self.write_batch(batch)
+            except Exception:
+                self.write_failed()
+                raise
+
+    def compact(self):
+        """Write a fresh snapshot of the ledger and empty the journal"""
+        self.write_batch(self.take_batch(snapshot=True))
+
+    def take_batch(self, snapshot=False):
+        """Collect what the next write needs, without touching the disk.
+
+        Runs on the thread that owns the ledger. The batch holds either the
+        buffered records or, once the journal is due for compaction, a
+        snapshot of the ledger, and can be written by ``write_batch`` on
+        any thread. Returns None when there is nothing to write.
+        """
+        snapshot = snapshot or self.needs_snapshot
+        history = self.history_log.take_batch(self.history)
+        if not self.pending and not snapshot:
+            if history is None:
+                return None
+            return {'snapshot': None, 'rules': None, 'records': [], 'history': history, 'seq': self.taken}
+        records, self.pending = self.pending, []
+        self.taken += 1
+        self.journal_records += len(records)
+
+        if snapshot or self.journal_records >= self.compact_every:
+            self.journal_records = 0
+            self.needs_snapshot = False
+            ledger = self.ledger
+            totals = {friend_id: (ledger.total_paid[friend_id], ledger.total_owed[friend_id])
+                      for friend_id in ledger.registry.names}
+            # Copied without decoding, the writer reads the records from it on its own thread
+            snapshot = (ledger.registry.to_json(), ledger.registry.next_id, ledger.expenses.copy().values(), totals)
+            rules = [dict(rule) for rule in ledger.rules.values()]
+            return {'snapshot': snapshot, 'rules': rules, 'records': [], 'history': history, 'seq': self.taken}
+        return {'snapshot': None, 'rules': None, 'records': records, 'history': history, 'seq': self.taken}
+
+    def write_batch(self, batch):
+        """Write a batch from ``take_batch``; batches must be written in the order taken.
+
+        Raises ConflictError, writing nothing, if another program changed
+        the files since this store last read or wrote them.
+        """
+        with self.lock:
+            if batch['snapshot'] is not None or batch['records']:
+                current = (file_stat(self.snapshot_path), file_size(self.journal_path))
+                if self.version is not None and current != self.version:
+                    # Kept for sync to replay on top of the other program's changes
+                    self.refused.append(batch)
+                    self.written = max(self.written, batch['seq'])
+                    raise ConflictError("The ledger was changed by another program since it was loaded")
+
+            if batch['snapshot'] is not None:
+                # Rules first: the journal still replays onto them if the snapshot is not written
+                if batch['rules'] or os.path.exists(self.rules_path):
+                    atomic_write_json(self.rules_path, {'version': 1, 'rules': batch['rules']})
+                write_snapshot(self.snapshot_path, *batch['snapshot'])
+                with open(self.journal_path, "w", encoding="utf-8") as f:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if batch['records']:
+                lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in batch['records'])
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if batch['snapshot'] is not None or batch['records']:
+                self.version = (file_stat(self.snapshot_path), file_size(self.journal_path))
+            if batch['history'] is not None:
+                self.history_log.write_batch(batch['history'])
+            self.written = max(self.written, batch['seq'])
+
+    def write_failed(self):
+        """A taken batch was not written, so the next one rewrites the whole snapshot"""
+        self.needs_snapshot = True
+        self.history_log.write_failed()
+
+    @staticmethod
+    def merge_batches(older, newer):
+        """Combine two batches not yet written into one, a newer snapshot replaces everything"""
+        history = HistoryLog.merge_batches(older['history'], newer['history'])
+        if newer['snapshot'] is not None:
+            return {**newer, 'history': history}
+        return {'snapshot': older['snapshot'], 'rules': older['rules'], 'records': older['records'] + newer['records'],
+                'history': history, 'seq': newer['seq']}
+
+    def close(self):
+        if self.ledger is not None:
+            self.flush()
+            self.ledger.unsubscribe(self.record)
+            self.ledger = None
+
+    def export_json(self):
+        """Write the ledger, journal included, to friends.json and expenses.json"""
+        ledger = self.ledger
+        if ledger is None:
+            ledger = Ledger()
+            JournalStore(os.path.dirname(self.snapshot_path)).load(ledger)
+        self._write_json(ledger, self.friends_path, self.expenses_path)
+
+    def _write_json(self, ledger, friends_path, expenses_path):
+        atomic_write_json(friends_path,
+                          {'version': JSON_VERSION, 'friends': ledger.registry.to_json(),
+                           'next_id': ledger.registry.next_id})
+        atomic_write_json(expenses_path,
+                          {'version': JSON_VERSION, 'expenses': [serialize_record(record) for record in ledger.records()],
+                           'rules': [dict(rule) for rule in ledger.rules.values()]})
+
+    def import_json(self):
+        """Replace the snapshot and journal with the contents of friends.json and expenses.json"""
+        ledger = Ledger()
+        self._load_json(ledger)
+        store = JournalStore(os.path.dirname(self.snapshot_path))
+        store.ledger = ledger
+        store.compact()
+
+    def _load_json(self, ledger):
+        """Load friends.json and expenses.json, returns whether there was anything in them"""
+        friends = self._read_json(self.friends_path)
+        expenses = self._read_json(self.expenses_path)
+        if isinstance(friends, list):
+            ledger.load(friends, expenses if isinstance(expenses, list) else expenses['expenses'])
+        else:
+            ledger.load(friends['friends'], expenses['expenses'] if isinstance(expenses, dict) else expenses,
+                        friends['next_id'])
+        if isinstance(expenses, dict):
+            ledger.load_rules(expenses.get('rules', ()))
+        return bool(ledger.friends or len(ledger) or ledger.registry.former or ledger.rules)
+
+    def _read_json(self, path):
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _read_rules(self):
+        if not os.path.exists(self.rules_path):
+            return []
+        with open(self.rules_path, "r", encoding="utf-8") as f:
+            return json.load(f)['rules']
+
+    def _read(self, ledger):
+        """Fill a ledger from the files and note their version, returns whether to compact them.
+
+        The snapshot stays mapped behind the ledger, which decodes its
+        records as they are asked for and starts from the header totals.
+        Called with the lock held.
+        """
+        if os.path.exists(self.snapshot_path):
+            reader = SnapshotReader(self.snapshot_path)
+            try:
+                ledger.load_mapped(reader.friends, SnapshotExpenses(reader), reader.next_friend_id,
+                                   reader.friend_totals, reader.currency_counts())
+            except BaseException:
+                reader.close()
+                raise
+            ledger.load_rules(self._read_rules())
+            needs_compaction = False
+        else:
+            # JSON from before binary snapshots is converted once
+            needs_compaction = self._load_json(ledger)
+
+        records, end = self._read_journal()
+        for record in records:
+            apply_record(ledger, record)
+        self.journal_records = len(records)
+        self.version = (file_stat(self.snapshot_path), end)
+        return needs_compaction
+
+    def _read_journal(self, offset=0):
+        """``(records, end)``: the complete records from ``offset`` on and where the last one ends"""
+        if not os.path.exists(self.journal_path):
+            return [], 0
+        with open(self.journal_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        records = []
+        good_end = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # Torn write from a crash, drop it
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            good_end += len(line)
+            records.append(record)
+
+        # Cut off anything after the last complete record so new appends stay readable
+        if good_end < len(data):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(offset + good_end)
+        return records, offset + good_end
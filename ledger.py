@@ -0,0 +1,709 @@
+from calendar import monthrange
+from datetime import date as Date, datetime
+
+from currency import DEFAULT_CURRENCY, CurrencySums, normalize_currency
+from friends import FriendRegistry, mask_ids
+from indexes import ExpenseIndex
+from recurring import FREQUENCIES, occurrences, rule_totals
+from rollups import Rollups
+
+
+FILTER_CRITERIA = ["All", "Date", "Description", "Payer", "Participant"]
+
+
+def validate_expense(date, description, amount, payer, participants, friends, currency=DEFAULT_CURRENCY):
+    """Check user input for an expense and return it as an expense dict (without id)"""
+    datetime.strptime(date, "%Y-%m-%d")
+    description = description.strip()
+    amount = float(amount)
+    participants = list(participants)
+    currency = normalize_currency(currency)
+
+    if not description:
+        raise ValueError("Description is required")
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    if not payer:
+        raise ValueError("Please select a payer")
+    if not participants:
+        raise ValueError("Please select at least one participant")
+    for friend in [payer] + participants:
+        if friend not in friends:
+            raise ValueError(f"Unknown friend: {friend}")
+
+    return {
+        'date': date,
+        'description': description,
+        'amount': amount,
+        'payer': payer,
+        'participants': participants,
+        'currency': currency,
+    }
+
+
+def validate_rule(start, frequency, interval, until, description, amount, payer, participants, friends,
+                  currency=DEFAULT_CURRENCY):
+    """Check user input for a recurring rule and return it as a rule dict (without id)"""
+    rule = validate_expense(start, description, amount, payer, participants, friends, currency)
+    if until:
+        datetime.strptime(until, "%Y-%m-%d")
+        if until < start:
+            raise ValueError("The rule must end after it starts")
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Frequency must be one of {', '.join(FREQUENCIES)}")
+    interval = int(interval)
+    if interval < 1:
+        raise ValueError("Repeat every must be at least 1")
+
+    rule['start'] = rule.pop('date')
+    rule.update(frequency=frequency, interval=interval, until=until or None, skip=[])
+    return rule
+
+
+def serialize_record(record):
+    """A stored expense as it is saved: friends by id, participants as a list of ids.
+
+    The currency is left out when it is the default, as in older files.
+    """
+    data = {
+        'id': record['id'],
+        'date': record['date'],
+        'description': record['description'],
+        'amount': record['amount'],
+        'payer': record['payer'],
+        'participants': mask_ids(record['participants']),
+    }
+    if record['currency'] != DEFAULT_CURRENCY:
+        data['currency'] = record['currency']
+    return data
+
+
+class Ledger:
+    """Friends, expenses and per-friend totals, without any UI attached.
+
+    Every mutation applies only its own delta to the totals, so the cost of
+    an add, update or delete does not depend on how many expenses exist.
+    Expenses are stored with friends interned to ids: the payer is an id
+    and the participants a bitmask of ids. ``get``, ``query`` and
+    iteration hand them out as dicts with names. Listeners are called with
+    ``(op, data)`` after each mutation, where ``data`` is a
+    JSON-serialisable dict describing the change with friends by id.
+
+    Each expense has a currency. ``total_paid`` and ``total_owed`` sum the
+    expenses in ``DEFAULT_CURRENCY``; once other currencies are involved,
+    or ``display_currency`` is another one, ``totals`` converts per-day
+    sums with ``rates`` and keeps the result until an expense or the rates
+    change.
+
+    Recurring rules (see ``recurring.py``) are kept apart from the
+    expenses, with the payer and participants as lists of ids. Their
+    occurrences are never stored: totals count the ones up to today and
+    reports the ones in their window, as amount times occurrence count.
+    ``materialize`` turns a single occurrence into an expense.
+
+    ``load_mapped`` takes over expenses that are decoded as they are asked
+    for, such as a snapshot's (see ``snapshot.SnapshotExpenses``), with
+    the totals saved alongside. The filter indexes, like the rollups, are
+    then built on first use.
+    """
+
+    def __init__(self):
+        self.registry = FriendRegistry()
+        self.expenses = {}  # expense id -> stored expense, in insertion order
+        self.total_paid = {}  # friend id -> amount
+        self.total_owed = {}
+        self._index = None  # Built on first use
+        self._rollups = None  # Built on first use
+        self.currency_counts = {}  # currency -> number of expenses
+        self.display_currency = DEFAULT_CURRENCY
+        self.rates = None  # currency.FxRates, needed to show other currencies
+        self._currency_sums = None  # Built on first conversion
+        self._converted = None  # (key, totals) of the last conversion
+        self._version = 0  # Bumped by every expense change
+        self._next_id = 1
+        self.rules = {}  # rule id -> stored rule
+        self._next_rule_id = 1
+        self.listeners = []
+
+    @property
+    def friends(self):
+        return list(self.registry)
+
+    def __len__(self):
+        return len(self.expenses)
+
+    def __iter__(self):
+        return (self._view(record) for record in list(self.expenses.values()))
+
+    def __contains__(self, expense_id):
+        return expense_id in self.expenses
+
+    def load(self, friends, expenses, next_friend_id=0):
+        """Replace the ledger contents with previously saved friends and expenses.
+
+        Friends may be plain names or ``{'id', 'name'}`` dicts, and
+        expenses may give their payer and participants by name or by id.
+        """
+        self._reset(friends, next_friend_id, {}, {}, {})
+        self._index = ExpenseIndex(self.registry.name)
+        for expense in expenses:
+            record = self._to_record(expense)
+            if record['id'] is None:
+                record['id'] = self._next_id
+            self._next_id = max(self._next_id, record['id'] + 1)
+            self._insert(record)
+
+    def load_mapped(self, friends, expenses, next_friend_id, totals, currency_counts):
+        """Replace the ledger contents with a mapping of stored expenses by id, without reading them.
+
+        ``totals`` maps friend id to ``(paid, owed)`` in the default
+        currency and ``currency_counts`` each currency to its number of
+        expenses, as they were saved with the expenses.
+        """
+        self._reset(friends, next_friend_id, expenses, totals, currency_counts)
+        self._next_id = max(expenses, default=0) + 1
+
+    def _reset(self, friends, next_friend_id, expenses, totals, currency_counts):
+        self.registry.load(friends, next_friend_id)
+        self.expenses = expenses
+        self.total_paid = {friend_id: totals.get(friend_id, (0.0, 0.0))[0] for friend_id in self.registry.names}
+        self.total_owed = {friend_id: totals.get(friend_id, (0.0, 0.0))[1] for friend_id in self.registry.names}
+        self._index = None
+        self._rollups = None
+        self.currency_counts = dict(currency_counts)
+        self._currency_sums = None
+        self._version += 1
+        self._next_id = 1
+        self.rules = {}
+        self._next_rule_id = 1
+
+    @property
+    def index(self):
+        if self._index is None:
+            index = ExpenseIndex(self.registry.name)
+            if isinstance(self.expenses, dict):
+                for record in self.expenses.values():
+                    index.add(record)
+            else:
+                # Mapped expenses index themselves without decoding each into a dict
+                self.expenses.fill_index(index)
+            self._index = index
+        return self._index
+
+    def records(self):
+        """Stored expenses in order, for saving.
+
+        Stored expenses are replaced rather than modified, so the list is a
+        stable snapshot even while the ledger keeps changing.
+        """
+        return list(self.expenses.values())
+
+    def stream(self, expense_ids=None):
+        """``(count, expenses)``: the expenses, or those with ``expense_ids``, as a lazy generator of views.
+
+        The records and friend names are copied now and the views made
+        one at a time from the copy, so the generator can run on another
+        thread while the ledger keeps changing.
+        """
+        if expense_ids is None:
+            # Copied without decoding, a mapped snapshot's records are read as the generator runs
+            records = self.expenses.copy().values()
+        else:
+            records = [self.expenses[expense_id] for expense_id in expense_ids if expense_id in self.expenses]
+        names = {**self.registry.former, **self.registry.names}
+
+        def views():
+            for record in records:
+                yield {
+                    'date': record['date'],
+                    'description': record['description'],
+                    'amount': record['amount'],
+                    'payer': names[record['payer']],
+                    'participants': [names[friend_id] for friend_id in mask_ids(record['participants'])],
+                    'currency': record['currency'],
+                    'id': record['id'],
+                }
+
+        return len(records), views()
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    # Friends
+
+    def add_friend(self, name, friend_id=None):
+        name = name.strip()
+        if not name:
+            raise ValueError("Please Enter Friend Name.")
+        if name in self.registry:
+            return False
+        friend_id = self.registry.add(name, friend_id)
+        self.total_paid[friend_id] = 0.0
+        self.total_owed[friend_id] = 0.0
+        self._notify('add_friend', {'id': friend_id, 'name': name})
+        return True
+
+    def rename_friend(self, old_name, new_name):
+        """Rename a friend; expenses refer to the id, so none of them change"""
+        new_name = new_name.strip()
+        if not new_name:
+            raise ValueError("Please Enter Friend Name.")
+        if old_name not in self.registry:
+            raise ValueError(f"Unknown friend: {old_name}")
+        if new_name == old_name:
+            return False
+        if new_name in self.registry:
+            raise ValueError(f"{new_name} is already a friend")
+        friend_id = self.registry.ids[old_name]
+        self.registry.rename(friend_id, new_name)
+        self._notify('rename_friend', {'id': friend_id, 'name': new_name})
+        return True
+
+    def remove_friends(self, names):
+        """Remove friends along with every expense they paid for or share.
+
+        Returns the removed expenses.
+        """
+        return self.remove_friends_by_id([self.registry.ids[name] for name in names if name in self.registry])
+
+    def remove_friends_by_id(self, friend_ids):
+        friend_ids = list(friend_ids)
+        expense_ids = set()
+        for friend_id in friend_ids:
+            expense_ids |= self.index.involving(friend_id)
+        removed = [self._view(self._delete(expense_id)) for expense_id in sorted(expense_ids)]
+        # Rules involving them go the same way, replaying the removal does the same
+        for rule_id, rule in list(self.rules.items()):
+            if rule['payer'] in friend_ids or any(friend_id in rule['participants'] for friend_id in friend_ids):
+                del self.rules[rule_id]
+
+        for friend_id in friend_ids:
+            if friend_id in self.registry.names:
+                self.registry.remove(friend_id)
+                del self.total_paid[friend_id]
+                del self.total_owed[friend_id]
+        if friend_ids:
+            self._notify('remove_friends', {'ids': friend_ids})
+        return removed
+
+    def shares(self, expense_id, friend):
+        """Whether a friend is among the participants of an expense"""
+        friend_id = self.registry.ids.get(friend)
+        return friend_id is not None and bool(self.expenses[expense_id]['participants'] >> friend_id & 1)
+
+    # Expenses
+
+    def add_expense(self, date, description, amount, payer, participants, currency=DEFAULT_CURRENCY):
+        record = self._to_record(self._validate(date, description, amount, payer, participants, currency))
+        record['id'] = self._next_id
+        self._next_id += 1
+        self._insert(record)
+        self._notify('add_expense', {'expense': serialize_record(record)})
+        return self._view(record)
+
+    def add_expenses(self, expenses):
+        """Add many expenses already checked by ``validate_expense``, notified as one change.
+
+        Nothing is added if one names someone who is not a friend. A batch
+        bigger than a tenth of the ledger drops the rollups and currency
+        sums, which are rebuilt once on next use instead of updated per row.
+        """
+        for expense in expenses:
+            for friend in [expense['payer']] + list(expense['participants']):
+                if friend not in self.registry:
+                    raise ValueError(f"Unknown friend: {friend}")
+        if len(expenses) * 10 > len(self.expenses):
+            self._rollups = None
+            self._currency_sums = None
+
+        records = []
+        for expense in expenses:
+            record = self._to_record(expense)
+            record['id'] = self._next_id
+            self._next_id += 1
+            self._insert(record)
+            records.append(record)
+        self._notify('add_expenses', {'expenses': [serialize_record(record) for record in records]})
+        return [self._view(record) for record in records]
+
+    def update_expense(self, expense_id, date, description, amount, payer, participants, currency=DEFAULT_CURRENCY):
+        old_record = self.expenses[expense_id]
+        record = self._to_record(self._validate(date, description, amount, payer, participants, currency))
+        record['id'] = expense_id
+
+        self._replace(old_record, record)
+        self._notify('update_expense', {'expense': serialize_record(record)})
+        return self._view(record)
+
+    def put_expense(self, expense):
+        """Insert or replace an expense under its own id, without validation.
+
+        Used to replay saved changes, so applying the same record twice is
+        harmless. Friends may be given by name or by id.
+        """
+        record = self._to_record(expense)
+        expense_id = record['id']
+        self._next_id = max(self._next_id, expense_id + 1)
+
+        old_record = self.expenses.get(expense_id)
+        if old_record is None:
+            self._insert(record)
+            self._notify('add_expense', {'expense': serialize_record(record)})
+        else:
+            self._replace(old_record, record)
+            self._notify('update_expense', {'expense': serialize_record(record)})
+        return self._view(record)
+
+    def delete_expense(self, expense_id):
+        record = self._delete(expense_id)
+        self._notify('delete_expense', {'id': expense_id})
+        return self._view(record)
+
+    def delete_expenses(self, expense_ids):
+        return [self.delete_expense(expense_id) for expense_id in expense_ids
+                if expense_id in self.expenses]
+
+    def clear_expenses(self):
+        self.expenses = {}
+        self._index = None
+        self._rollups = None
+        self.currency_counts = {}
+        self._currency_sums = None
+        self._version += 1
+        for friend_id in self.registry.names:
+            self.total_paid[friend_id] = 0.0
+            self.total_owed[friend_id] = 0.0
+        self._notify('clear_expenses', {})
+
+    def get(self, expense_id):
+        record = self.expenses.get(expense_id)
+        return self._view(record) if record is not None else None
+
+    def filter(self, criteria, value):
+        """Expenses matching a filter from FILTER_CRITERIA, case-insensitively"""
+        if criteria == "All":
+            return list(self)
+        return self.query(**{criteria.lower(): value})
+
+    def query(self, date=None, description=None, payer=None, participant=None):
+        """Expenses matching every given filter, answered from the indexes.
+
+        Filters are case-insensitive substrings; dates also take prefixes
+        and ranges such as ``2026-01-01..2026-03-31``.
+        """
+        return [self._view(self.expenses[expense_id])
+                for expense_id in self.query_ids(date, description, payer, participant)]
+
+    def query_ids(self, date=None, description=None, payer=None, participant=None):
+        """Like ``query`` but returns only the ids, without building any dicts"""
+        if not (date or description or payer or participant):
+            return list(self.expenses)
+        ids = self.index.match(date=date, description=description, payer=payer, participant=participant)
+        if ids is None:
+            return list(self.expenses)
+        return sorted(ids)
+
+    def matches(self, expense_id, date=None, description=None, payer=None, participant=None):
+        """Whether one expense passes the same filters as ``query``, in O(1)"""
+        record = self.expenses.get(expense_id)
+        if record is None or not (date or description or payer or participant):
+            return record is not None
+        return self.index.matches(
+            record, date=date, description=description, payer=payer, participant=participant)
+
+    # Recurring rules
+
+    def load_rules(self, rules):
+        """Add saved rules, with friends by id or by name"""
+        for rule in rules:
+            self._insert_rule(self._to_rule(rule))
+
+    def rules_list(self):
+        """Every rule with friend names, in the order they were added"""
+        return [self._rule_view(rule) for rule in self.rules.values()]
+
+    def get_rule(self, rule_id):
+        rule = self.rules.get(rule_id)
+        return self._rule_view(rule) if rule is not None else None
+
+    def add_rule(self, start, frequency, interval, until, description, amount, payer, participants,
+                 currency=DEFAULT_CURRENCY):
+        rule = self._to_rule(validate_rule(start, frequency, interval, until, description, amount,
+                                           payer, participants, self.registry, currency))
+        rule['id'] = self._next_rule_id
+        self._insert_rule(rule)
+        self._notify('add_rule', {'rule': dict(rule)})
+        return self._rule_view(rule)
+
+    def put_rule(self, rule):
+        """Insert or replace a rule under its own id, without validation, as ``put_expense``"""
+        rule = self._to_rule(rule)
+        existed = rule['id'] in self.rules
+        self._insert_rule(rule)
+        self._notify('update_rule' if existed else 'add_rule', {'rule': dict(rule)})
+        return self._rule_view(rule)
+
+    def delete_rule(self, rule_id):
+        rule = self.rules.pop(rule_id)
+        self._notify('delete_rule', {'id': rule_id})
+        return self._rule_view(rule)
+
+    def occurrences(self, rule_id, start=None, end=None):
+        """Dates of a rule's occurrences, generated lazily and clipped to ``start``..``end``"""
+        rule = self.rules[rule_id]
+        return occurrences(rule, start and Date.fromisoformat(start), end and Date.fromisoformat(end))
+
+    def materialize(self, rule_id, date):
+        """Turn the occurrence of a rule on ``date`` into an expense of its own, to edit it alone.
+
+        The rule skips that date from then on. Returns the new expense.
+        """
+        rule = self.rules[rule_id]
+        day = Date.fromisoformat(date)
+        if date in rule['skip'] or next(occurrences(rule, day, day), None) is None:
+            raise ValueError(f"{rule['description']} does not fall on {date}")
+
+        rule = dict(rule, skip=sorted(rule['skip'] + [date]))
+        self.rules[rule_id] = rule
+        self._notify('update_rule', {'rule': dict(rule)})
+        record = {
+            'id': self._next_id,
+            'date': date,
+            'description': rule['description'],
+            'amount': rule['amount'],
+            'payer': rule['payer'],
+            'participants': sum(1 << participant for participant in rule['participants']),
+            'currency': rule['currency'],
+        }
+        self._next_id += 1
+        self._insert(record)
+        self._notify('add_expense', {'expense': serialize_record(record)})
+        return self._view(record)
+
+    # Totals
+
+    def paid(self, friend):
+        return self._totals()[0].get(self.registry.ids.get(friend), 0.0)
+
+    def owed(self, friend):
+        return self._totals()[1].get(self.registry.ids.get(friend), 0.0)
+
+    def balance(self, friend):
+        return self.paid(friend) - self.owed(friend)
+
+    def balances(self):
+        paid, owed = self._totals()
+        return {name: paid.get(friend_id, 0.0) - owed.get(friend_id, 0.0)
+                for friend_id, name in self.registry.names.items()}
+
+    def totals(self, currency=None):
+        """Map each friend to a ``(paid, owed)`` pair in ``currency``, by default the display currency.
+
+        Raises ValueError when a currency has to be converted without a rate.
+        """
+        paid, owed = self._totals(currency)
+        return {name: (paid.get(friend_id, 0.0), owed.get(friend_id, 0.0))
+                for friend_id, name in self.registry.names.items()}
+
+    def _totals(self, currency=None):
+        """Paid and owed by friend id: the expenses plus every rule occurrence up to today"""
+        currency = currency or self.display_currency
+        paid, owed = self._expense_totals(currency)
+        if not self.rules:
+            return paid, owed
+        rule_paid, rule_owed = rule_totals(self.rules.values(), Date.min, Date.today(), currency, self.rates)
+        paid, owed = dict(paid), dict(owed)
+        for friend_id, amount in rule_paid.items():
+            paid[friend_id] = paid.get(friend_id, 0.0) + amount
+        for friend_id, amount in rule_owed.items():
+            owed[friend_id] = owed.get(friend_id, 0.0) + amount
+        return paid, owed
+
+    def is_mixed(self):
+        """Whether any expense is in a currency other than the default"""
+        return any(currency != DEFAULT_CURRENCY for currency in self.currency_counts)
+
+    def _expense_totals(self, currency):
+        if currency == DEFAULT_CURRENCY and not self.is_mixed():
+            return self.total_paid, self.total_owed
+        key = (currency, self.rates.version if self.rates is not None else None, self._version)
+        if self._converted is None or self._converted[0] != key:
+            if self._currency_sums is None:
+                self._currency_sums = CurrencySums(self.expenses.values())
+            self._converted = (key, self._currency_sums.convert(currency, self.rates))
+        return self._converted[1]
+
+    # Reports over dates, answered from the rollups in O(log n) per friend
+
+    @property
+    def rollups(self):
+        if self._rollups is None:
+            self._rollups = Rollups(self.expenses.values())
+        return self._rollups
+
+    def spend_between(self, start, end):
+        """Total spent from ``start`` to ``end``, both ``YYYY-MM-DD`` and included"""
+        start, end = Date.fromisoformat(start), Date.fromisoformat(end)
+        paid, _ = self._rule_sums(start, end)
+        return self.rollups.spend_between(start, end) + sum(paid.values())
+
+    def paid_between(self, start, end):
+        start, end = Date.fromisoformat(start), Date.fromisoformat(end)
+        paid, _ = self._rule_sums(start, end)
+        return {name: self.rollups.between('paid', friend_id, start, end) + paid.get(friend_id, 0.0)
+                for friend_id, name in self.registry.names.items()}
+
+    def shares_between(self, start, end):
+        """Each friend's share of the expenses from ``start`` to ``end``"""
+        start, end = Date.fromisoformat(start), Date.fromisoformat(end)
+        _, owed = self._rule_sums(start, end)
+        return {name: self.rollups.between('owed', friend_id, start, end) + owed.get(friend_id, 0.0)
+                for friend_id, name in self.registry.names.items()}
+
+    def month_spend(self, year, month):
+        paid, _ = self._rule_sums(*self._month_bounds(year, month))
+        return self.rollups.month('spend', year, month) + sum(paid.values())
+
+    def month_shares(self, year, month):
+        _, owed = self._rule_sums(*self._month_bounds(year, month))
+        return {name: self.rollups.month(('owed', friend_id), year, month) + owed.get(friend_id, 0.0)
+                for friend_id, name in self.registry.names.items()}
+
+    def budget_remaining(self, budget, year, month):
+        return budget - self.month_spend(year, month)
+
+    def _rule_sums(self, start, end):
+        # Reports cover the default currency, as the rollups do
+        rules = [rule for rule in self.rules.values() if rule['currency'] == DEFAULT_CURRENCY]
+        return rule_totals(rules, start, end) if rules else ({}, {})
+
+    @staticmethod
+    def _month_bounds(year, month):
+        return Date(year, month, 1), Date(year, month, monthrange(year, month)[1])
+
+    # Internals
+
+    def _validate(self, date, description, amount, payer, participants, currency=DEFAULT_CURRENCY):
+        return validate_expense(date, description, amount, payer, participants, self.registry, currency)
+
+    def _notify(self, op, data):
+        for listener in self.listeners:
+            listener(op, data)
+
+    def _friend_id(self, friend):
+        if isinstance(friend, int):
+            return friend
+        friend_id = self.registry.ids.get(friend)
+        if friend_id is None:
+            # Old files could name people missing from friends.json
+            friend_id = self.registry.add_former(friend)
+        return friend_id
+
+    def _to_record(self, expense):
+        """Intern the friends of an expense dict into a stored expense"""
+        participants = expense['participants']
+        if isinstance(participants, int):
+            mask = participants
+        else:
+            mask = 0
+            for participant in participants:
+                mask |= 1 << self._friend_id(participant)
+        return {
+            'id': expense.get('id'),
+            'date': expense['date'],
+            'description': expense['description'],
+            'amount': float(expense['amount']),
+            'payer': self._friend_id(expense['payer']),
+            'participants': mask,
+            'currency': expense.get('currency') or DEFAULT_CURRENCY,
+        }
+
+    def _to_rule(self, rule):
+        """Intern the friends of a rule dict into a stored rule"""
+        return {
+            'id': rule.get('id'),
+            'start': rule['start'],
+            'frequency': rule['frequency'],
+            'interval': rule['interval'],
+            'until': rule.get('until'),
+            'description': rule['description'],
+            'amount': float(rule['amount']),
+            'payer': self._friend_id(rule['payer']),
+            'participants': [self._friend_id(participant) for participant in rule['participants']],
+            'currency': rule.get('currency') or DEFAULT_CURRENCY,
+            'skip': list(rule.get('skip', ())),
+        }
+
+    def _rule_view(self, rule):
+        return dict(rule, payer=self.registry.name(rule['payer']),
+                    participants=[self.registry.name(participant) for participant in rule['participants']])
+
+    def _insert_rule(self, rule):
+        self.rules[rule['id']] = rule
+        self._next_rule_id = max(self._next_rule_id, rule['id'] + 1)
+
+    def _view(self, record):
+        """A stored expense as an expense dict with friend names"""
+        return {
+            'date': record['date'],
+            'description': record['description'],
+            'amount': record['amount'],
+            'payer': self.registry.name(record['payer']),
+            'participants': self.registry.names_in(record['participants']),
+            'currency': record['currency'],
+            'id': record['id'],
+        }
+
+    def _insert(self, record):
+        self.expenses[record['id']] = record
+        self._link(record)
+        self._apply(record, 1)
+
+    def _replace(self, old_record, record):
+        self._apply(old_record, -1)
+        self._unlink(old_record)
+        self.expenses[record['id']] = record
+        self._link(record)
+        self._apply(record, 1)
+
+    def _delete(self, expense_id):
+        record = self.expenses.pop(expense_id)
+        self._apply(record, -1)
+        self._unlink(record)
+        return record
+
+    def _apply(self, record, sign):
+        participants = mask_ids(record['participants'])
+        amount = sign * record['amount']
+        share = amount / len(participants)
+        if self._rollups is not None:
+            self._rollups.apply(record, sign)
+        if self._currency_sums is not None:
+            self._currency_sums.apply(record, sign)
+        self._version += 1
+        currency = record['currency']
+        count = self.currency_counts.get(currency, 0) + sign
+        if count:
+            self.currency_counts[currency] = count
+        else:
+            del self.currency_counts[currency]
+        if currency != DEFAULT_CURRENCY:
+            return
+        # Only current friends have totals, former ones are skipped
+        payer = record['payer']
+        if payer in self.total_paid:
+            self.total_paid[payer] += amount
+        for participant in participants:
+            if participant in self.total_owed:
+                self.total_owed[participant] += share
+
+    def _link(self, record):
+        if self._index is not None:
+            self._index.add(record)
+
+    def _unlink(self, record):
+        if self._index is not None:
+            self._index.remove(record)
@@ -0,0 +1,199 @@
+"""Load test of the ``--serve`` API with mixed reads and writes.
+
+Each connection is a keep-alive client that sends requests back to back
+for the duration: writes (adding, editing and deleting its own expenses)
+make up the ``--writes`` share and the rest are reads (totals,
+settlements, filtered expense pages, the friend list). Requests per
+second and latency percentiles are reported overall and per request::
+
+    python load_test.py --spawn 100000             # serve a synthetic 100k ledger and test it
+    python load_test.py --port 8765 --connections 50 --duration 30 --writes 0.2
+
+Against a running server the test writes real expenses; ``--spawn``
+serves a throwaway ledger in a temporary directory instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from server import DEFAULT_PORT
+from startup_benchmark import generate_snapshot
+
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+DESCRIPTIONS = ["groceries", "taxi", "dinner", "movie tickets", "fuel", "coffee"]
+
+
+class Client:
+    """One keep-alive connection"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        """``(status, payload)`` of the response"""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                          + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length)) if length else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_connection(client, friends, deadline, writes, rng, latencies, errors):
+    """Send requests until ``deadline``, recording ``latencies[kind]`` and ``errors[kind]``"""
+    own = []  # Ids of expenses this connection added, the ones it edits and deletes
+    while time.perf_counter() < deadline:
+        if rng.random() < writes:
+            choice = rng.random()
+            if own and choice < 0.2:
+                kind, method, path = 'delete', 'DELETE', f"/expenses/{own.pop(rng.randrange(len(own)))}"
+                payload = None
+            else:
+                payload = {
+                    'date': f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                    'description': rng.choice(DESCRIPTIONS),
+                    'amount': round(rng.uniform(10, 5000), 2),
+                    'payer': rng.choice(friends),
+                    'participants': rng.sample(friends, rng.randint(1, len(friends))),
+                }
+                if own and choice < 0.5:
+                    kind, method, path = 'edit', 'PUT', f"/expenses/{rng.choice(own)}"
+                else:
+                    kind, method, path = 'add', 'POST', "/expenses"
+        else:
+            choice = rng.random()
+            payload, method = None, 'GET'
+            if choice < 0.35:
+                kind, path = 'totals', "/totals"
+            elif choice < 0.55:
+                kind, path = 'settlements', "/settlements"
+            elif choice < 0.9:
+                kind, path = 'filter', f"/expenses?description={rng.choice(DESCRIPTIONS)}&limit=50"
+            else:
+                kind, path = 'friends', "/friends"
+
+        started = time.perf_counter()
+        status, result = await client.request(method, path, payload)
+        latencies.setdefault(kind, []).append(time.perf_counter() - started)
+        if status >= 400:
+            errors[kind] = errors.get(kind, 0) + 1
+        elif kind == 'add':
+            own.append(result['id'])
+
+
+async def load_test(host, port, connections, duration, writes, seed=0):
+    """``({kind: [seconds]}, {kind: errors}, elapsed)`` for one run"""
+    clients = [Client(host, port) for _ in range(connections)]
+    await asyncio.gather(*(client.connect() for client in clients))
+    try:
+        status, friends = await clients[0].request('GET', "/friends")
+        if status != 200 or not friends:
+            raise RuntimeError("The ledger needs friends to add expenses")
+        latencies, errors = {}, {}
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            run_connection(client, friends, deadline, writes, random.Random(seed + index), latencies, errors)
+            for index, client in enumerate(clients)))
+        return latencies, errors, time.perf_counter() - started
+    finally:
+        for client in clients:
+            client.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(latencies, errors, elapsed):
+    print(f"{'request':<12} {'count':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+    rows = sorted(latencies.items()) + [('all', [value for values in latencies.values() for value in values])]
+    for kind, values in rows:
+        values = sorted(values)
+        failed = sum(errors.values()) if kind == 'all' else errors.get(kind, 0)
+        print(f"{kind:<12} {len(values):>8} {len(values) / elapsed:>9.0f} {percentile(values, 0.5) * 1000:>8.2f} "
+              f"{percentile(values, 0.99) * 1000:>8.2f} {values[-1] * 1000:>8.2f} {failed:>7}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(host, port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port of a running server")
+    parser.add_argument("--spawn", type=int, metavar="EXPENSES",
+                        help="start a server on a synthetic ledger of this many expenses instead")
+    parser.add_argument("--connections", type=int, default=20, help="concurrent connections")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run")
+    parser.add_argument("--writes", type=float, default=0.1, help="share of requests that write")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.spawn is None:
+        latencies, errors, elapsed = asyncio.run(
+            load_test(args.host, args.port, args.connections, args.duration, args.writes, args.seed))
+        report(latencies, errors, elapsed)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_snapshot(directory, args.spawn)
+        port = free_port()
+        process = subprocess.Popen([sys.executable, SERVER, "--directory", directory, "--port", str(port)],
+                                   stdout=subprocess.DEVNULL)
+        try:
+            wait_until_up("127.0.0.1", port, process, timeout=600)
+            latencies, errors, elapsed = asyncio.run(
+                load_test("127.0.0.1", port, args.connections, args.duration, args.writes, args.seed))
+        finally:
+            process.terminate()
+            process.wait()
+        report(latencies, errors, elapsed)
+
+
+if __name__ == "__main__":
+    main()
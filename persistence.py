@@ -0,0 +1,117 @@
+import queue
+import threading
+from collections import OrderedDict
+
+
+class PersistenceWorker:
+    """Runs disk writes on a dedicated thread so the Tk main loop never waits on them.
+
+    Jobs are submitted from the main thread as ``run(payload)`` callables.
+    A job submitted under a ``key`` that is still waiting in the queue is
+    merged into the waiting one with ``merge(older, newer)`` (or simply
+    replaces it), so a newer snapshot supersedes older ones instead of
+    queueing behind them. The queue holds at most ``maxsize`` jobs;
+    submitting to a full queue waits for the writer to catch up.
+
+    ``on_done(result)`` and ``on_error(exception)`` are called back on the
+    Tk thread, polled with ``root.after``. A job that fails without an
+    ``on_error`` is reported through ``root.report_callback_exception``.
+    """
+
+    def __init__(self, root, maxsize=16, poll_interval=50):
+        self.root = root
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self.jobs = OrderedDict()  # key -> [payload, run, merge, on_done, on_error]
+        self.results = queue.Queue()
+        self.outstanding = 0  # Jobs whose callbacks have not run yet
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._next_anonymous = 0
+        self._poll_job = None
+        self._thread = threading.Thread(target=self._work, name="persistence-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, run, payload=None, key=None, merge=None, on_done=None, on_error=None):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Persistence worker is closed")
+            job = self.jobs.get(key) if key is not None else None
+            if job is not None:
+                # Still queued: fold the new payload into it rather than writing twice
+                job[0] = merge(job[0], payload) if merge is not None else payload
+                job[3:] = [on_done, on_error]
+                return
+
+            while len(self.jobs) >= self.maxsize:
+                self._condition.wait()
+            if key is None:
+                key = ('anonymous', self._next_anonymous)
+                self._next_anonymous += 1
+            self.jobs[key] = [payload, run, merge, on_done, on_error]
+            self.outstanding += 1
+            self._condition.notify_all()
+        self._schedule_poll()
+
+    def flush(self, timeout=None):
+        """Wait until every queued job has been written, returns False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self.jobs and not self._busy, timeout)
+
+    def close(self, timeout=None):
+        """Write everything still queued, stop the thread and deliver the callbacks"""
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        self._deliver()
+        return flushed
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.jobs or self._closed)
+                if not self.jobs:
+                    return
+                key, (payload, run, merge, on_done, on_error) = self.jobs.popitem(last=False)
+                self._busy = True
+                self._condition.notify_all()
+
+            try:
+                self.results.put((on_done, run(payload), None))
+            except Exception as e:
+                self.results.put((on_error, None, e))
+
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def _schedule_poll(self):
+        # Only poll while something is in flight, so an idle window stays idle
+        if self._poll_job is None and not self._closed:
+            self._poll_job = self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._poll_job = None
+        try:
+            self._deliver()
+        finally:
+            # A callback that raised still leaves the rest to be delivered
+            if self.outstanding:
+                self._schedule_poll()
+
+    def _deliver(self):
+        while True:
+            try:
+                callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.outstanding -= 1
+            if error is not None and callback is None:
+                # Raising here would stop the polling, and flush on exit would wait forever
+                self.root.report_callback_exception(type(error), error, error.__traceback__)
+                continue
+            if callback is not None:
+                callback(error if error is not None else result)
@@ -0,0 +1,213 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from tkinter import ttk
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class HandlerStats:
+    """Rolling timings of one handler: the last ``window`` calls plus lifetime counts"""
+
+    def __init__(self, window):
+        self.durations = deque(maxlen=window)  # milliseconds
+        self.calls = 0
+        self.total = 0.0
+        self.rows = 0  # Ledger rows at the last call
+
+    def record(self, duration, rows):
+        self.durations.append(duration)
+        self.calls += 1
+        self.total += duration
+        self.rows = rows
+
+    def summary(self):
+        durations = sorted(self.durations)
+        return {
+            'calls': self.calls,
+            'rows': self.rows,
+            'mean_ms': self.total / self.calls if self.calls else 0.0,
+            'p50_ms': percentile(durations, 0.50),
+            'p95_ms': percentile(durations, 0.95),
+            'max_ms': durations[-1] if durations else 0.0,
+            'histogram': self.histogram(durations),
+        }
+
+    @staticmethod
+    def histogram(durations):
+        """Counts per power-of-two bucket: ``"<1"``, ``"1-2"``, ``"2-4"`` ms and so on"""
+        buckets = {}
+        for duration in durations:
+            if duration < 1:
+                label = "<1"
+            else:
+                low = 1 << (int(duration).bit_length() - 1)
+                label = f"{low}-{low * 2}"
+            buckets[label] = buckets.get(label, 0) + 1
+        return buckets
+
+
+class Profiler:
+    """Times handlers of an object by wrapping its methods.
+
+    Each call records its wall time and the row count reported by
+    ``rows()`` into a rolling window per handler, and a trace event for
+    Chrome's trace viewer (about://tracing or Perfetto). ``rows()`` may
+    cost a query, e.g. ``COUNT(*)`` with SQLite, so it is read at most
+    once every ``rows_interval`` seconds and the count reused in between.
+    ``cProfile`` can be switched on and off around any stretch of use.
+    """
+
+    def __init__(self, window=500, trace_size=10000, rows_interval=1.0):
+        self.window = window
+        self.rows_interval = rows_interval
+        self.stats = {}  # handler name -> HandlerStats
+        self.trace = deque(maxlen=trace_size)
+        self.started = time.perf_counter()
+        self.cprofile = None
+        self._rows = {}  # rows callable -> (time read, count)
+        self._lock = threading.Lock()
+
+    def instrument(self, target, names, rows=lambda: 0):
+        """Replace ``target``'s methods ``names`` with timed wrappers.
+
+        Must run before the methods are bound anywhere else, e.g. as widget
+        commands, or those references keep calling the untimed method.
+        """
+        for name in names:
+            setattr(target, name, self.timed(name, getattr(target, name), rows))
+
+    def timed(self, name, handler, rows=lambda: 0):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                self.record(name, start, end, self.count_rows(rows, end))
+        return wrapper
+
+    def count_rows(self, rows, now):
+        """``rows()``, or the count it gave less than ``rows_interval`` seconds before ``now``"""
+        cached = self._rows.get(rows)
+        if cached is None or now - cached[0] >= self.rows_interval:
+            cached = self._rows[rows] = (now, rows())
+        return cached[1]
+
+    def record(self, name, start, end, rows):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = HandlerStats(self.window)
+            stats.record((end - start) * 1000, rows)
+            self.trace.append((name, start, end, threading.get_ident(), rows))
+
+    def summary(self):
+        with self._lock:
+            return {name: stats.summary() for name, stats in self.stats.items()}
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def export_chrome_trace(self, path):
+        with self._lock:
+            trace = list(self.trace)
+        events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self.started) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': thread,
+            'args': {'rows': rows},
+        } for name, start, end, thread, rows in trace]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def start_cprofile(self):
+        if self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop_cprofile(self, path):
+        """Stop the capture and write it to ``path`` for pstats or snakeviz"""
+        profile, self.cprofile = self.cprofile, None
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(path)
+
+
+class ProfilerOverlay:
+    """A small window with p50/p95 per handler, refreshed every ``interval`` ms"""
+
+    def __init__(self, root, profiler, interval=1000):
+        self.root = root
+        self.profiler = profiler
+        self.interval = interval
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Performance")
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
+
+        columns = ('handler', 'calls', 'rows', 'p50', 'p95', 'max')
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings', height=8)
+        for column, heading, width in zip(columns, ("Handler", "Calls", "Rows", "p50 ms", "p95 ms", "Max ms"),
+                                          (170, 60, 70, 70, 70, 70)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor="e" if column != 'handler' else "w")
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(fill=tk.X, padx=5, pady=(0, 5))
+        ttk.Button(buttons, text="Export JSON", command=self.export_json).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Export Chrome trace", command=self.export_trace).pack(side=tk.LEFT, padx=5)
+        self.cprofile_button = ttk.Button(buttons, text="Start cProfile", command=self.toggle_cprofile)
+        self.cprofile_button.pack(side=tk.LEFT)
+
+        self.refresh()
+
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in sorted(self.profiler.summary().items()):
+            self.tree.insert('', 'end', values=(
+                name, stats['calls'], stats['rows'],
+                f"{stats['p50_ms']:.1f}", f"{stats['p95_ms']:.1f}", f"{stats['max_ms']:.1f}",
+            ))
+        self.root.after(self.interval, self.refresh)
+
+    def export_json(self):
+        path = self._ask_path(".json", "Export handler timings")
+        if path:
+            self.profiler.export_json(path)
+
+    def export_trace(self):
+        path = self._ask_path(".json", "Export Chrome trace")
+        if path:
+            self.profiler.export_chrome_trace(path)
+
+    def toggle_cprofile(self):
+        if self.profiler.cprofile is None:
+            self.profiler.start_cprofile()
+            self.cprofile_button.configure(text="Stop cProfile")
+            return
+        path = self._ask_path(".prof", "Save cProfile capture")
+        if path:
+            self.profiler.stop_cprofile(path)
+            self.cprofile_button.configure(text="Start cProfile")
+
+    def _ask_path(self, extension, title):
+        from tkinter import filedialog
+
+        return filedialog.asksaveasfilename(parent=self.window, defaultextension=extension, title=title)
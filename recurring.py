@@ -0,0 +1,105 @@
+from calendar import monthrange
+from datetime import date as Date, timedelta
+
+from currency import DEFAULT_CURRENCY
+
+
+FREQUENCIES = ["daily", "weekly", "monthly", "yearly"]
+
+# A rule is a dict like an expense with ``start``, ``frequency``,
+# ``interval`` (every n periods), ``until`` (last date or None) and
+# ``skip``, the ISO dates of occurrences taken out of it.
+
+
+def occurrence(rule, k):
+    """Date of a rule's ``k``-th occurrence, counting from 0 at its start"""
+    first = Date.fromisoformat(rule['start'])
+    frequency = rule['frequency']
+    if frequency == 'daily':
+        return first + timedelta(days=k * rule['interval'])
+    if frequency == 'weekly':
+        return first + timedelta(weeks=k * rule['interval'])
+    months = first.month - 1 + k * rule['interval'] * (12 if frequency == 'yearly' else 1)
+    year, month = first.year + months // 12, months % 12 + 1
+    # The 31st repeats on the last day of shorter months
+    return Date(year, month, min(first.day, monthrange(year, month)[1]))
+
+
+def first_at_or_after(rule, day):
+    """Index of the first occurrence on or after ``day``, in O(1)"""
+    first = Date.fromisoformat(rule['start'])
+    if day <= first:
+        return 0
+    frequency = rule['frequency']
+    if frequency in ('daily', 'weekly'):
+        step = rule['interval'] * (7 if frequency == 'weekly' else 1)
+        return -(-(day - first).days // step)
+    step = rule['interval'] * (12 if frequency == 'yearly' else 1)
+    months = (day.year - first.year) * 12 + day.month - first.month
+    k = max(months // step, 0)
+    while occurrence(rule, k) < day:
+        k += 1
+    return k
+
+
+def window(rule, start=None, end=None):
+    """Range of occurrence indexes from ``start`` to ``end``, both dates included and optional"""
+    until = Date.fromisoformat(rule['until']) if rule['until'] else None
+    if end is None or (until is not None and until < end):
+        end = until
+    low = first_at_or_after(rule, start) if start is not None else 0
+    if end is None:
+        return low, None
+    return low, first_at_or_after(rule, end + timedelta(days=1))
+
+
+def occurrences(rule, start=None, end=None):
+    """Dates a rule falls on from ``start`` to ``end``, generated lazily; skipped dates are left out.
+
+    Without an end, or an ``until`` on the rule, the generator never stops.
+    """
+    skip = set(rule['skip'])
+    k, stop = window(rule, start, end)
+    while stop is None or k < stop:
+        day = occurrence(rule, k)
+        if day.isoformat() not in skip:
+            yield day
+        k += 1
+
+
+def count(rule, start, end):
+    """Number of occurrences from ``start`` to ``end``, worked out without generating them"""
+    low, stop = window(rule, start, end)
+    skipped = sum(1 for day in rule['skip'] if start <= Date.fromisoformat(day) <= end)
+    return max(stop - low - skipped, 0)
+
+
+def rule_totals(rules, start, end, currency=DEFAULT_CURRENCY, rates=None):
+    """Paid and owed by friend for every occurrence of ``rules`` from ``start`` to ``end``.
+
+    Friends are keyed however the rules name them. Rules in ``currency``
+    cost one ``count``; others are converted at each occurrence's rate,
+    which needs ``rates``.
+    """
+    paid = {}
+    owed = {}
+    for rule in rules:
+        if rule['currency'] == currency:
+            amount = rule['amount'] * count(rule, start, end)
+        else:
+            if rates is None:
+                raise ValueError(f"No exchange rates to convert {rule['currency']}")
+            ordinals = [day.toordinal() for day in occurrences(rule, start, end)]
+            amount = rule['amount'] * sum(rates.factors(rule['currency'], currency, ordinals))
+        if not amount:
+            continue
+        paid[rule['payer']] = paid.get(rule['payer'], 0.0) + amount
+        share = amount / len(rule['participants'])
+        for participant in rule['participants']:
+            owed[participant] = owed.get(participant, 0.0) + share
+    return paid, owed
+
+
+def next_occurrence(rule, today=None):
+    """The first date on or after ``today`` the rule falls on, or None if it has ended"""
+    return next(iter(occurrences(rule, today or Date.today(), None)), None)
@@ -0,0 +1,162 @@
+from collections import defaultdict
+from datetime import date as Date
+
+from currency import DEFAULT_CURRENCY
+from friends import mask_ids
+
+
+def month_index(year, month):
+    return year * 12 + month - 1
+
+
+class FenwickTree:
+    """Prefix sums over positions ``0..size-1`` with O(log n) updates and queries"""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0.0] * (size + 1)
+
+    @classmethod
+    def from_points(cls, size, points):
+        """Build from a ``{position: value}`` dict in O(size)"""
+        fenwick = cls(size)
+        tree = fenwick.tree
+        for position, value in points.items():
+            tree[position + 1] += value
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        return fenwick
+
+    def add(self, position, delta):
+        i = position + 1
+        tree = self.tree
+        while i <= self.size:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, end):
+        """Sum of positions ``0..end-1``"""
+        total = 0.0
+        i = min(end, self.size)
+        tree = self.tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def range(self, start, end):
+        """Sum of positions ``start..end-1``"""
+        return self.prefix(end) - self.prefix(max(start, 0))
+
+
+class BucketSums:
+    """Sums per key over integer buckets such as day ordinals or month indexes.
+
+    Buckets are grouped in blocks of ``block`` consecutive ones, and each
+    key has a Fenwick tree per block that holds data plus the block's
+    total. Memory follows the blocks in use, not the span from the first
+    bucket to the last, so an expense with a mistyped year costs one more
+    block rather than centuries of empty buckets. Updates are O(log
+    block); a range sum is O(log block) plus a step per block it spans.
+    """
+
+    def __init__(self, points=None, block=1024):
+        """``points`` maps each key to ``{bucket: value}`` for a bulk build"""
+        self.block = block
+        self.trees = {}  # key -> {block index: FenwickTree}
+        self.totals = {}  # key -> {block index: sum of the block}
+        for key, key_points in (points or {}).items():
+            by_block = defaultdict(dict)
+            for bucket, value in key_points.items():
+                index, position = divmod(bucket, block)
+                by_block[index][position] = value
+            self.trees[key] = {index: FenwickTree.from_points(block, block_points)
+                               for index, block_points in by_block.items()}
+            self.totals[key] = {index: sum(block_points.values()) for index, block_points in by_block.items()}
+
+    def add(self, key, bucket, delta):
+        index, position = divmod(bucket, self.block)
+        trees = self.trees.setdefault(key, {})
+        tree = trees.get(index)
+        if tree is None:
+            tree = trees[index] = FenwickTree(self.block)
+        tree.add(position, delta)
+        totals = self.totals.setdefault(key, {})
+        totals[index] = totals.get(index, 0.0) + delta
+
+    def between(self, key, first, last):
+        """Sum for ``key`` over buckets ``first..last``, both included"""
+        trees = self.trees.get(key)
+        if not trees or last < first:
+            return 0.0
+        first_index, first_position = divmod(first, self.block)
+        last_index, last_position = divmod(last, self.block)
+        if first_index == last_index:
+            tree = trees.get(first_index)
+            return tree.range(first_position, last_position + 1) if tree is not None else 0.0
+
+        total = 0.0
+        tree = trees.get(first_index)
+        if tree is not None:
+            total += tree.range(first_position, self.block)
+        tree = trees.get(last_index)
+        if tree is not None:
+            total += tree.prefix(last_position + 1)
+        # Whole blocks in between, walking whichever is shorter
+        totals = self.totals[key]
+        if last_index - first_index - 1 <= len(totals):
+            total += sum(totals.get(index, 0.0) for index in range(first_index + 1, last_index))
+        else:
+            total += sum(value for index, value in totals.items() if first_index < index < last_index)
+        return total
+
+
+class Rollups:
+    """Per-day and per-month spend, paid and owed for a ledger's stored expenses.
+
+    Keys are ``'spend'`` for the total, ``('paid', friend_id)`` and
+    ``('owed', friend_id)``. Range sums over days or months cost O(log n)
+    per key, and ``apply`` updates them as expenses change. Only expenses
+    in the default currency are counted.
+    """
+
+    def __init__(self, records=()):
+        day_points = defaultdict(lambda: defaultdict(float))
+        month_points = defaultdict(lambda: defaultdict(float))
+        for record in records:
+            for key, day, month, delta in self._deltas(record, 1):
+                day_points[key][day] += delta
+                month_points[key][month] += delta
+        self.days = BucketSums(day_points)
+        self.months = BucketSums(month_points)
+
+    def apply(self, record, sign):
+        for key, day, month, delta in self._deltas(record, sign):
+            self.days.add(key, day, delta)
+            self.months.add(key, month, delta)
+
+    def spend_between(self, start, end):
+        return self.days.between('spend', start.toordinal(), end.toordinal())
+
+    def between(self, kind, friend_id, start, end):
+        return self.days.between((kind, friend_id), start.toordinal(), end.toordinal())
+
+    def month(self, key, year, month):
+        index = month_index(year, month)
+        return self.months.between(key, index, index)
+
+    def _deltas(self, record, sign):
+        if record['currency'] != DEFAULT_CURRENCY:
+            return
+        day = Date.fromisoformat(record['date'])
+        ordinal = day.toordinal()
+        month = month_index(day.year, day.month)
+        amount = sign * record['amount']
+        participants = mask_ids(record['participants'])
+        share = amount / len(participants)
+        yield 'spend', ordinal, month, amount
+        yield ('paid', record['payer']), ordinal, month, amount
+        for participant in participants:
+            yield ('owed', participant), ordinal, month, share
@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+
+
+class RefreshScheduler:
+    """Coalesces GUI redraws and saves requested while handling changes.
+
+    Panels are registered with the callback that redraws them. ``mark``
+    flags panels as dirty and schedules a single redraw pass with
+    ``after_idle``, so several changes in one event cost one redraw of each
+    affected panel. ``request_save`` restarts a debounce timer so a burst
+    of changes is saved once, ``save_delay`` milliseconds after the last.
+    Inside ``batch()`` nothing is drawn until the outermost batch ends.
+    """
+
+    def __init__(self, root, save=None, save_delay=500):
+        self.root = root
+        self.save = save
+        self.save_delay = save_delay
+        self.panels = {}  # panel name -> redraw callback, in drawing order
+        self.dirty = set()
+        self.save_pending = False
+        self._batch_depth = 0
+        self._redraw_job = None
+        self._save_job = None
+
+    def register(self, panel, redraw):
+        self.panels[panel] = redraw
+
+    def mark(self, *panels):
+        self.dirty.update(panels)
+        if self._batch_depth == 0 and self._redraw_job is None:
+            self._redraw_job = self.root.after_idle(self.flush)
+
+    def flush(self):
+        """Redraw every dirty panel now"""
+        if self._redraw_job is not None:
+            self.root.after_cancel(self._redraw_job)
+            self._redraw_job = None
+        dirty, self.dirty = self.dirty, set()
+        for panel, redraw in self.panels.items():
+            if panel in dirty:
+                redraw()
+
+    def request_save(self):
+        self.save_pending = True
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+        self._save_job = self.root.after(self.save_delay, self.flush_save)
+
+    def flush_save(self):
+        """Save now if a save is pending, e.g. before the window closes"""
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+            self._save_job = None
+        if self.save_pending and self.save is not None:
+            self.save_pending = False
+            self.save()
+
+    @contextmanager
+    def batch(self):
+        """Hold back redraws until the block ends, for bulk edits"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self.dirty and self._redraw_job is None:
+                self._redraw_job = self.root.after_idle(self.flush)
@@ -0,0 +1,433 @@
+"""Local HTTP/JSON API over one in-memory ledger, for several people logging expenses at once.
+
+Serves the ledger in a directory on localhost with only the standard
+library::
+
+    python server.py                             # the ledger in the working directory
+    python server.py --directory groups/Trip --port 8800
+    python ExpensesManage.py --serve             # the same, from the app
+
+Routes, all JSON:
+
+    GET    /friends                    POST   /friends {"name"}
+    PATCH  /friends/<name> {"name"}    DELETE /friends/<name>
+    GET    /expenses?date=&description=&payer=&participant=&offset=&limit=
+    GET    /expenses/<id>              POST   /expenses {"date", "description", "amount",
+    PUT    /expenses/<id> {...}               "payer", "participants", "currency"}
+    DELETE /expenses/<id>
+    GET    /totals?currency=           GET    /settlements?strategy=
+    GET    /reports?start=&end=        GET    /rules
+    POST   /undo                       POST   /redo
+
+Reads are answered straight away by the connection's task, so any number
+run interleaved. Writes are queued to a single writer task, which applies
+them in order through the undo history, saves each group of queued
+writes as one batch on a disk thread and only then replies, so a write
+that got a reply is on disk. Every write is a whole ledger operation
+run on the event loop, so a read never sees one half done.
+
+The writer task also takes in what other windows or programs save to
+the same ledger, before each group of writes and every second when
+idle. Writes that collide with theirs get 409 Conflict and the ledger
+is loaded again, rather than saved over their changes.
+
+There is no authentication: the server only listens on localhost unless
+told otherwise.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from currency import DEFAULT_CURRENCY, RATES_FILE, FxRates
+from journal import ConflictError, JournalStore
+from ledger import Ledger
+from settlement import STRATEGIES, settle
+
+
+DEFAULT_PORT = 8765
+MAX_BODY = 1 << 20
+# Writes applied and saved together at most
+WRITE_BATCH = 256
+# Seconds between checks for changes saved by others while no writes come in
+WATCH_INTERVAL = 1.0
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_KINDS = {str: "text", list: "a list", (int, float, str): "a number"}
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LedgerServer:
+    """Serves the ledger in ``directory`` over HTTP until ``stop`` is called"""
+
+    def __init__(self, directory=".", backend="json", host="127.0.0.1", port=DEFAULT_PORT):
+        self.directory = directory
+        self.backend = backend
+        self.ledger, self.store = open_ledger(directory, backend)
+        # Re-read when the file changes, before anything is converted
+        self.rates = FxRates(os.path.join(directory, RATES_FILE))
+        self.host = host
+        self.port = port
+        self.writes = None  # Queue of (operation, future) for the writer task
+        self.disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger-writer")
+        self.server = None
+        self.writer_task = None
+        self.connections = {}  # Stream writer -> task of each open connection
+
+    async def start(self):
+        await self._load(self.ledger, self.store)
+        self.writes = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self._write_loop())
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        # Idle keep-alive connections would otherwise keep waiting for a request
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        await self.server.wait_closed()
+        await self.writes.join()
+        self.writer_task.cancel()
+        self.disk.shutdown()
+        self.store.close()
+
+    async def write(self, operation):
+        """Run ``operation(ledger, history)`` on the writer task, returns its result once saved"""
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((operation, future))
+        return await future
+
+    # Routes
+
+    async def handle(self, method, path, query, body):
+        """``(status, payload)`` for one request"""
+        parts = [unquote(part) for part in path.strip("/").split("/") if part]
+        if not parts:
+            raise HTTPError(404, "Not found")
+        resource, rest = parts[0], parts[1:]
+        ledger = self.ledger
+
+        if resource == 'friends' and not rest:
+            if method == 'GET':
+                return 200, ledger.friends
+            if method == 'POST':
+                name = _field(body, 'name')
+                if not await self.write(lambda ledger, history: history.add_friend(ledger, name)):
+                    raise HTTPError(400, f"{name} is already a friend")
+                return 201, {'name': name.strip()}
+        elif resource == 'friends' and len(rest) == 1:
+            name = rest[0]
+            if name not in ledger.friends:
+                raise HTTPError(404, f"Unknown friend: {name}")
+            if method == 'PATCH':
+                new_name = _field(body, 'name')
+                if not await self.write(lambda ledger, history: history.rename_friend(ledger, name, new_name)):
+                    raise HTTPError(400, f"Cannot rename {name} to {new_name}")
+                return 200, {'name': new_name.strip()}
+            if method == 'DELETE':
+                removed = await self.write(lambda ledger, history: history.remove_friends(ledger, [name]))
+                return 200, {'removed_expenses': len(removed)}
+
+        elif resource == 'expenses' and not rest:
+            if method == 'GET':
+                return 200, self._expenses(query)
+            if method == 'POST':
+                expense = _expense_fields(body)
+                return 201, await self.write(lambda ledger, history: history.add_expense(ledger, *expense))
+        elif resource == 'expenses' and len(rest) == 1:
+            expense_id = _int(rest[0], "expense id")
+            if expense_id not in ledger:
+                raise HTTPError(404, f"No expense {expense_id}")
+            if method == 'GET':
+                return 200, ledger.get(expense_id)
+            if method == 'PUT':
+                expense = _expense_fields(body)
+                return 200, await self.write(
+                    lambda ledger, history: history.update_expense(ledger, expense_id, *expense))
+            if method == 'DELETE':
+                await self.write(lambda ledger, history: history.delete_expenses(ledger, [expense_id]))
+                return 200, {'id': expense_id}
+
+        elif resource == 'totals' and not rest and method == 'GET':
+            self.rates.reload()
+            totals = ledger.totals(query.get('currency') or None)
+            return 200, {friend: {'paid': paid, 'owed': owed, 'balance': paid - owed}
+                         for friend, (paid, owed) in totals.items()}
+        elif resource == 'settlements' and not rest and method == 'GET':
+            strategy = query.get('strategy', STRATEGIES[0])
+            if strategy not in STRATEGIES:
+                raise HTTPError(400, f"Strategy must be one of {', '.join(STRATEGIES)}")
+            self.rates.reload()
+            return 200, [{'from': debtor, 'to': creditor, 'amount': amount}
+                         for debtor, creditor, amount in settle(ledger.balances(), strategy=strategy)]
+        elif resource == 'reports' and not rest and method == 'GET':
+            start, end = _field(query, 'start'), _field(query, 'end')
+            return 200, {'spent': ledger.spend_between(start, end), 'paid': ledger.paid_between(start, end),
+                         'shares': ledger.shares_between(start, end)}
+        elif resource == 'rules' and not rest and method == 'GET':
+            return 200, ledger.rules_list()
+        elif resource in ('undo', 'redo') and not rest and method == 'POST':
+            label = await self.write(lambda ledger, history: getattr(history, resource)(ledger))
+            return 200, {'label': label}
+        else:
+            raise HTTPError(404, "Not found")
+        raise HTTPError(405, f"{method} is not allowed here")
+
+    def _expenses(self, query):
+        filters = {criteria: query[criteria] for criteria in ('date', 'description', 'payer', 'participant')
+                   if query.get(criteria)}
+        expense_ids = self.ledger.query_ids(**filters)
+        offset = max(_int(query.get('offset', 0), "offset"), 0)
+        limit = min(max(_int(query.get('limit', PAGE_SIZE), "limit"), 0), MAX_PAGE_SIZE)
+        page = expense_ids[offset:offset + limit]
+        return {'total': len(expense_ids), 'expenses': [self.ledger.get(expense_id) for expense_id in page]}
+
+    # Internals
+
+    async def _load(self, ledger, store):
+        ledger.rates = self.rates
+        if isinstance(ledger, Ledger):
+            # Loading reads files only, the ledger is handed to the loop once complete
+            await asyncio.get_running_loop().run_in_executor(self.disk, store.load, ledger)
+        else:
+            # An SQLite connection belongs to the thread that opened it
+            store.load(ledger)
+
+    async def _reload(self):
+        """Load the ledger again after its files changed under writes not yet saved"""
+        ledger, store = open_ledger(self.directory, self.backend)
+        try:
+            await self._load(ledger, store)
+        except Exception as e:
+            # Keep serving the ledger there is, its next save refuses again and retries this
+            print(f"Failed to load the ledger again: {e!r}", file=sys.stderr, flush=True)
+            return
+        # Reads in between still see the old ledger, then all of them the new one
+        self.ledger, self.store = ledger, store
+
+    async def _sync(self):
+        try:
+            try:
+                self.store.sync(self.ledger)
+            except ConflictError:
+                await self._reload()
+        except OSError:
+            pass  # Files being replaced, the next check will see them
+        except Exception as e:
+            # The writer task must outlive a bad read, the next check tries again
+            print(f"Failed to take in outside changes: {e!r}", file=sys.stderr, flush=True)
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                job = await asyncio.wait_for(self.writes.get(), WATCH_INTERVAL)
+            except asyncio.TimeoutError:
+                await self._sync()
+                continue
+            jobs = [job]
+            # Writes that queued up while the last batch was saved are saved together
+            while len(jobs) < WRITE_BATCH and not self.writes.empty():
+                jobs.append(self.writes.get_nowait())
+            # Applied on top of what others saved, so the batch does not collide with it
+            await self._sync()
+
+            for attempt in range(2):
+                results = []
+                history = self.store.history
+                for operation, future in jobs:
+                    try:
+                        results.append((future, operation(self.ledger, history), None))
+                    except Exception as e:
+                        # Only this request fails, the writer carries on with the rest
+                        results.append((future, None, e))
+
+                error = None
+                store = self.store
+                batch = None
+                try:
+                    batch = store.take_batch()
+                    if batch is not None:
+                        await loop.run_in_executor(self.disk, store.write_batch, batch)
+                except ConflictError as e:
+                    error = HTTPError(409, f"{e}, nothing was saved")
+                    await self._reload()
+                    if attempt == 0 and self.store is not store:
+                        # Saved elsewhere since the sync above: the requests run again on
+                        # what is there now, so their replies have the ids that get saved
+                        continue
+                except Exception as e:
+                    store.write_failed()
+                    if batch is None or isinstance(self.ledger, Ledger):
+                        # The changes are only in memory: reported as failed, they must not be
+                        # saved with a later batch, so the ledger goes back to what is on disk
+                        error = HTTPError(500, f"Failed to save, the changes were undone: {e}")
+                        await self._reload()
+                    # Otherwise SQLite committed them in take_batch and only the undo history
+                    # was lost, which the next batch rewrites
+                break
+
+            for future, result, operation_error in results:
+                if not future.done():
+                    if operation_error is not None or error is not None:
+                        future.set_exception(operation_error or error)
+                    else:
+                        future.set_result(result)
+                self.writes.task_done()
+
+    async def _serve_connection(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HTTPError as e:
+                    await _respond(writer, e.status, {'error': str(e)}, close=True)
+                    return
+                if request is None:
+                    return
+                method, target, headers, body = request
+                close = headers.get('connection', '').lower() == 'close'
+
+                url = urlsplit(target)
+                query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                try:
+                    payload = json.loads(body) if body else {}
+                    status, result = await self.handle(method, url.path, query, payload)
+                except json.JSONDecodeError as e:
+                    status, result = 400, {'error': f"Invalid JSON: {e}"}
+                except HTTPError as e:
+                    status, result = e.status, {'error': str(e)}
+                except KeyError as e:
+                    status, result = 404, {'error': f"Not found: {e}"}
+                except (ValueError, TypeError) as e:
+                    status, result = 400, {'error': str(e)}
+                except Exception as e:
+                    status, result = 500, {'error': f"{type(e).__name__}: {e}"}
+                await _respond(writer, status, result, close)
+                if close:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+
+async def _read_request(reader):
+    """``(method, target, headers, body)`` of the next request, or None once the client is gone"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HTTPError(400, "Content-Length must be a whole number")
+    if length < 0:
+        raise HTTPError(400, "Content-Length must be a whole number")
+    if length > MAX_BODY:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def _respond(writer, status, payload, close=False):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"{'Connection: close' + chr(13) + chr(10) if close else ''}\r\n")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+def _field(data, name, kind=str):
+    """``data[name]``, which must be present and of type ``kind``"""
+    if not isinstance(data, dict) or data.get(name) in (None, ""):
+        raise HTTPError(400, f"{name} is required")
+    value = data[name]
+    # bool is an int, but never a meaningful amount
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise HTTPError(400, f"{name} must be {_KINDS[kind]}")
+    return value
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be a whole number")
+
+
+def _expense_fields(body):
+    """The arguments of ``add_expense`` after the ledger, from a request body"""
+    participants = _field(body, 'participants', list)
+    if not all(isinstance(participant, str) for participant in participants):
+        raise HTTPError(400, "participants must be a list of names")
+    currency = body.get('currency') or DEFAULT_CURRENCY
+    if not isinstance(currency, str):
+        raise HTTPError(400, "currency must be text")
+    return (_field(body, 'date'), _field(body, 'description'), float(_field(body, 'amount', (int, float, str))),
+            _field(body, 'payer'), participants, currency)
+
+
+def open_ledger(directory, backend="json"):
+    if backend == "sqlite":
+        from sqlite_store import SQLiteLedger, SQLiteStore
+        return SQLiteLedger(os.path.join(directory, "expenses.db")), SQLiteStore(directory)
+    return Ledger(), JournalStore(directory)
+
+
+def serve(directory=".", host="127.0.0.1", port=DEFAULT_PORT, backend="json"):
+    """Run the API until interrupted"""
+    async def main():
+        server = LedgerServer(directory, backend, host=host, port=port)
+        await server.start()
+        print(f"Serving {os.path.abspath(directory)} on http://{host}:{server.port}", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directory", default=".", help="ledger to serve (default: the working directory)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port (default: {DEFAULT_PORT})")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    args = parser.parse_args()
+    serve(args.directory, args.host, args.port, args.backend)
+
+
+if __name__ == "__main__":
+    main()
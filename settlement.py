@@ -0,0 +1,167 @@
+import heapq
+import time
+from collections import namedtuple
+
+
+Transfer = namedtuple('Transfer', ['debtor', 'creditor', 'amount'])
+
+STRATEGIES = ["minimal", "heap", "greedy"]
+
+
+def settle(balances, strategy="minimal", time_budget=0.5, max_exact=20):
+    """Transfers that bring every balance back to zero.
+
+    ``balances`` maps each friend to what they paid minus what they owe.
+    ``strategy`` is one of STRATEGIES:
+
+    - ``greedy``: the original matching of debtors against creditors
+    - ``heap``: repeatedly settles the largest debt against the largest
+      credit, O(n log n)
+    - ``minimal``: the fewest possible transfers, found by splitting the
+      group into as many zero-sum subgroups as possible. Groups larger
+      than ``max_exact`` people, or searches running past
+      ``time_budget`` seconds, fall back to ``heap``.
+    """
+    cents = _to_cents(balances)
+    if strategy == "greedy":
+        transfers = greedy_transfers(cents)
+    elif strategy == "heap":
+        transfers = heap_transfers(cents)
+    elif strategy == "minimal":
+        transfers = minimal_transfers(cents, time_budget, max_exact)
+    else:
+        raise ValueError(f"Unknown settlement strategy: {strategy}")
+    return [Transfer(debtor, creditor, amount / 100) for debtor, creditor, amount in transfers]
+
+
+def greedy_transfers(cents):
+    creditors = sorted(((name, amount) for name, amount in cents.items() if amount > 0), key=lambda item: -item[1])
+    debtors = sorted(((name, amount) for name, amount in cents.items() if amount < 0), key=lambda item: item[1])
+    credit = dict(creditors)
+
+    transfers = []
+    for debtor, debt in debtors:
+        remaining = -debt
+        for creditor, _ in creditors:
+            if remaining == 0:
+                break
+            payment = min(credit[creditor], remaining)
+            if payment:
+                credit[creditor] -= payment
+                remaining -= payment
+                transfers.append((debtor, creditor, payment))
+    return transfers
+
+
+def heap_transfers(cents):
+    creditors = [(-amount, name) for name, amount in cents.items() if amount > 0]
+    debtors = [(amount, name) for name, amount in cents.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        payment = min(-credit, -debt)
+        transfers.append((debtor, creditor, payment))
+        if -credit > payment:
+            heapq.heappush(creditors, (credit + payment, creditor))
+        if -debt > payment:
+            heapq.heappush(debtors, (debt + payment, debtor))
+    return transfers
+
+
+def minimal_transfers(cents, time_budget=0.5, max_exact=20):
+    """Fewest transfers: a zero-sum group of k people needs k - 1 of them,
+    so the answer maximises the number of zero-sum groups."""
+    transfers = []
+
+    # A debtor and a creditor with exactly opposite balances are always
+    # their own group, so settle those pairs before the search
+    by_amount = {}
+    remaining = {}
+    for name, amount in sorted(cents.items(), key=lambda item: item[1]):
+        if amount == 0:
+            continue
+        partners = by_amount.get(-amount)
+        if partners:
+            partner = partners.pop()
+            del remaining[partner]
+            debtor, creditor = (partner, name) if amount > 0 else (name, partner)
+            transfers.append((debtor, creditor, abs(amount)))
+        else:
+            by_amount.setdefault(amount, []).append(name)
+            remaining[name] = amount
+
+    if len(remaining) > max_exact:
+        return transfers + heap_transfers(remaining)
+
+    groups = _zero_sum_groups(remaining, time_budget)
+    if groups is None:
+        return transfers + heap_transfers(remaining)
+    for group in groups:
+        transfers.extend(heap_transfers({name: remaining[name] for name in group}))
+    return transfers
+
+
+def _zero_sum_groups(cents, time_budget):
+    """Partition into the most zero-sum groups, or None if out of time.
+
+    dp[mask] is the most zero-sum groups the people in ``mask`` can be
+    split into when taken in some order, counting a group every time the
+    running sum returns to zero.
+    """
+    names = list(cents)
+    values = [cents[name] for name in names]
+    n = len(names)
+    if n == 0:
+        return []
+
+    size = 1 << n
+    sums = [0] * size
+    dp = [0] * size
+    deadline = time.perf_counter() + time_budget
+    for mask in range(1, size):
+        if not mask & 0xFFF and time.perf_counter() > deadline:
+            return None
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + values[low.bit_length() - 1]
+        best = 0
+        bits = mask
+        while bits:
+            bit = bits & -bits
+            if dp[mask ^ bit] > best:
+                best = dp[mask ^ bit]
+            bits ^= bit
+        dp[mask] = best + (1 if sums[mask] == 0 else 0)
+
+    # Walk back from the full set, cutting a group wherever the sum is zero
+    groups = []
+    group = []
+    mask = size - 1
+    while mask:
+        target = dp[mask] - (1 if sums[mask] == 0 else 0)
+        if sums[mask] == 0 and group:
+            groups.append(group)
+            group = []
+        bits = mask
+        while bits:
+            bit = bits & -bits
+            if dp[mask ^ bit] == target:
+                break
+            bits ^= bit
+        group.append(names[bit.bit_length() - 1])
+        mask ^= bit
+    groups.append(group)
+    return groups
+
+
+def _to_cents(balances):
+    cents = {name: round(balance * 100) for name, balance in balances.items()}
+    # Rounding each balance can leave a paisa over, absorb it into the largest one
+    residual = sum(cents.values())
+    if residual and cents:
+        largest = max(cents, key=lambda name: abs(cents[name]))
+        cents[largest] -= residual
+    return cents
@@ -0,0 +1,386 @@
+"""Binary ledger snapshots, read through mmap.
+
+Layout, all little-endian::
+
+    header        magic, version, counts and the offset of each section
+    friend table  one FRIEND entry per friend, with their paid/owed totals
+    record table  one fixed-width RECORD per expense, in ledger order
+    participants  uint32 friend ids, each record points at a run of them
+    strings       UTF-8 names and descriptions, pointed at by offset/length
+
+Dates are day ordinals and currencies three ASCII letters in the record,
+empty for the default one (version 1 files have no currency at all). The
+friend table carries the totals as of the snapshot, so a reader can show
+them without touching a single record. A ledger loaded from a snapshot
+keeps it mapped behind ``SnapshotExpenses`` and decodes a record only
+when it is asked for. Totals only cover the default currency; the
+``MIXED`` header flag says other currencies are involved too.
+
+Run as a script to convert between this format and JSON::
+
+    python snapshot.py export [DIRECTORY]   # write friends.json/expenses.json
+    python snapshot.py import [DIRECTORY]   # rebuild expenses.snap from them
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from datetime import date as Date
+from itertools import chain, islice
+from operator import itemgetter, lt
+
+from currency import DEFAULT_CURRENCY
+
+
+MAGIC = b"EXPSNAP\0"
+VERSION = 2
+
+HEADER = struct.Struct("<8sHHIIQQQQQQ")
+FRIEND = struct.Struct("<IIQIxxxxdd")
+RECORD = struct.Struct("<QidIIQQI3s")
+RECORD_V1 = struct.Struct("<QidIIQQI")
+FORMER = 1  # FRIEND flag: named in expenses but not a friend
+MIXED = 1  # HEADER flag: some expenses are not in the default currency
+
+
+def write_snapshot(path, friends, next_friend_id, records, totals):
+    """Atomically write a snapshot.
+
+    ``friends`` are ``FriendRegistry.to_json()`` entries, ``records`` stored
+    expenses (participants as a bitmask) and ``totals`` maps friend id to
+    ``(paid, owed)`` in the default currency.
+    """
+    flags = 0
+    strings = []
+    string_size = 0
+
+    def intern(text):
+        nonlocal string_size
+        data = text.encode("utf-8")
+        strings.append(data)
+        string_size += len(data)
+        return string_size - len(data), len(data)
+
+    friend_table = bytearray(FRIEND.size * len(friends))
+    for index, friend in enumerate(friends):
+        paid, owed = totals.get(friend['id'], (0.0, 0.0))
+        FRIEND.pack_into(friend_table, index * FRIEND.size, friend['id'], FORMER if friend.get('former') else 0,
+                         *intern(friend['name']), paid, owed)
+
+    record_table = bytearray(RECORD.size * len(records))
+    participants = array('I')
+    for index, record in enumerate(records):
+        currency = record.get('currency', DEFAULT_CURRENCY)
+        if currency != DEFAULT_CURRENCY:
+            flags |= MIXED
+        mask = record['participants']
+        start = len(participants)
+        while mask:
+            low = mask & -mask
+            participants.append(low.bit_length() - 1)
+            mask ^= low
+        RECORD.pack_into(record_table, index * RECORD.size, record['id'],
+                         Date.fromisoformat(record['date']).toordinal(), record['amount'], record['payer'],
+                         len(participants) - start, start, *intern(record['description']),
+                         b"" if currency == DEFAULT_CURRENCY else currency.encode("ascii"))
+    if sys.byteorder == "big":
+        participants.byteswap()
+
+    friends_offset = HEADER.size
+    records_offset = friends_offset + len(friend_table)
+    participants_offset = records_offset + len(record_table)
+    strings_offset = participants_offset + len(participants) * participants.itemsize
+    header = HEADER.pack(MAGIC, VERSION, flags, len(friends), next_friend_id, len(records), len(participants),
+                         friends_offset, records_offset, participants_offset, strings_offset)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(friend_table)
+            f.write(record_table)
+            f.write(participants.tobytes())
+            f.write(b"".join(strings))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SnapshotReader:
+    """A snapshot mapped into memory.
+
+    Opening one reads only the header and the friend table. ``record(i)``
+    decodes a single expense and iterating decodes them all in one pass.
+    Records come out as stored expenses: payer id and participant bitmask.
+    ``ids`` and ``rows`` read the fixed-width columns straight from the
+    map, without making a dict per record.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.flags, friend_count, self.next_friend_id, self.count, self.participant_count,
+             self.friends_offset, self.records_offset, self.participants_offset,
+             self.strings_offset) = HEADER.unpack_from(self.mm, 0)
+        except struct.error:
+            self.mm.close()
+            raise ValueError(f"{path} is not a ledger snapshot")
+        if magic != MAGIC:
+            self.mm.close()
+            raise ValueError(f"{path} is not a ledger snapshot")
+        if version > VERSION:
+            self.mm.close()
+            raise ValueError(f"{path} was written by a newer version (snapshot format {version})")
+        self.record_format = RECORD if version >= 2 else RECORD_V1
+        self.mixed = bool(self.flags & MIXED)
+
+        self.friends = []  # FriendRegistry.to_json() entries
+        self.totals = {}  # friend name -> (paid, owed) in the default currency, current friends only
+        self.friend_totals = {}  # The same by friend id
+        for index in range(friend_count):
+            friend_id, flags, offset, length, paid, owed = FRIEND.unpack_from(
+                self.mm, self.friends_offset + index * FRIEND.size)
+            name = self._string(offset, length)
+            if flags & FORMER:
+                self.friends.append({'id': friend_id, 'name': name, 'former': True})
+            else:
+                self.friends.append({'id': friend_id, 'name': name})
+                self.totals[name] = self.friend_totals[friend_id] = (paid, owed)
+        self._dates = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for expense_id, date, description, amount, payer, participants, currency in self.rows():
+            mask = 0
+            for friend_id in participants:
+                mask |= 1 << friend_id
+            yield {
+                'id': expense_id,
+                'date': date,
+                'description': description,
+                'amount': amount,
+                'payer': payer,
+                'participants': mask,
+                'currency': currency,
+            }
+
+    def rows(self):
+        """``(id, date, description, amount, payer, participant ids, currency)`` of every record, in order"""
+        with memoryview(self.mm) as view:
+            if sys.byteorder == "little":
+                participants = view[self.participants_offset:self.strings_offset].cast('I')
+            else:
+                participants = array('I', view[self.participants_offset:self.strings_offset].tobytes())
+                participants.byteswap()
+            try:
+                for expense_id, ordinal, amount, payer, count, start, offset, length, *currency in \
+                        self.record_format.iter_unpack(view[self.records_offset:self.participants_offset]):
+                    yield (expense_id, self._date(ordinal), self._string(offset, length), amount, payer,
+                           tuple(participants[start:start + count]), self._currency(currency))
+            finally:
+                if isinstance(participants, memoryview):
+                    participants.release()
+
+    def ids(self):
+        """The expense ids in record order, read from their column alone"""
+        column = struct.Struct(f"<Q{self.record_format.size - 8}x")
+        with memoryview(self.mm) as view:
+            return array('q', map(itemgetter(0), column.iter_unpack(view[self.records_offset:self.participants_offset])))
+
+    def currency_counts(self):
+        """Map each currency to its number of expenses, read from the currency column only when mixed"""
+        if not self.mixed:
+            return {DEFAULT_CURRENCY: self.count} if self.count else {}
+        column = struct.Struct(f"<{self.record_format.size - 3}x3s")
+        counts = {}
+        with memoryview(self.mm) as view:
+            for field in column.iter_unpack(view[self.records_offset:self.participants_offset]):
+                currency = self._currency(field)
+                counts[currency] = counts.get(currency, 0) + 1
+        return counts
+
+    def record(self, index):
+        """Decode the expense at position ``index``"""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        expense_id, ordinal, amount, payer, count, start, offset, length, *currency = \
+            self.record_format.unpack_from(self.mm, self.records_offset + index * self.record_format.size)
+        mask = 0
+        for friend_id in struct.unpack_from(f"<{count}I", self.mm, self.participants_offset + start * 4):
+            mask |= 1 << friend_id
+        return {
+            'id': expense_id,
+            'date': self._date(ordinal),
+            'description': self._string(offset, length),
+            'amount': amount,
+            'payer': payer,
+            'participants': mask,
+            'currency': self._currency(currency),
+        }
+
+    def close(self):
+        self.mm.close()
+
+    def _string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.mm[start:start + length].decode("utf-8")
+
+    @staticmethod
+    def _currency(field):
+        # Version 1 records have no field, an empty one is the default
+        code = field[0].rstrip(b"\0") if field else b""
+        return code.decode("ascii") if code else DEFAULT_CURRENCY
+
+    def _date(self, ordinal):
+        # Expenses share few distinct dates, so each is formatted once
+        text = self._dates.get(ordinal)
+        if text is None:
+            text = self._dates[ordinal] = Date.fromordinal(ordinal).isoformat()
+        return text
+
+
+class SnapshotExpenses(MutableMapping):
+    """Stored expenses by id, decoded from a mapped snapshot as they are asked for.
+
+    A ledger loaded from a snapshot keeps one as its ``expenses``. Opening
+    reads only the id column, and ``expenses[id]`` finds the row by
+    bisecting it and decodes that record alone. Changes are kept on top
+    of the map: a replaced record keeps its place, new ones come after the
+    snapshot's and deleted ids are skipped. Iterating yields the ids in
+    ledger order; ``values`` decodes the records in one pass. ``copy`` is
+    cheap and shares the map, for reading a stable copy on another thread.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.ids = reader.ids()
+        if all(map(lt, self.ids, islice(self.ids, 1, None))):
+            self.sorted_ids, self.order = self.ids, None
+        else:
+            # Ids out of order, e.g. from old JSON files: bisect a sorted copy and map back to rows
+            self.order = array('q', sorted(range(len(self.ids)), key=self.ids.__getitem__))
+            self.sorted_ids = array('q', (self.ids[row] for row in self.order))
+        self.changed = {}  # snapshot id -> record replacing it
+        self.added = {}  # id -> record not in the snapshot, in insertion order
+        self.removed = set()  # snapshot ids deleted
+
+    def __len__(self):
+        return len(self.ids) - len(self.removed) + len(self.added)
+
+    def __iter__(self):
+        removed = self.removed
+        if not removed and not self.added:
+            return iter(self.ids)
+        return chain((expense_id for expense_id in self.ids if expense_id not in removed), list(self.added))
+
+    def __contains__(self, expense_id):
+        return expense_id in self.added or (expense_id not in self.removed and self._row(expense_id) is not None)
+
+    def __getitem__(self, expense_id):
+        record = self.added.get(expense_id) or self.changed.get(expense_id)
+        if record is not None:
+            return record
+        row = self._row(expense_id) if expense_id not in self.removed else None
+        if row is None:
+            raise KeyError(expense_id)
+        return self.reader.record(row)
+
+    def __setitem__(self, expense_id, record):
+        if expense_id not in self.added and expense_id not in self.removed and self._row(expense_id) is not None:
+            self.changed[expense_id] = record
+        else:
+            self.added[expense_id] = record
+
+    def __delitem__(self, expense_id):
+        if expense_id in self.added:
+            del self.added[expense_id]
+        elif expense_id not in self.removed and self._row(expense_id) is not None:
+            self.changed.pop(expense_id, None)
+            self.removed.add(expense_id)
+        else:
+            raise KeyError(expense_id)
+
+    def values(self):
+        return SnapshotValues(self)
+
+    def items(self):
+        return ((record['id'], record) for record in self.values())
+
+    def copy(self):
+        other = SnapshotExpenses.__new__(SnapshotExpenses)
+        other.reader, other.ids, other.sorted_ids, other.order = self.reader, self.ids, self.sorted_ids, self.order
+        other.changed, other.added, other.removed = dict(self.changed), dict(self.added), set(self.removed)
+        return other
+
+    def fill_index(self, index):
+        """Add every expense to an ``ExpenseIndex``, the snapshot's from its columns"""
+        skip = self.removed | self.changed.keys()
+        for expense_id, date, description, amount, payer, participants, currency in self.reader.rows():
+            if expense_id not in skip:
+                index.add_row(expense_id, description, payer, participants, date)
+        for record in chain(self.changed.values(), self.added.values()):
+            index.add(record)
+
+    def _row(self, expense_id):
+        """Position of a snapshot id in the record table, None if the snapshot does not have it"""
+        ids = self.sorted_ids
+        index = bisect_left(ids, expense_id)
+        if index == len(ids) or ids[index] != expense_id:
+            return None
+        return index if self.order is None else self.order[index]
+
+
+class SnapshotValues:
+    """The records of ``SnapshotExpenses`` in ledger order, sized and decoded one pass at a time"""
+
+    def __init__(self, expenses):
+        self.expenses = expenses
+
+    def __len__(self):
+        return len(self.expenses)
+
+    def __iter__(self):
+        expenses = self.expenses
+        changed, removed = expenses.changed, expenses.removed
+        for record in expenses.reader:
+            if record['id'] not in removed:
+                yield changed.get(record['id'], record)
+        yield from list(expenses.added.values())
+
+
+def main():
+    from journal import JournalStore
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] not in ("export", "import"):
+        sys.exit("usage: python snapshot.py export|import [DIRECTORY]")
+    store = JournalStore(sys.argv[2] if len(sys.argv) == 3 else ".")
+    if sys.argv[1] == "export":
+        store.export_json()
+        print(f"Wrote {store.friends_path} and {store.expenses_path}")
+    else:
+        store.import_json()
+        print(f"Wrote {store.snapshot_path}")
+
+
+if __name__ == "__main__":
+    main()
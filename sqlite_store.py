@@ -0,0 +1,708 @@
+import json
+import os
+import sqlite3
+from calendar import monthrange
+from datetime import date as Date
+
+from currency import DEFAULT_CURRENCY, CurrencySums
+from history import History, HistoryLog
+from indexes import date_bounds
+from journal import JournalStore
+from ledger import Ledger, validate_expense, validate_rule
+from recurring import occurrences, rule_totals
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS friends (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    description TEXT NOT NULL,
+    amount REAL NOT NULL,
+    payer_id INTEGER NOT NULL REFERENCES friends(id),
+    currency TEXT NOT NULL DEFAULT 'INR'
+);
+CREATE TABLE IF NOT EXISTS expense_participants (
+    expense_id INTEGER NOT NULL REFERENCES expenses(id) ON DELETE CASCADE,
+    friend_id INTEGER NOT NULL REFERENCES friends(id),
+    position INTEGER NOT NULL,
+    share REAL NOT NULL,
+    PRIMARY KEY (expense_id, friend_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS recurring_rules (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS expenses_date ON expenses(date);
+CREATE INDEX IF NOT EXISTS expenses_payer ON expenses(payer_id);
+CREATE INDEX IF NOT EXISTS expense_participants_friend ON expense_participants(friend_id, expense_id);
+"""
+
+# Trigram full-text index over descriptions, kept in sync by triggers
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS expense_search USING fts5(
+    description, content='expenses', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS expenses_search_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO expense_search(rowid, description) VALUES (new.id, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_search_delete AFTER DELETE ON expenses BEGIN
+    INSERT INTO expense_search(expense_search, rowid, description) VALUES ('delete', old.id, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_search_update AFTER UPDATE ON expenses BEGIN
+    INSERT INTO expense_search(expense_search, rowid, description) VALUES ('delete', old.id, old.description);
+    INSERT INTO expense_search(rowid, description) VALUES (new.id, new.description);
+END;
+"""
+
+EXPENSE_COLUMNS = """
+    SELECT e.id, e.date, e.description, e.amount, e.payer_id, e.currency,
+           (SELECT group_concat(friend_id) FROM (
+                SELECT friend_id FROM expense_participants
+                WHERE expense_id = e.id ORDER BY position))
+    FROM expenses e
+"""
+
+def _expense(row, names):
+    """An expense dict from an ``EXPENSE_COLUMNS`` row"""
+    expense_id, date, description, amount, payer_id, currency, participant_ids = row
+    participants = [names[int(friend_id)] for friend_id in participant_ids.split(",")] if participant_ids else []
+    return {
+        'date': date,
+        'description': description,
+        'amount': amount,
+        'payer': names[payer_id],
+        'participants': participants,
+        'currency': currency,
+        'id': expense_id,
+    }
+
+
+class SQLiteLedger:
+    """Ledger kept in a local SQLite database instead of in memory.
+
+    Offers the same operations as ``ledger.Ledger``, but filters run as
+    indexed SQL and totals come from SQL aggregates, so opening a large
+    ledger does not load every expense. Changes are committed by
+    ``commit``. Recurring rules are few and kept in memory as well, stored
+    as JSON rows with friends by id.
+    """
+
+    def __init__(self, path="expenses.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(expenses)")]
+        if 'currency' not in columns:
+            # Databases from before currencies, every expense was in the default one
+            self.conn.execute(f"ALTER TABLE expenses ADD COLUMN currency TEXT NOT NULL DEFAULT '{DEFAULT_CURRENCY}'")
+        try:
+            self.conn.executescript(SEARCH_SCHEMA)
+            self.has_search = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 or the trigram tokenizer
+            self.has_search = False
+        self.conn.commit()
+        self.listeners = []
+        self.display_currency = DEFAULT_CURRENCY
+        self.rates = None  # currency.FxRates, needed to show other currencies
+        self._converted = None  # (key, totals) of the last conversion
+        self._version = 0  # Bumped by every change
+        self._read_cache()
+
+    @property
+    def friends(self):
+        return list(self._ids)
+
+    def __len__(self):
+        return self.conn.execute("SELECT count(*) FROM expenses").fetchone()[0]
+
+    def __iter__(self):
+        return iter(self._query(""))
+
+    def __contains__(self, expense_id):
+        return self.conn.execute("SELECT 1 FROM expenses WHERE id = ?", (expense_id,)).fetchone() is not None
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def data_version(self):
+        """A number that changes whenever another connection commits to the database"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self):
+        """Re-read what is kept in memory after another connection changed the database.
+
+        Listeners are told with a ``reload`` change, as anything may differ.
+        """
+        self._read_cache()
+        self._version += 1
+        self._converted = None
+        self._notify('reload', {})
+
+    def is_empty(self):
+        return not self._ids and not len(self)
+
+    # Friends
+
+    def add_friend(self, name):
+        name = name.strip()
+        if not name:
+            raise ValueError("Please Enter Friend Name.")
+        if name in self._ids:
+            return False
+        friend_id = self.conn.execute("INSERT INTO friends(name) VALUES (?)", (name,)).lastrowid
+        self._ids[name] = friend_id
+        self._names[friend_id] = name
+        self._notify('add_friend', {'name': name})
+        return True
+
+    def remove_friends(self, names):
+        names = list(names)
+        friend_ids = [self._ids[name] for name in names if name in self._ids]
+        if not friend_ids:
+            return []
+        marks = ",".join("?" * len(friend_ids))
+        removed = self._query(
+            f"WHERE e.payer_id IN ({marks}) OR e.id IN "
+            f"(SELECT expense_id FROM expense_participants WHERE friend_id IN ({marks}))",
+            friend_ids * 2,
+        )
+        self._delete_rows([expense['id'] for expense in removed])
+        for rule_id, rule in list(self.rules.items()):
+            if rule['payer'] in friend_ids or any(friend_id in rule['participants'] for friend_id in friend_ids):
+                self.conn.execute("DELETE FROM recurring_rules WHERE id = ?", (rule_id,))
+                del self.rules[rule_id]
+        self.conn.execute(f"DELETE FROM friends WHERE id IN ({marks})", friend_ids)
+
+        for friend_id in friend_ids:
+            del self._ids[self._names.pop(friend_id)]
+        self._notify('remove_friends', {'names': names})
+        return removed
+
+    def rename_friend(self, old_name, new_name):
+        new_name = new_name.strip()
+        if not new_name:
+            raise ValueError("Please Enter Friend Name.")
+        if old_name not in self._ids:
+            raise ValueError(f"Unknown friend: {old_name}")
+        if new_name == old_name:
+            return False
+        if new_name in self._ids:
+            raise ValueError(f"{new_name} is already a friend")
+        friend_id = self._ids.pop(old_name)
+        self.conn.execute("UPDATE friends SET name = ? WHERE id = ?", (new_name, friend_id))
+        self._ids[new_name] = friend_id
+        self._names[friend_id] = new_name
+        self._notify('rename_friend', {'id': friend_id, 'name': new_name})
+        return True
+
+    # Expenses
+
+    def add_expense(self, date, description, amount, payer, participants, currency=DEFAULT_CURRENCY):
+        expense = validate_expense(date, description, amount, payer, participants, self._ids, currency)
+        expense['id'] = self._write(None, expense)
+        self._notify('add_expense', {'expense': expense})
+        return expense
+
+    def add_expenses(self, expenses):
+        """Add many expenses already checked by ``validate_expense``, notified as one change"""
+        for expense in expenses:
+            for name in [expense['payer']] + list(expense['participants']):
+                if name not in self._ids:
+                    raise ValueError(f"Unknown friend: {name}")
+        added = []
+        for expense in expenses:
+            expense = dict(expense)
+            expense['id'] = self._write(None, expense)
+            added.append(expense)
+        self._notify('add_expenses', {'expenses': added})
+        return added
+
+    def update_expense(self, expense_id, date, description, amount, payer, participants, currency=DEFAULT_CURRENCY):
+        if expense_id not in self:
+            raise KeyError(expense_id)
+        expense = validate_expense(date, description, amount, payer, participants, self._ids, currency)
+        expense['id'] = expense_id
+        self._write(expense_id, expense)
+        self._notify('update_expense', {'expense': expense})
+        return expense
+
+    def put_expense(self, expense):
+        expense = dict(expense)
+        expense['amount'] = float(expense['amount'])
+        expense['currency'] = expense.get('currency') or DEFAULT_CURRENCY
+        existed = expense['id'] in self
+        for name in [expense['payer']] + list(expense['participants']):
+            if name not in self._ids:
+                self.add_friend(name)
+        self._write(expense['id'], expense)
+        self._notify('update_expense' if existed else 'add_expense', {'expense': expense})
+        return expense
+
+    def delete_expense(self, expense_id):
+        expense = self.get(expense_id)
+        if expense is None:
+            raise KeyError(expense_id)
+        self._delete_rows([expense_id])
+        self._notify('delete_expense', {'id': expense_id})
+        return expense
+
+    def delete_expenses(self, expense_ids):
+        return [self.delete_expense(expense_id) for expense_id in expense_ids if expense_id in self]
+
+    def clear_expenses(self):
+        self.conn.execute("DELETE FROM expense_participants")
+        self.conn.execute("DELETE FROM expenses")
+        self._notify('clear_expenses', {})
+
+    def stream(self, expense_ids=None):
+        """``(count, expenses)`` like ``Ledger.stream``, read lazily over a connection of its own.
+
+        Changes so far are committed first so that connection sees them;
+        it is opened by the generator, on whichever thread runs it.
+        """
+        self.commit()
+        count = len(self) if expense_ids is None else len(expense_ids)
+        names = dict(self._names)
+        path = self.path
+
+        def views():
+            conn = sqlite3.connect(path)
+            try:
+                if expense_ids is None:
+                    queries = [("", ())]
+                else:
+                    queries = ((f"WHERE e.id IN ({','.join('?' * len(chunk))})", chunk)
+                               for chunk in (expense_ids[start:start + 500]
+                                             for start in range(0, len(expense_ids), 500)))
+                for where, params in queries:
+                    for row in conn.execute(f"{EXPENSE_COLUMNS} {where} ORDER BY e.id", params):
+                        yield _expense(row, names)
+            finally:
+                conn.close()
+
+        return count, views()
+
+    def get(self, expense_id):
+        rows = self._query("WHERE e.id = ?", (expense_id,))
+        return rows[0] if rows else None
+
+    def filter(self, criteria, value):
+        """Expenses matching a filter from ``ledger.FILTER_CRITERIA``, as indexed SQL"""
+        if criteria == "All":
+            return list(self)
+        return self.query(**{criteria.lower(): value})
+
+    def query(self, date=None, description=None, payer=None, participant=None):
+        """Expenses matching every given filter, with the same rules as ``Ledger.query``"""
+        where = self._where(date, description, payer, participant)
+        return self._query(*where) if where is not None else []
+
+    def query_ids(self, date=None, description=None, payer=None, participant=None):
+        """Like ``query`` but returns only the ids"""
+        where = self._where(date, description, payer, participant)
+        if where is None:
+            return []
+        where, params = where
+        return [row[0] for row in self.conn.execute(f"SELECT e.id FROM expenses e {where} ORDER BY e.id", params)]
+
+    def matches(self, expense_id, date=None, description=None, payer=None, participant=None):
+        """Whether one expense passes the same filters as ``query``"""
+        where = self._where(date, description, payer, participant)
+        if where is None:
+            return False
+        where, params = where
+        where = f"{where} AND e.id = ?" if where else "WHERE e.id = ?"
+        return self.conn.execute(f"SELECT 1 FROM expenses e {where}", params + [expense_id]).fetchone() is not None
+
+    # Recurring rules
+
+    def rules_list(self):
+        return [self._rule_view(rule) for rule in self.rules.values()]
+
+    def get_rule(self, rule_id):
+        rule = self.rules.get(rule_id)
+        return self._rule_view(rule) if rule is not None else None
+
+    def add_rule(self, start, frequency, interval, until, description, amount, payer, participants,
+                 currency=DEFAULT_CURRENCY):
+        rule = self._to_rule(validate_rule(start, frequency, interval, until, description, amount,
+                                           payer, participants, self._ids, currency))
+        rule['id'] = self.conn.execute("INSERT INTO recurring_rules(data) VALUES ('{}')").lastrowid
+        self._write_rule(rule)
+        self._notify('add_rule', {'rule': self._rule_view(rule)})
+        return self._rule_view(rule)
+
+    def put_rule(self, rule):
+        for name in [rule['payer']] + list(rule['participants']):
+            if isinstance(name, str) and name not in self._ids:
+                self.add_friend(name)
+        rule = self._to_rule(rule)
+        existed = rule['id'] in self.rules
+        self._write_rule(rule)
+        self._notify('update_rule' if existed else 'add_rule', {'rule': self._rule_view(rule)})
+        return self._rule_view(rule)
+
+    def delete_rule(self, rule_id):
+        rule = self.rules.pop(rule_id)
+        self.conn.execute("DELETE FROM recurring_rules WHERE id = ?", (rule_id,))
+        self._notify('delete_rule', {'id': rule_id})
+        return self._rule_view(rule)
+
+    def occurrences(self, rule_id, start=None, end=None):
+        return occurrences(self.rules[rule_id], start and Date.fromisoformat(start), end and Date.fromisoformat(end))
+
+    def materialize(self, rule_id, date):
+        """Turn the occurrence of a rule on ``date`` into an expense of its own, as ``Ledger.materialize``"""
+        rule = self.rules[rule_id]
+        day = Date.fromisoformat(date)
+        if date in rule['skip'] or next(occurrences(rule, day, day), None) is None:
+            raise ValueError(f"{rule['description']} does not fall on {date}")
+        rule = dict(rule, skip=sorted(rule['skip'] + [date]))
+        self._write_rule(rule)
+        self._notify('update_rule', {'rule': self._rule_view(rule)})
+        view = self._rule_view(rule)
+        expense = {'date': date, 'description': rule['description'], 'amount': rule['amount'],
+                   'payer': view['payer'], 'participants': view['participants'], 'currency': rule['currency']}
+        expense['id'] = self._write(None, expense)
+        self._notify('add_expense', {'expense': expense})
+        return expense
+
+    # Totals
+
+    def totals(self, currency=None):
+        """Map each friend to a ``(paid, owed)`` pair in ``currency``, by default the display currency"""
+        currency = currency or self.display_currency
+        if currency != DEFAULT_CURRENCY or self.is_mixed():
+            key = (currency, self.rates.version if self.rates is not None else None, self._version)
+            if self._converted is None or self._converted[0] != key:
+                self._converted = (key, self._convert(currency))
+            paid, owed = self._converted[1]
+        else:
+            paid = dict(self.conn.execute("SELECT payer_id, sum(amount) FROM expenses GROUP BY payer_id"))
+            owed = dict(self.conn.execute("SELECT friend_id, sum(share) FROM expense_participants GROUP BY friend_id"))
+        if self.rules:
+            # Every occurrence up to today, counted rather than stored
+            rule_paid, rule_owed = rule_totals(self.rules.values(), Date.min, Date.today(), currency, self.rates)
+            paid = {friend_id: (paid.get(friend_id) or 0.0) + rule_paid.get(friend_id, 0.0) for friend_id in self._names}
+            owed = {friend_id: (owed.get(friend_id) or 0.0) + rule_owed.get(friend_id, 0.0) for friend_id in self._names}
+        return {
+            name: (paid.get(friend_id) or 0.0, owed.get(friend_id) or 0.0)
+            for name, friend_id in self._ids.items()
+        }
+
+    def is_mixed(self):
+        """Whether any expense is in a currency other than the default"""
+        return self.conn.execute(
+            "SELECT 1 FROM expenses WHERE currency != ? LIMIT 1", (DEFAULT_CURRENCY,)).fetchone() is not None
+
+    def _convert(self, currency):
+        # Grouped by currency and day in SQL, so converting costs one rate per currency and day
+        sums = CurrencySums()
+        for currency, date, friend_id, paid in self.conn.execute(
+                "SELECT currency, date, payer_id, sum(amount) FROM expenses GROUP BY currency, date, payer_id"):
+            sums.add(currency, Date.fromisoformat(date).toordinal(), friend_id, paid=paid)
+        for currency, date, friend_id, owed in self.conn.execute(
+                "SELECT e.currency, e.date, p.friend_id, sum(p.share) FROM expenses e "
+                "JOIN expense_participants p ON p.expense_id = e.id GROUP BY e.currency, e.date, p.friend_id"):
+            sums.add(currency, Date.fromisoformat(date).toordinal(), friend_id, owed=owed)
+        return sums.convert(currency, self.rates)
+
+    def paid(self, friend):
+        if self.display_currency != DEFAULT_CURRENCY or self.rules or self.is_mixed():
+            return self.totals().get(friend, (0.0, 0.0))[0]
+        row = self.conn.execute(
+            "SELECT sum(amount) FROM expenses WHERE payer_id = ?", (self._ids.get(friend),)
+        ).fetchone()
+        return row[0] or 0.0
+
+    def owed(self, friend):
+        if self.display_currency != DEFAULT_CURRENCY or self.rules or self.is_mixed():
+            return self.totals().get(friend, (0.0, 0.0))[1]
+        row = self.conn.execute(
+            "SELECT sum(share) FROM expense_participants WHERE friend_id = ?", (self._ids.get(friend),)
+        ).fetchone()
+        return row[0] or 0.0
+
+    def balance(self, friend):
+        return self.paid(friend) - self.owed(friend)
+
+    def balances(self):
+        return {friend: paid - owed for friend, (paid, owed) in self.totals().items()}
+
+    # Reports over dates, as range scans on the date index, in the default currency only
+
+    def spend_between(self, start, end):
+        row = self.conn.execute("SELECT sum(amount) FROM expenses WHERE date BETWEEN ? AND ? AND currency = ?",
+                                (start, end, DEFAULT_CURRENCY)).fetchone()
+        paid, _ = self._rule_sums(start, end)
+        return (row[0] or 0.0) + sum(paid.values())
+
+    def paid_between(self, start, end):
+        paid = dict(self.conn.execute(
+            "SELECT payer_id, sum(amount) FROM expenses WHERE date BETWEEN ? AND ? AND currency = ? GROUP BY payer_id",
+            (start, end, DEFAULT_CURRENCY)))
+        rule_paid, _ = self._rule_sums(start, end)
+        return {name: (paid.get(friend_id) or 0.0) + rule_paid.get(friend_id, 0.0)
+                for name, friend_id in self._ids.items()}
+
+    def shares_between(self, start, end):
+        owed = dict(self.conn.execute(
+            "SELECT p.friend_id, sum(p.share) FROM expenses e JOIN expense_participants p ON p.expense_id = e.id "
+            "WHERE e.date BETWEEN ? AND ? AND e.currency = ? GROUP BY p.friend_id", (start, end, DEFAULT_CURRENCY)))
+        _, rule_owed = self._rule_sums(start, end)
+        return {name: (owed.get(friend_id) or 0.0) + rule_owed.get(friend_id, 0.0)
+                for name, friend_id in self._ids.items()}
+
+    def month_spend(self, year, month):
+        return self.spend_between(*self._month_bounds(year, month))
+
+    def month_shares(self, year, month):
+        return self.shares_between(*self._month_bounds(year, month))
+
+    def budget_remaining(self, budget, year, month):
+        return budget - self.month_spend(year, month)
+
+    # Internals
+
+    def _month_bounds(self, year, month):
+        return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{monthrange(year, month)[1]:02d}"
+
+    def _rule_sums(self, start, end):
+        rules = [rule for rule in self.rules.values() if rule['currency'] == DEFAULT_CURRENCY]
+        if not rules:
+            return {}, {}
+        return rule_totals(rules, Date.fromisoformat(start), Date.fromisoformat(end))
+
+    def _to_rule(self, rule):
+        # Friends by id, as stored
+        def friend_id(friend):
+            return friend if isinstance(friend, int) else self._ids[friend]
+
+        return {
+            'id': rule.get('id'),
+            'start': rule['start'],
+            'frequency': rule['frequency'],
+            'interval': rule['interval'],
+            'until': rule.get('until'),
+            'description': rule['description'],
+            'amount': float(rule['amount']),
+            'payer': friend_id(rule['payer']),
+            'participants': [friend_id(participant) for participant in rule['participants']],
+            'currency': rule.get('currency') or DEFAULT_CURRENCY,
+            'skip': list(rule.get('skip', ())),
+        }
+
+    def _rule_view(self, rule):
+        return dict(rule, payer=self._names[rule['payer']],
+                    participants=[self._names[participant] for participant in rule['participants']])
+
+    def _write_rule(self, rule):
+        self.conn.execute("INSERT OR REPLACE INTO recurring_rules(id, data) VALUES (?, ?)",
+                          (rule['id'], json.dumps(rule, separators=(",", ":"))))
+        self.rules[rule['id']] = rule
+
+    def _read_cache(self):
+        self._ids = {}
+        self._names = {}
+        for friend_id, name in self.conn.execute("SELECT id, name FROM friends ORDER BY id"):
+            self._ids[name] = friend_id
+            self._names[friend_id] = name
+        self.rules = {rule_id: json.loads(data)
+                      for rule_id, data in self.conn.execute("SELECT id, data FROM recurring_rules ORDER BY id")}
+
+    def _notify(self, op, data):
+        self._version += 1
+        for listener in self.listeners:
+            listener(op, data)
+
+    def _where(self, date, description, payer, participant):
+        """WHERE clause and parameters for ``query``, or None if nothing can match"""
+        clauses = []
+        params = []
+
+        if date:
+            bounds = date_bounds(date)
+            if bounds is not None:
+                # Prefixes and ranges become an index range scan
+                low, high = bounds
+                clauses.append("e.date >= ?")
+                params.append(low)
+                if high is not None:
+                    clauses.append("e.date < ?")
+                    params.append(high)
+            else:
+                clauses.append("instr(lower(e.date), ?) > 0")
+                params.append(date.lower())
+
+        # Friend names are few, so match them in Python and look expenses up by id
+        for value, clause in (
+            (payer, "e.payer_id IN ({})"),
+            (participant, "e.id IN (SELECT expense_id FROM expense_participants WHERE friend_id IN ({}))"),
+        ):
+            if value:
+                value = value.lower()
+                friend_ids = [friend_id for name, friend_id in self._ids.items() if value in name.lower()]
+                if not friend_ids:
+                    return None
+                clauses.append(clause.format(",".join("?" * len(friend_ids))))
+                params.extend(friend_ids)
+
+        if description:
+            value = description.lower()
+            if self.has_search and len(value) >= 3:
+                clauses.append("e.id IN (SELECT rowid FROM expense_search WHERE expense_search MATCH ?)")
+                params.append('"' + value.replace('"', '""') + '"')
+            else:
+                clauses.append("instr(lower(e.description), ?) > 0")
+                params.append(value)
+
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, params
+
+    def _write(self, expense_id, expense):
+        row = (expense['date'], expense['description'], expense['amount'], self._ids[expense['payer']],
+               expense.get('currency') or DEFAULT_CURRENCY)
+        if expense_id is None:
+            expense_id = self.conn.execute(
+                "INSERT INTO expenses(date, description, amount, payer_id, currency) VALUES (?, ?, ?, ?, ?)", row
+            ).lastrowid
+        else:
+            self.conn.execute(
+                "INSERT INTO expenses(id, date, description, amount, payer_id, currency) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET date = excluded.date, description = excluded.description, "
+                "amount = excluded.amount, payer_id = excluded.payer_id, currency = excluded.currency",
+                (expense_id,) + row,
+            )
+            self.conn.execute("DELETE FROM expense_participants WHERE expense_id = ?", (expense_id,))
+
+        share = expense['amount'] / len(expense['participants'])
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO expense_participants(expense_id, friend_id, position, share) VALUES (?, ?, ?, ?)",
+            [(expense_id, self._ids[name], position, share)
+             for position, name in enumerate(expense['participants'])],
+        )
+        return expense_id
+
+    def _delete_rows(self, expense_ids):
+        for start in range(0, len(expense_ids), 500):
+            chunk = expense_ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            self.conn.execute(f"DELETE FROM expense_participants WHERE expense_id IN ({marks})", chunk)
+            self.conn.execute(f"DELETE FROM expenses WHERE id IN ({marks})", chunk)
+
+    def _query(self, where, params=()):
+        names = self._names
+        return [_expense(row, names)
+                for row in self.conn.execute(f"{EXPENSE_COLUMNS} {where} ORDER BY e.id", params)]
+
+
+class SQLiteStore:
+    """Storage for a ``SQLiteLedger``, with the same interface as ``journal.JournalStore``.
+
+    On first use the existing JSON ledger in ``directory`` is imported into
+    the database. The undo history is kept in ``expenses.history`` as with
+    the journal store. SQLite already keeps writers from overwriting each
+    other, so ``sync`` only has to notice another connection's commits
+    and have the ledger re-read its cached friends and rules.
+    """
+
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.ledger = None
+        self.history = History()
+        self.history_log = HistoryLog(os.path.join(directory, "expenses.history"))
+        self.version = None  # PRAGMA data_version as of the last sync
+
+    def load(self, ledger):
+        try:
+            if ledger.is_empty():
+                self._import_json(ledger)
+            self.history_log.load(self.history)
+        except BaseException:
+            # Half an import is not kept, closing the connection would commit it
+            ledger.conn.rollback()
+            raise
+        # Only a loaded ledger is attached, saving and syncing skip the store until then
+        self.ledger = ledger
+        self.version = ledger.data_version()
+
+    def changed(self):
+        return self.ledger is not None and self.ledger.data_version() != self.version
+
+    def sync(self, ledger):
+        """Reload the ledger's cache if another connection committed, returns 1 if it did or None"""
+        if not self.changed():
+            return None
+        # Our own changes not yet committed go in first, they are no one else's to lose
+        ledger.commit()
+        self.version = ledger.data_version()
+        ledger.refresh()
+        self.history.clear()
+        self.history_log.write_failed()
+        return 1
+
+    def peek(self):
+        # Totals are a query away once loaded, there is no header to show early
+        return None
+
+    def flush(self):
+        if self.ledger is not None:
+            self.ledger.commit()
+
+    def compact(self):
+        self.flush()
+
+    def take_batch(self, snapshot=False):
+        # The connection belongs to the Tk thread and WAL commits are short, so commit here
+        self.flush()
+        return self.history_log.take_batch(self.history)
+
+    def write_batch(self, batch):
+        self.history_log.write_batch(batch)
+
+    def write_failed(self):
+        self.history_log.write_failed()
+
+    @staticmethod
+    def merge_batches(older, newer):
+        return HistoryLog.merge_batches(older, newer)
+
+    def close(self):
+        if self.ledger is not None:
+            self.ledger.commit()
+            batch = self.history_log.take_batch(self.history)
+            if batch is not None:
+                self.history_log.write_batch(batch)
+            self.ledger = None
+
+    def _import_json(self, ledger):
+        # Read through the journal store so changes not yet compacted come along too
+        source = Ledger()
+        store = JournalStore(self.directory)
+        store.load(source)
+        store.close()
+
+        for name in source.friends:
+            ledger.add_friend(name)
+        for expense in source:
+            ledger.put_expense(expense)
+        for rule in source.rules_list():
+            ledger.put_rule(rule)
+        ledger.commit()
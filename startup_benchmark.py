@@ -0,0 +1,98 @@
+"""Startup time of the expense tracker for large ledgers.
+
+For each size a snapshot is generated in a temporary directory and the
+app is started there with the startup probe set. The app reports when
+its window was first painted and when the loaded ledger was on screen,
+and both are measured from the moment the process was started. First
+paint shows the totals from the snapshot header; interactive waits for
+the snapshot to be mapped and every panel drawn once, the visible rows
+decoded and the report rollups built::
+
+    python startup_benchmark.py                    # 10k, 100k and 1M expenses
+    python startup_benchmark.py --sizes 10000 --runs 5
+    python startup_benchmark.py --headless         # only time loading the files
+
+Starting the app needs a display; ``--headless`` times the ledger load on
+its own, which runs anywhere.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import synthetic_ledger
+from journal import JournalStore
+from ledger import Ledger
+
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ExpensesManage.py")
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def generate_snapshot(directory, count, friend_count=8, seed=0):
+    """Write a snapshot of ``count`` random expenses in the current file layout"""
+    store = JournalStore(directory)
+    store.ledger = synthetic_ledger(count, friend_count, seed=seed)
+    store.compact()
+
+
+def time_app(directory, timeout):
+    """Seconds from launch to the first paint and to interactive"""
+    env = dict(os.environ, EXPENSES_STARTUP_PROBE="1")
+    started = time.time()
+    result = subprocess.run([sys.executable, APP], cwd=directory, env=env,
+                            capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"App exited with {result.returncode}:\n{result.stderr}")
+
+    times = {}
+    for line in result.stdout.splitlines():
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        times[event['event']] = event['time'] - started
+    return times['first_paint'], times['interactive']
+
+
+def time_load(directory):
+    """Seconds to open the snapshot and replay the journal, without any UI"""
+    started = time.perf_counter()
+    store = JournalStore(directory)
+    store.load(Ledger())
+    elapsed = time.perf_counter() - started
+    store.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="ledger sizes to time")
+    parser.add_argument("--runs", type=int, default=3, help="runs per size, the best is reported")
+    parser.add_argument("--headless", action="store_true", help="time the ledger load without starting the app")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for one app start")
+    args = parser.parse_args()
+
+    if args.headless:
+        print(f"{'expenses':>10}  {'load':>8}")
+    else:
+        print(f"{'expenses':>10}  {'first paint':>11}  {'interactive':>11}")
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_snapshot(directory, size)
+            if args.headless:
+                best = min(time_load(directory) for _ in range(args.runs))
+                print(f"{size:>10}  {best:>7.2f}s")
+            else:
+                runs = [time_app(directory, args.timeout) for _ in range(args.runs)]
+                first_paint = min(run[0] for run in runs)
+                interactive = min(run[1] for run in runs)
+                print(f"{size:>10}  {first_paint:>10.2f}s  {interactive:>10.2f}s")
+
+
+if __name__ == "__main__":
+    main()
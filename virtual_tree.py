@@ -0,0 +1,195 @@
+from tkinter import ttk
+
+
+class VirtualTreeview:
+    """Shows a long list of rows in a ttk.Treeview without inserting them all.
+
+    Only the rows in view plus ``overscan`` rows on either side are kept in
+    the tree, in a fixed pool of items whose values are rewritten as the
+    view moves. The scrollbar is driven from the row count, so a redraw
+    costs the same for a hundred rows as for a million.
+
+    ``format_row(row)`` returns the values shown for a row and
+    ``row_key(row)`` a stable key used to remember the selection while rows
+    scroll in and out of the pool. ``on_select`` is called after the user
+    changes the selection.
+    """
+
+    def __init__(self, tree, scrollbar, format_row, row_key, on_select=None, overscan=10):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.format_row = format_row
+        self.row_key = row_key
+        self.on_select = on_select
+        self.overscan = overscan
+
+        self.rows = []
+        self.first = 0  # Index of the first row in view
+        self.visible = 20  # Rows that fit in the tree, updated on resize
+        self.selected = set()
+        self.anchor = None  # Index of the row keyboard navigation starts from
+        self.slots = []  # Pool of tree items
+        self.attached = 0  # The first ``attached`` slots are in the tree, in order
+        self.slot_rows = {}  # Tree item -> index of the row it shows
+        self.key_slots = {}  # Row key -> tree item, for rows currently rendered
+        self._synced_selection = ()
+
+        scrollbar.configure(command=self.yview)
+        tree.configure(yscrollcommand="")
+        tree.bind('<Configure>', self._on_configure)
+        tree.bind('<<TreeviewSelect>>', self._on_tree_select)
+        tree.bind('<MouseWheel>', self._on_mousewheel)
+        tree.bind('<Button-4>', lambda event: self._scroll_by(-3))
+        tree.bind('<Button-5>', lambda event: self._scroll_by(3))
+        tree.bind('<Up>', lambda event: self._move_selection(-1))
+        tree.bind('<Down>', lambda event: self._move_selection(1))
+        tree.bind('<Prior>', lambda event: self._move_selection(-self.visible))
+        tree.bind('<Next>', lambda event: self._move_selection(self.visible))
+        tree.bind('<Home>', lambda event: self._move_selection(-len(self.rows)))
+        tree.bind('<End>', lambda event: self._move_selection(len(self.rows)))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def set_rows(self, rows):
+        """Show a new list of rows, keeping the scroll position where possible"""
+        self.rows = rows
+        self.anchor = None
+        keys = {self.row_key(row) for row in rows} if self.selected else set()
+        self.selected &= keys
+        self.render()
+
+    def render(self):
+        total = len(self.rows)
+        self.first = max(0, min(self.first, total - self.visible))
+        start = max(0, self.first - self.overscan)
+        end = min(total, self.first + self.visible + self.overscan)
+
+        # Grow the pool as needed, then rewrite only the values of pooled items
+        count = end - start
+        while len(self.slots) < count:
+            slot = self.tree.insert('', 'end', values=())
+            self.tree.detach(slot)
+            self.slots.append(slot)
+
+        self.slot_rows = {}
+        self.key_slots = {}
+        selection = []
+        for offset in range(count):
+            slot = self.slots[offset]
+            row = self.rows[start + offset]
+            key = self.row_key(row)
+            self.tree.item(slot, values=self.format_row(row))
+            if offset >= self.attached:
+                self.tree.move(slot, '', offset)
+            self.slot_rows[slot] = start + offset
+            self.key_slots[key] = slot
+            if key in self.selected:
+                selection.append(slot)
+        if self.attached > count:
+            self.tree.detach(*self.slots[count:self.attached])
+        self.attached = count
+
+        self._synced_selection = tuple(selection)
+        self.tree.selection_set(selection)
+        if end > start:
+            self.tree.yview_moveto((self.first - start) / (end - start))
+        self._update_scrollbar()
+
+    def refresh_row(self, row):
+        """Redraw one row in place if it is currently rendered"""
+        slot = self.key_slots.get(self.row_key(row))
+        if slot is not None:
+            self.rows[self.slot_rows[slot]] = row
+            self.tree.item(slot, values=self.format_row(row))
+
+    def selection(self):
+        """Keys of the selected rows, including rows scrolled out of view"""
+        return list(self.selected)
+
+    def clear_selection(self):
+        self.selected.clear()
+        self._synced_selection = ()
+        self.tree.selection_set(())
+
+    def yview(self, *args):
+        """Scrollbar command: maps scrollbar positions onto row indexes"""
+        total = len(self.rows)
+        if not args or total == 0:
+            return
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            self.first += step * self.visible if args[2] == 'pages' else step
+        self.render()
+
+    def _update_scrollbar(self):
+        total = len(self.rows)
+        if total <= self.visible:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.visible) / total))
+
+    def _scroll_by(self, rows):
+        self.first += rows
+        self.render()
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_by(-3 * step if step else 0)
+
+    def _on_configure(self, event):
+        row_height = self._row_height()
+        visible = max(1, (event.height - row_height) // row_height)  # Leave room for the heading
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def _row_height(self):
+        for slot in self.slot_rows:
+            bbox = self.tree.bbox(slot)
+            if bbox:
+                return max(1, bbox[3])
+        return int(float(ttk.Style().lookup('Treeview', 'rowheight') or 20))
+
+    def _on_tree_select(self, event):
+        current = self.tree.selection()
+        if current == self._synced_selection:
+            return  # Our own selection_set from render()
+
+        # Rows outside the pool keep their state, rows inside follow the tree
+        if str(self.tree.cget('selectmode')) == 'browse':
+            self.selected.clear()
+        else:
+            for slot, index in self.slot_rows.items():
+                self.selected.discard(self.row_key(self.rows[index]))
+        for slot in current:
+            if slot in self.slot_rows:
+                self.anchor = self.slot_rows[slot]
+                self.selected.add(self.row_key(self.rows[self.anchor]))
+        self._synced_selection = current
+
+        if self.on_select is not None:
+            self.on_select(event)
+
+    def _move_selection(self, delta):
+        if not self.rows:
+            return 'break'
+        index = self.first if self.anchor is None else self.anchor + delta
+        index = max(0, min(len(self.rows) - 1, index))
+        self.anchor = index
+        self.selected = {self.row_key(self.rows[index])}
+
+        # Scroll just far enough to bring the row into view
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + self.visible:
+            self.first = index - self.visible + 1
+        self.render()
+        self.tree.focus(self.key_slots[self.row_key(self.rows[index])])
+        if self.on_select is not None:
+            self.on_select(None)
+        return 'break'